@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+    
+    def ready(self):
+        post_migrate.connect(install_search_index, sender=self)
+
+def install_search_index(sender, using, **kwargs):
+    from .search import ensure_search_index
+    ensure_search_index(using)
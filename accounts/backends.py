@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from energy.cache import dashboard_version
+
+class CachedModelBackend(ModelBackend):
+    # request.user is loaded from the session on every request. The row is
+    # cached under the user's dashboard version, which every balance change
+    # and account save bumps once committed (see energy.apps), so a stale
+    # copy is never read.
+    def get_user(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_TIMEOUT
+        if not timeout:
+            return super().get_user(user_id)
+        key = f'auth:user:{user_id}:{dashboard_version(user_id)}'
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, timeout)
+        return user
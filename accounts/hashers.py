@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    # Django's defaults (100 MiB, 8 lanes) are sized for a dedicated login
+    # box; these come from settings. Hashes keep the 'argon2' algorithm, so
+    # changing the parameters rehashes each password at its next login.
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
@@ -0,0 +1,73 @@
+import csv
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts.provisioning import IMPORT_BATCH_SIZE, Checkpoint, ProvisioningError, UserImporter, import_users, parse_csv
+
+class Command(BaseCommand):
+    help = 'Bulk-create EnergyUsers from a CSV of energy_number, name[, password, generated, consumed]'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing passwords')
+        parser.add_argument('--invites', help='Append energy_number,uid,token for users without a password to this CSV')
+        parser.add_argument('--checkpoint', help='Progress file for resuming; defaults to <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options['checkpoint'] or f"{options['path']}.checkpoint")
+        state = {'rows': 0} if options['restart'] else checkpoint.load()
+        start = state['rows']
+        if start:
+            self.stdout.write(f'Resuming after row {start}')
+
+        invites_file = None
+        invites = None
+        if options['invites']:
+            new = not os.path.exists(options['invites'])
+            invites_file = open(options['invites'], 'a', newline='', encoding='utf-8')
+            invites = csv.writer(invites_file)
+            if new:
+                invites.writerow(['energy_number', 'uid', 'token'])
+
+        started = time.monotonic()
+
+        def before_commit(energy_numbers):
+            # If the process dies after the commit but before the next
+            # checkpoint, the rerun finds these users and reissues invites.
+            checkpoint.save(saved['rows'], saved['totals'], energy_numbers)
+
+        def report(done, totals):
+            # Invites reach the file before the checkpoint moves past them.
+            if invites_file is not None:
+                invites_file.flush()
+            checkpoint.save(done, totals)
+            saved.update(rows=done, totals=dict(totals))
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{done} rows, {totals['created']} created ({(done - start) / elapsed:.0f} rows/s)")
+
+        importer = UserImporter(hash_workers=options['hash_workers'], invites=invites, before_commit=before_commit)
+        importer.totals.update(state.get('totals', {}))
+        saved = {'rows': start, 'totals': dict(importer.totals)}
+        try:
+            if state.get('pending'):
+                importer.recover(state['pending'])
+            with open(options['path'], newline='', encoding='utf-8') as stream:
+                totals = import_users(
+                    parse_csv(stream), importer, batch_size=options['batch_size'], start=start, on_batch=report,
+                )
+        except (ProvisioningError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            importer.close()
+            if invites_file is not None:
+                invites_file.close()
+
+        checkpoint.clear()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {totals['created']} users in {elapsed:.2f}s "
+            f"({totals['duplicates']} duplicates, {totals['invalid']} invalid, {totals['invited']} invited)"
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:06
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+
+def populate_balance(apps, schema_editor):
+    EnergyUser = apps.get_model('accounts', 'EnergyUser')
+    EnergyUser.objects.update(
+        surplus=Greatest(F('generated') - F('consumed'), Value(0.0), output_field=models.FloatField()),
+        deficit=Greatest(F('consumed') - F('generated'), Value(0.0), output_field=models.FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='energyuser',
+            name='deficit',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='energyuser',
+            name='surplus',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_balance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:45
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_energyuser_name_prefix'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='energyuser',
+            index=models.Index(django.db.models.functions.text.Upper('energy_number'), name='energyuser_number_prefix'),
+        ),
+    ]
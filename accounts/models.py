@@ -1,8 +1,62 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Upper
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
-from smart_energy_manager_lib import EnergyAccount
+from energy_platform.profiling import span
 
-class EnergyUserManager(BaseUserManager):
+def surplus_expression(generated, consumed):
+    return Greatest(generated - consumed, Value(0.0), output_field=models.FloatField())
+
+class EnergyUserQuerySet(models.QuerySet):
+    def apply_energy_delta(self, generated=0, consumed=0, credits=0):
+        # Both sides of the SET clause see the pre-update row, so surplus and
+        # deficit are derived from the new totals in the same statement.
+        new_generated = F('generated') + generated
+        new_consumed = F('consumed') + consumed
+        return self.update(
+            generated=new_generated,
+            consumed=new_consumed,
+            credits=F('credits') + credits,
+            surplus=surplus_expression(new_generated, new_consumed),
+            deficit=surplus_expression(new_consumed, new_generated),
+        )
+    
+    def with_surplus_over(self, kwh):
+        return self.filter(surplus__gt=kwh).order_by('-surplus')
+    
+    def apply_energy_deltas(self, deltas):
+        # deltas maps user id -> (generated, consumed, credits). Each chunk is
+        # one UPDATE ... FROM over a VALUES list, which SQLite 3.33+ and
+        # PostgreSQL both support.
+        self._for_write = True
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        chunk_size = (connection.features.max_query_params or 32000) // 4
+        items = list(deltas.items())
+        new_generated = f'{table}.generated + d.generated'
+        new_consumed = f'{table}.consumed + d.consumed'
+        updated = 0
+        with connection.cursor() as cursor:
+            for offset in range(0, len(items), chunk_size):
+                chunk = items[offset:offset + chunk_size]
+                rows = ', '.join(['(%s, %s, %s, %s)'] * len(chunk))
+                params = [value for user_id, delta in chunk for value in (user_id, *map(float, delta))]
+                cursor.execute(f"""
+                    WITH d(id, generated, consumed, credits) AS (VALUES {rows})
+                    UPDATE {table} SET
+                        generated = {new_generated},
+                        consumed = {new_consumed},
+                        credits = {table}.credits + d.credits,
+                        surplus = CASE WHEN {new_generated} > {new_consumed}
+                            THEN {new_generated} - ({new_consumed}) ELSE 0 END,
+                        deficit = CASE WHEN {new_consumed} > {new_generated}
+                            THEN {new_consumed} - ({new_generated}) ELSE 0 END
+                    FROM d WHERE {table}.id = d.id
+                """, params)
+                updated += cursor.rowcount
+        return updated
+
+class EnergyUserManager(BaseUserManager.from_queryset(EnergyUserQuerySet)):
     def create_user(self, energy_number, name, password=None):
         if not energy_number:
             raise ValueError('Energy number required')
@@ -23,6 +77,8 @@ class EnergyUser(AbstractBaseUser):
     generated = models.FloatField(default=0)
     consumed = models.FloatField(default=0)
     credits = models.FloatField(default=0)
+    surplus = models.FloatField(default=0, db_index=True, editable=False)
+    deficit = models.FloatField(default=0, db_index=True, editable=False)
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -32,16 +88,42 @@ class EnergyUser(AbstractBaseUser):
     USERNAME_FIELD = 'energy_number'
     REQUIRED_FIELDS = ['name']
     
+    class Meta:
+        indexes = [
+            models.Index(Upper('name'), name='energyuser_name_prefix'),
+            models.Index(Upper('energy_number'), name='energyuser_number_prefix'),
+        ]
+    
     def __str__(self):
         return f"{self.energy_number} - {self.name}"
     
+    def refresh_energy_balance(self):
+        if hasattr(self.generated, 'resolve_expression') or hasattr(self.consumed, 'resolve_expression'):
+            self.surplus = surplus_expression(self.generated, self.consumed)
+            self.deficit = surplus_expression(self.consumed, self.generated)
+            return
+        from smart_energy_manager_lib import EnergyAccount
+        with span('EnergyAccount'):
+            account = EnergyAccount(self.energy_number, self.name, self.generated, self.consumed)
+            self.surplus = account.calculate_surplus()
+            self.deficit = account.calculate_deficit()
+    
+    def save(self, *args, **kwargs):
+        # Saves that leave generated/consumed alone (last_login at login,
+        # password changes) skip the recompute.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.refresh_energy_balance()
+        elif {'generated', 'consumed'} & set(update_fields):
+            self.refresh_energy_balance()
+            kwargs['update_fields'] = {*update_fields, 'surplus', 'deficit'}
+        super().save(*args, **kwargs)
+    
     def calculate_surplus(self):
-        account = EnergyAccount(self.energy_number, self.name, self.generated, self.consumed)
-        return account.calculate_surplus()
+        return self.surplus
     
     def calculate_deficit(self):
-        account = EnergyAccount(self.energy_number, self.name, self.generated, self.consumed)
-        return account.calculate_deficit()
+        return self.deficit
     
     def has_perm(self, perm, obj=None):
         return True
@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+import secrets
+from itertools import islice
+from multiprocessing import get_context
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from .models import EnergyUser
+
+IMPORT_BATCH_SIZE = 2000
+REQUIRED_FIELDS = ('energy_number', 'name')
+
+class ProvisioningError(ValueError):
+    pass
+
+def parse_csv(lines):
+    # Columns: energy_number, name, and optionally password, generated,
+    # consumed. Rows without a password get an invite token instead.
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        return
+    missing = set(REQUIRED_FIELDS) - set(reader.fieldnames)
+    if missing:
+        raise ProvisioningError(f"CSV header is missing: {', '.join(sorted(missing))}")
+    yield from reader
+
+def invite_token(user):
+    # Django's password-reset token: valid until the user sets a password or
+    # PASSWORD_RESET_TIMEOUT passes, so nothing needs storing.
+    return urlsafe_base64_encode(force_bytes(user.pk)), default_token_generator.make_token(user)
+
+class Checkpoint:
+    # Rows of the input already committed, rewritten atomically after every
+    # batch so a rerun skips straight past them. 'pending' lists the energy
+    # numbers of a batch about to commit, for UserImporter.recover().
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0}
+
+    def save(self, rows, totals, pending=()):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'rows': rows, 'totals': totals, 'pending': list(pending)}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class UserImporter:
+    # before_commit(energy_numbers) runs ahead of each batch's commit.
+    def __init__(self, hash_workers=1, invites=None, before_commit=None):
+        self.invites = invites
+        self.before_commit = before_commit
+        self.recovered = set()
+        self.totals = {'created': 0, 'duplicates': 0, 'invalid': 0, 'invited': 0}
+        # PBKDF2/Argon2 dominate the import, so hashing fans out to processes.
+        # The workers only hash: they never touch the inherited database
+        # connection and exit without running its finalizers.
+        self.pool = get_context('fork').Pool(hash_workers) if hash_workers > 1 else None
+        self.hash_workers = hash_workers
+        self.existing = set(EnergyUser.objects.values_list('energy_number', flat=True))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def _hash(self, passwords):
+        if self.pool is None or len(passwords) < 2:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.hash_workers * 4))
+        return self.pool.map(make_password, passwords, chunksize)
+
+    def _build(self, row):
+        energy_number = (row.get('energy_number') or '').strip()
+        name = (row.get('name') or '').strip()
+        if not energy_number or len(energy_number) > 20 or not name or len(name) > 100:
+            self.totals['invalid'] += 1
+            return None
+        if energy_number in self.existing:
+            if energy_number in self.recovered:
+                self.recovered.discard(energy_number)
+            else:
+                self.totals['duplicates'] += 1
+            return None
+        try:
+            user = EnergyUser(
+                energy_number=energy_number,
+                name=name,
+                generated=float(row.get('generated') or 0),
+                consumed=float(row.get('consumed') or 0),
+            )
+        except ValueError:
+            self.totals['invalid'] += 1
+            return None
+        user.refresh_energy_balance()
+        self.existing.add(energy_number)
+        return user
+
+    def import_batch(self, rows):
+        users, passwords = [], []
+        for row in rows:
+            user = self._build(row)
+            if user is not None:
+                users.append(user)
+                passwords.append(row.get('password') or '')
+
+        hashed = iter(self._hash([password for password in passwords if password]))
+        invited = []
+        for user, password in zip(users, passwords):
+            if password:
+                user.password = next(hashed)
+            else:
+                # set_unusable_password() draws 40 characters one by one from
+                # SystemRandom, a quarter of the import time on its own.
+                user.password = UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(20)
+                invited.append(user)
+
+        if self.before_commit is not None:
+            self.before_commit([user.energy_number for user in users])
+        with transaction.atomic():
+            EnergyUser.objects.bulk_create(users)
+        self.totals['created'] += len(users)
+        self._invite(invited)
+        return len(users)
+
+    def recover(self, energy_numbers):
+        # Users a killed run committed after its last checkpoint: count them
+        # and reissue their invites, and let the rerun of their rows skip them
+        # without calling them duplicates.
+        users = list(EnergyUser.objects.filter(energy_number__in=energy_numbers))
+        self.recovered.update(user.energy_number for user in users)
+        self.totals['created'] += len(users)
+        self._invite([user for user in users if not user.has_usable_password()])
+
+    def _invite(self, invited):
+        if not invited or self.invites is None:
+            return
+        if any(user.pk is None for user in invited):
+            # Backends without INSERT ... RETURNING leave pk unset.
+            ids = dict(EnergyUser.objects.filter(
+                energy_number__in=[user.energy_number for user in invited]
+            ).values_list('energy_number', 'id'))
+            for user in invited:
+                user.pk = ids[user.energy_number]
+        self.invites.writerows((user.energy_number, *invite_token(user)) for user in invited)
+        self.totals['invited'] += len(invited)
+
+def import_users(rows, importer, batch_size=IMPORT_BATCH_SIZE, start=0, on_batch=None):
+    # on_batch(rows_done, totals) runs after each committed batch.
+    rows = islice(rows, start, None)
+    done = start
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        importer.import_batch(batch)
+        done += len(batch)
+        if on_batch is not None:
+            on_batch(done, importer.totals)
+    return importer.totals
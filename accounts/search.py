@@ -0,0 +1,108 @@
+import re
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.db.models.functions import Upper
+from .models import EnergyUser
+
+SEARCH_LIMIT = 10
+SEARCH_CACHE_TTL = 30
+FTS_TABLE = 'accounts_energyuser_fts'
+PREFIX_END = '\uffff'
+
+FTS_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        energy_number, name, content='accounts_energyuser', content_rowid='id', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON accounts_energyuser BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, energy_number, name) VALUES (new.id, new.energy_number, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON accounts_energyuser BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, energy_number, name) VALUES ('delete', old.id, old.energy_number, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF energy_number, name ON accounts_energyuser BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, energy_number, name) VALUES ('delete', old.id, old.energy_number, old.name);
+        INSERT INTO {FTS_TABLE}(rowid, energy_number, name) VALUES (new.id, new.energy_number, new.name);
+    END""",
+]
+
+_fts_enabled = {}
+
+def ensure_search_index(using='default'):
+    # SQLite drops triggers whenever a migration rebuilds the table, so this
+    # runs after every migrate and rebuilds the index if anything was missing.
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        _fts_enabled[using] = False
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f'{FTS_TABLE}_a_'],
+        )
+        complete = cursor.fetchone()[0] == 3
+        try:
+            for statement in FTS_SETUP:
+                cursor.execute(statement)
+            if not complete:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        except DatabaseError:
+            _fts_enabled[using] = False
+            return False
+    _fts_enabled[using] = True
+    return True
+
+def fts_enabled(using='default'):
+    if using not in _fts_enabled:
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            _fts_enabled[using] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fts_enabled[using] = cursor.fetchone() is not None
+    return _fts_enabled[using]
+
+def _search_fts(query, limit):
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+    match = ' '.join(f'"{term}"*' for term in terms)
+    # No ORDER BY rank: ranking would score every match before LIMIT applies.
+    with connections['default'].cursor() as cursor:
+        cursor.execute(
+            f"""SELECT u.id, u.name, u.energy_number FROM {FTS_TABLE} f
+                JOIN accounts_energyuser u ON u.id = f.rowid
+                WHERE {FTS_TABLE} MATCH %s AND u.is_active
+                LIMIT %s""",
+            [match, limit],
+        )
+        return [{'id': row[0], 'name': row[1], 'energy_number': row[2]} for row in cursor.fetchall()]
+
+def _search_prefix(query, limit):
+    prefix = query.upper()
+    fields = ('id', 'name', 'energy_number')
+    users = EnergyUser.objects.filter(is_active=True)
+    # Energy numbers are free-form, so both sides are uppercased like names.
+    by_number = users.annotate(number_upper=Upper('energy_number')).filter(
+        number_upper__gte=prefix, number_upper__lt=prefix + PREFIX_END
+    )
+    by_name = users.annotate(name_upper=Upper('name')).filter(
+        name_upper__gte=prefix, name_upper__lt=prefix + PREFIX_END
+    )
+    results = {}
+    for user in list(by_number.order_by('number_upper').values(*fields)[:limit]) + \
+            list(by_name.order_by('name_upper').values(*fields)[:limit]):
+        results.setdefault(user['id'], user)
+    return list(results.values())[:limit]
+
+def search_users(query, exclude_id=None, limit=SEARCH_LIMIT):
+    query = query.strip()[:50]
+    if not query:
+        return []
+    key = f'user-search:{query.lower()}:{limit}'
+    results = cache.get(key)
+    if results is None:
+        search = _search_fts if fts_enabled() else _search_prefix
+        results = search(query, limit + 1)
+        cache.set(key, results, SEARCH_CACHE_TTL)
+    return [user for user in results if user['id'] != exclude_id][:limit]
@@ -1,3 +1,212 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import authenticate
+from django.contrib.auth.tokens import default_token_generator
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from energy.cache import dashboard_version
+from .backends import CachedModelBackend
+from .models import EnergyUser
+from .provisioning import UserImporter
 
-# Create your tests here.
+
+class EnergyBalanceTests(TestCase):
+    def setUp(self):
+        self.user = EnergyUser.objects.create_user('EN1', 'Alice', 'pass')
+
+    def test_save_keeps_surplus_and_deficit_in_sync(self):
+        self.user.generated = 10
+        self.user.consumed = 4
+        self.user.save(update_fields=['generated', 'consumed'])
+
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.surplus, self.user.deficit), (6, 0))
+
+    def test_f_expression_save_and_delta_update(self):
+        self.user.consumed = F('consumed') + 3
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.surplus, self.user.deficit), (0, 3))
+
+        EnergyUser.objects.filter(pk=self.user.pk).apply_energy_delta(generated=5, credits=1)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.surplus, self.user.deficit, self.user.credits), (2, 0, 1))
+        self.assertEqual(list(EnergyUser.objects.with_surplus_over(1)), [self.user])
+
+    def test_saves_of_other_fields_skip_the_recompute(self):
+        with mock.patch.object(EnergyUser, 'refresh_energy_balance') as refresh:
+            self.assertIsNotNone(authenticate(username='EN1', password='pass'))
+            self.client.login(username='EN1', password='pass')
+            self.user.save(update_fields=['name'])
+            refresh.assert_not_called()
+            self.user.save(update_fields=['consumed'])
+            refresh.assert_called_once()
+
+
+@override_settings(
+    AUTH_USER_CACHE_TIMEOUT=300, DASHBOARD_CACHE_ENABLED=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class LoginPerformanceTests(TestCase):
+    def setUp(self):
+        self.user = EnergyUser.objects.create_user('EN1', 'Alice', 'pass')
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/energy/')
+        return response, [query['sql'] for query in queries]
+
+    def test_cached_user_skips_session_and_user_reads(self):
+        self.client.force_login(self.user)
+        self.dashboard_queries()
+        response, queries = self.dashboard_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([sql for sql in queries if 'accounts_energyuser' in sql or 'django_session' in sql])
+
+        self.user.generated = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response, _ = self.dashboard_queries()
+        self.assertEqual(response.context['user'].surplus, 7)
+
+    def test_password_change_ends_cached_sessions(self):
+        self.client.force_login(self.user)
+        self.dashboard_queries()
+        self.user.set_password('new-pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['password'])
+        response, _ = self.dashboard_queries()
+        self.assertEqual(response.status_code, 302)
+
+    def test_deactivation_evicts_the_cached_user_only_after_commit(self):
+        backend = CachedModelBackend()
+        self.assertEqual(backend.get_user(self.user.pk), self.user)
+        version = dashboard_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.user.is_active = False
+                self.user.save()
+                # A request reading the uncommitted row would cache it under this version.
+                self.assertEqual(dashboard_version(self.user.pk), version)
+        self.assertNotEqual(dashboard_version(self.user.pk), version)
+        self.assertIsNone(backend.get_user(self.user.pk))
+
+    def test_fast_profile_requires_a_shared_cache(self):
+        script = 'import django; django.setup(); from django.conf import settings; print(settings.AUTH_USER_CACHE_TIMEOUT)'
+        for backend, ok in (('locmem', False), ('db', True)):
+            env = dict(os.environ, PERFORMANCE_PROFILE='fast', CACHE_BACKEND=backend,
+                       DJANGO_SETTINGS_MODULE='energy_platform.settings')
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+            )
+            if ok:
+                self.assertEqual(result.stdout.strip(), '300', result.stderr)
+            else:
+                self.assertIn('ImproperlyConfigured', result.stderr)
+
+    def test_tuned_argon2_upgrades_old_hashes_at_login(self):
+        EnergyUser.objects.filter(pk=self.user.pk).update(password=make_password('pass', hasher='pbkdf2_sha256'))
+        hashers = ['accounts.hashers.TunedArgon2PasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.assertEqual(authenticate(username='EN1', password='pass'), self.user)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+            self.assertIsNotNone(authenticate(username='EN1', password='pass'))
+
+
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        EnergyUser.objects.create_user('EN1', 'Alice', 'pass')
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'users.csv')
+        self.invites = os.path.join(self.directory, 'invites.csv')
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['energy_number', 'name', 'password', 'generated', 'consumed'])
+            writer.writerows([
+                ['EN2', 'Bob', 'bob-pass', '10', '4'],
+                ['EN3', 'Carol', 'carol-pass', '', ''],
+                ['EN1', 'Alice again', '', '', ''],
+                ['EN4', 'Dave', '', '1', '3'],
+                ['', 'Nobody', '', '', ''],
+                ['EN4', 'Dave twice', '', '', ''],
+                ['EN5', 'Erin', '', 'lots', ''],
+            ])
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_users', self.path, '--invites', self.invites, '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_hashes_passwords_and_invites_the_rest(self):
+        output = self.run_import('--hash-workers', '2')
+        self.assertIn('Created 3 users', output)
+        self.assertIn('2 duplicates, 2 invalid, 1 invited', output)
+
+        self.assertIsNotNone(authenticate(username='EN2', password='bob-pass'))
+        self.assertIsNotNone(authenticate(username='EN3', password='carol-pass'))
+        dave = EnergyUser.objects.get(energy_number='EN4')
+        self.assertFalse(dave.has_usable_password())
+        self.assertEqual((dave.surplus, dave.deficit), (0, 2))
+
+        with open(self.invites) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['energy_number', 'uid', 'token'])
+        self.assertEqual(rows[1][0], 'EN4')
+        self.assertTrue(default_token_generator.check_token(dave, rows[1][2]))
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+    def test_resumes_after_the_last_committed_batch(self):
+        with open(f'{self.path}.checkpoint', 'w') as f:
+            json.dump({'rows': 2, 'totals': {'created': 2, 'duplicates': 0, 'invalid': 0, 'invited': 0}}, f)
+        output = self.run_import('--hash-workers', '1')
+        self.assertIn('Resuming after row 2', output)
+        self.assertIn('Created 3 users', output)
+        self.assertFalse(EnergyUser.objects.filter(energy_number__in=['EN2', 'EN3']).exists())
+        self.assertTrue(EnergyUser.objects.filter(energy_number='EN4').exists())
+
+    def test_invites_survive_a_crash_after_the_commit(self):
+        def killed(importer, invited):
+            if invited:
+                raise RuntimeError('killed')
+
+        with mock.patch.object(UserImporter, '_invite', autospec=True, side_effect=killed):
+            with self.assertRaises(RuntimeError):
+                self.run_import('--hash-workers', '1')
+        self.assertTrue(EnergyUser.objects.filter(energy_number='EN4').exists())
+
+        output = self.run_import('--hash-workers', '1')
+        self.assertIn('Resuming after row 2', output)
+        self.assertIn('Created 3 users', output)
+        self.assertIn('2 duplicates, 2 invalid, 1 invited', output)
+        with open(self.invites) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([row[0] for row in rows], ['energy_number', 'EN4'])
+
+    def test_invite_link_sets_the_password_once(self):
+        self.run_import('--hash-workers', '1')
+        with open(self.invites) as f:
+            _, uid, token = list(csv.reader(f))[1]
+        link = f'/accounts/invite/{uid}/{token}/'
+
+        response = self.client.get(link)
+        self.assertRedirects(response, f'/accounts/invite/{uid}/set-password/', fetch_redirect_response=False)
+        response = self.client.post(response['Location'], {
+            'new_password1': 'dave-new-pass', 'new_password2': 'dave-new-pass',
+        })
+        self.assertRedirects(response, '/accounts/login/', fetch_redirect_response=False)
+        self.assertIsNotNone(authenticate(username='EN4', password='dave-new-pass'))
+
+        response = self.client.get(link, follow=True)
+        self.assertFalse(response.context['validlink'])
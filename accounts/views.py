@@ -2,6 +2,8 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.views import PasswordResetConfirmView
+from django.urls import reverse_lazy
 from django import forms
 from .models import EnergyUser
 
@@ -70,3 +72,13 @@ def logout_view(request):
     logout(request)
     messages.success(request, 'Logged out successfully')
     return redirect('accounts:login')
+
+class InviteView(PasswordResetConfirmView):
+    # Redeems an import_users invite: uid and token are Django's password-reset
+    # pair, so setting a password here also invalidates the link.
+    template_name = 'accounts/invite.html'
+    success_url = reverse_lazy('accounts:login')
+    
+    def form_valid(self, form):
+        messages.success(self.request, 'Password set, you can log in now')
+        return super().form_valid(form)
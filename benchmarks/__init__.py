@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None):
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    if db_path is not None:
+        os.environ['SQLITE_PATH'] = str(db_path)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'energy_platform.settings')
+    import django
+    django.setup()
+
+
+def temp_database():
+    # Benchmarks run against a throwaway SQLite file, never db.sqlite3.
+    fd, path = tempfile.mkstemp(prefix='energy-bench-', suffix='.sqlite3')
+    os.close(fd)
+    return path
+
+
+def migrate():
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
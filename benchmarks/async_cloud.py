@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks import setup_django, temp_database
+
+CLOUDWATCH_RESPONSE = (
+    b'<PutMetricDataResponse xmlns="http://monitoring.amazonaws.com/doc/2010-08-01/">'
+    b'<ResponseMetadata><RequestId>stub</RequestId></ResponseMetadata></PutMetricDataResponse>'
+)
+
+
+class StubAWS(BaseHTTPRequestHandler):
+    # Answers just enough of the S3, Lambda, DynamoDB and CloudWatch wire
+    # protocols for botocore to parse, after a fixed network-like delay.
+    # HTTP/1.1 gives keep-alive and answers S3's Expect: 100-continue.
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+    latencies = {}
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+    requests = Counter()
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, service, status, body=b'', content_type='application/xml', headers=None):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.peak = max(cls.peak, cls.in_flight)
+            cls.requests[service] += 1
+        try:
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(cls.latencies.get(service, cls.latency))
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def do_PUT(self):
+        self._respond('s3', 200, headers={'ETag': '"stub"'})
+
+    def do_POST(self):
+        target = self.headers.get('X-Amz-Target', '')
+        if self.path.startswith('/2015-03-31/functions/'):
+            self._respond('lambda', 202, content_type='application/json')
+        elif target.startswith('DynamoDB'):
+            self._respond('dynamodb', 200, b'{"UnprocessedItems": {}}', 'application/x-amz-json-1.0')
+        else:
+            self._respond('cloudwatch', 200, CLOUDWATCH_RESPONSE, 'text/xml')
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.peak = 0
+            cls.requests = Counter()
+
+
+def start_stub(latency):
+    StubAWS.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubAWS)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure(endpoint, lambda_batch):
+    os.environ.update({
+        'USE_REAL_AWS': 'True',
+        'AWS_ENDPOINT_URL': endpoint,
+        'AWS_ACCESS_KEY_ID': 'stub',
+        'AWS_SECRET_ACCESS_KEY': 'stub',
+        'AWS_REGION': 'us-east-1',
+        'AWS_S3_BUCKET_NAME': 'bench-reports',
+        'CLOUDWATCH_FLUSH_INTERVAL': '0',
+        'LAMBDA_BATCH_SIZE': str(lambda_batch),
+    })
+
+
+def make_users(count):
+    from accounts.models import EnergyUser
+    return [
+        EnergyUser(id=i, energy_number=f'CLOUD{i:05d}', name=f'User {i}', generated=10 + i % 7, consumed=i % 5)
+        for i in range(count)
+    ]
+
+
+def run_serial(manager, users):
+    failures = 0
+    for user in users:
+        result = manager.process_transaction_with_cloud(user, 'buyback', 1.5)
+        failures += sum(not status['ok'] for status in result['services_used'].values())
+    return failures
+
+
+async def run_concurrent(manager, users, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(user):
+        async with limit:
+            result = await manager.aprocess_transaction_with_cloud(user, 'buyback', 1.5)
+            return sum(not status['ok'] for status in result['services_used'].values())
+
+    return sum(await asyncio.gather(*(one(user) for user in users)))
+
+
+def measure(name, manager, count, call):
+    StubAWS.reset()
+    started = time.perf_counter()
+    failures = call()
+    manager.flush_buffers()
+    elapsed = time.perf_counter() - started
+    return name, {
+        'seconds': round(elapsed, 3),
+        'transactions_per_second': round(count / elapsed, 1),
+        'failed_calls': failures,
+        'peak_in_flight_requests': StubAWS.peak,
+        'requests': dict(StubAWS.requests),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cloud fan-out per worker against a local stub AWS endpoint')
+    parser.add_argument('--transactions', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--lambda-batch', type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_stub(args.latency_ms / 1000)
+    configure(f'http://127.0.0.1:{server.server_port}', args.lambda_batch)
+    db_path = temp_database()
+    setup_django(db_path)
+    from energy.cloud_services import CloudServiceManager
+
+    manager = CloudServiceManager()
+    users = make_users(args.transactions)
+    # Warm the clients, connection pools and report template off the clock.
+    run_serial(manager, users[:2])
+    manager.flush_buffers()
+
+    results = dict([
+        measure('serial', manager, len(users), lambda: run_serial(manager, users)),
+        measure('async', manager, len(users), lambda: asyncio.run(run_concurrent(manager, users, args.concurrency))),
+    ])
+    results['speedup'] = round(
+        results['async']['transactions_per_second'] / results['serial']['transactions_per_second'], 2
+    )
+    results['config'] = vars(args)
+    server.shutdown()
+    os.remove(db_path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
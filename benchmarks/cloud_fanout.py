@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from benchmarks import setup_django, temp_database
+from benchmarks.async_cloud import StubAWS, configure, make_users, start_stub
+
+SERVICES = ('cloudwatch', 'lambda', 'dynamodb', 's3')
+
+
+def summarize(latencies, errors):
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1),
+        'max_ms': round(latencies[-1], 1),
+        'errors': dict(errors),
+    }
+
+
+def run_serial(manager, users):
+    # The pre-fan-out path: one service after another.
+    handlers = manager._handlers()
+    latencies, errors = [], Counter()
+    for user in users:
+        started = time.perf_counter()
+        for name in SERVICES:
+            try:
+                handlers[name](user, 'buyback', 1.5)
+            except Exception:
+                errors[name] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies, errors)
+
+
+def run_fanout(manager, users):
+    latencies, errors = [], Counter()
+    for user in users:
+        started = time.perf_counter()
+        result = manager.process_transaction_with_cloud(user, 'buyback', 1.5)
+        latencies.append((time.perf_counter() - started) * 1000)
+        for name, status in result['services_used'].items():
+            if not status['ok']:
+                errors[f"{name}: {status['error']}"] += 1
+    return summarize(latencies, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-trade cloud latency: serial calls vs parallel fan-out')
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--s3-ms', type=float, default=40)
+    parser.add_argument('--lambda-ms', type=float, default=30)
+    parser.add_argument('--dynamodb-ms', type=float, default=20)
+    parser.add_argument('--stall-ms', type=float, default=2000, help='DynamoDB latency while it is stalled')
+    parser.add_argument('--deadline-ms', type=float, default=200, help='Per-service deadline')
+    args = parser.parse_args()
+
+    server = start_stub(0)
+    configure(f'http://127.0.0.1:{server.server_port}', lambda_batch=1)
+    # Flush every Lambda record and DynamoDB item inline so each trade makes
+    # three network calls; CloudWatch stays buffered.
+    os.environ['DYNAMODB_BACKUP_WINDOW'] = '0'
+    os.environ['CLOUD_SERVICE_TIMEOUT'] = str(args.deadline_ms / 1000)
+    db_path = temp_database()
+    setup_django(db_path)
+    from energy.cloud_services import CloudServiceManager
+
+    latencies = {'s3': args.s3_ms / 1000, 'lambda': args.lambda_ms / 1000, 'dynamodb': args.dynamodb_ms / 1000}
+    StubAWS.latencies = latencies
+    manager = CloudServiceManager()
+    users = make_users(args.transactions)
+    run_fanout(manager, users[:2])
+
+    results = {
+        'serial': run_serial(manager, users),
+        'fanout': run_fanout(manager, users),
+    }
+    StubAWS.latencies = dict(latencies, dynamodb=args.stall_ms / 1000)
+    results['fanout_dynamodb_stalled'] = run_fanout(manager, users)
+    results['breaker_states'] = {name: breaker.state for name, breaker in manager.breakers.items()}
+    results['config'] = vars(args)
+    server.shutdown()
+    os.remove(db_path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
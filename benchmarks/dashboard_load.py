@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from accounts.models import EnergyUser
+from energy.cache import dashboard_cache_stats
+from energy.models import Transaction
+
+
+def seed(users, transactions_per_user):
+    accounts = []
+    for i in range(users):
+        user = EnergyUser(energy_number=f'DASH{i:05d}', name=f'User {i}', generated=50, consumed=20)
+        user.refresh_energy_balance()
+        accounts.append(user)
+    EnergyUser.objects.bulk_create(accounts)
+    ids = list(EnergyUser.objects.values_list('id', flat=True))
+
+    rng = random.Random(3)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = [
+        (sender, rng.choice(ids), rng.uniform(0.1, 5), 'loan', now)
+        for sender in ids for _ in range(transactions_per_user)
+    ]
+    table = Transaction._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (from_user_id, to_user_id, amount, transaction_type, timestamp) '
+            f'VALUES (%s, %s, %s, %s, %s)', rows,
+        )
+    return ids
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(ids, threads, requests_per_thread, cached):
+    settings.DASHBOARD_CACHE_ENABLED = cached
+    cache.clear()
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def client_loop(seed_value):
+        rng = random.Random(seed_value)
+        plan = [rng.choice(ids) for _ in range(requests_per_thread)]
+        clients = {}
+        for user_id in set(plan):
+            clients[user_id] = Client()
+            clients[user_id].force_login(EnergyUser.objects.get(id=user_id))
+        barrier.wait()
+        local = []
+        for user_id in plan:
+            client = clients[user_id]
+            started = time.perf_counter()
+            response = client.get('/energy/')
+            local.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        connections.close_all()
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client_loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard latency with and without the context cache')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--transactions-per-user', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per thread')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    migrate()
+    ids = seed(args.users, args.transactions_per_user)
+
+    results = {'uncached': run(ids, args.threads, args.requests, cached=False)}
+    before = dashboard_cache_stats()
+    results['cached'] = run(ids, args.threads, args.requests, cached=True)
+    after = dashboard_cache_stats()
+    results['cached']['cache_hits'] = after['hits'] - before['hits']
+    results['cached']['cache_misses'] = after['misses'] - before['misses']
+    print(json.dumps(results, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import random
+import time
+from datetime import timedelta
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import EnergyUser
+from energy.history import encode_cursor, transaction_history
+from energy.models import Transaction
+
+
+def seed(users, transactions, batch=50000):
+    accounts = [EnergyUser(energy_number=f'HIST{i:06d}', name=f'User {i}') for i in range(users)]
+    EnergyUser.objects.bulk_create(accounts, batch_size=5000)
+    ids = list(EnergyUser.objects.values_list('id', flat=True))
+
+    # Raw executemany so auto_now_add does not flatten every timestamp to "now".
+    rng = random.Random(7)
+    start = timezone.now() - timedelta(days=365)
+    table = Transaction._meta.db_table
+    sql = (f'INSERT INTO {table} (from_user_id, to_user_id, amount, transaction_type, timestamp) '
+           f'VALUES (%s, %s, %s, %s, %s)')
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, transactions, batch):
+            rows = []
+            for i in range(offset, min(offset + batch, transactions)):
+                sender, recipient = rng.sample(ids, 2)
+                kind = rng.choice(['buyback', 'loan', 'donation'])
+                timestamp = start + timedelta(seconds=i * 30)
+                rows.append((sender, None if kind == 'buyback' else recipient, rng.uniform(0.1, 10), kind,
+                             connection.ops.adapt_datetimefield_value(timestamp)))
+            cursor.executemany(sql, rows)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return ids
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keyset vs OFFSET pagination of transaction history')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    migrate()
+    started = time.perf_counter()
+    ids = seed(args.users, args.transactions)
+    seed_seconds = time.perf_counter() - started
+
+    user = EnergyUser.objects.get(id=ids[0])
+    both = Transaction.objects.filter(Q(from_user=user) | Q(to_user=user)).order_by('-timestamp', '-id')
+    total = both.count()
+    results = {'transactions': args.transactions, 'user_rows': total, 'seed_seconds': round(seed_seconds, 1)}
+
+    for fraction in (0, 0.5, 0.99):
+        depth = int(total * fraction) // args.page_size * args.page_size
+        anchor = both[depth - 1] if depth else None
+        cursor = None
+        if anchor is not None:
+            cursor = encode_cursor(anchor)
+        label = f'depth_{int(fraction * 100)}pct'
+        results[f'{label}_offset_ms'] = timed(lambda: list(both[depth:depth + args.page_size]))
+        results[f'{label}_keyset_ms'] = timed(lambda: transaction_history(user, cursor=cursor, limit=args.page_size))
+
+    print(json.dumps(results, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.db import connection
+from accounts.models import EnergyUser
+from energy.ingest import PARSERS, ingest_readings
+
+
+def generate_csv(users, readings):
+    start = datetime(2025, 1, 1)
+    yield 'energy_number,interval_start,generated_kwh,consumed_kwh\n'
+    for i in range(readings):
+        interval = start + timedelta(minutes=15 * (i // users))
+        yield f'METER{i % users:06d},{interval.isoformat()},{i % 7 * 0.25},{i % 5 * 0.2}\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk meter-reading ingestion throughput')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--readings', type=int, default=500000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--no-wal', action='store_true')
+    args = parser.parse_args()
+
+    migrate()
+    if not args.no_wal:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+    accounts = []
+    for i in range(args.users):
+        user = EnergyUser(energy_number=f'METER{i:06d}', name=f'Meter {i}')
+        user.refresh_energy_balance()
+        accounts.append(user)
+    EnergyUser.objects.bulk_create(accounts)
+
+    started = time.perf_counter()
+    totals = ingest_readings(PARSERS['csv'](generate_csv(args.users, args.readings)), batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps(dict(
+        totals,
+        wal=not args.no_wal,
+        seconds=round(elapsed, 2),
+        readings_per_second=round(totals['inserted'] / elapsed),
+    ), indent=2))
+    os.remove(DB_PATH)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from benchmarks import migrate, setup_django, temp_database
+
+PASSWORD = 'load-test-password'
+TRADES = ('buyback', 'loan', 'donation')
+
+
+def seed(users, transactions, initial_generated, batch=50000):
+    from django.contrib.auth.hashers import make_password
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from accounts.models import EnergyUser
+    from energy.models import Transaction
+
+    # One hash shared by every account: hashing per user would dominate seeding.
+    password = make_password(PASSWORD)
+    accounts = []
+    for i in range(users):
+        user = EnergyUser(energy_number=f'LOAD{i:06d}', name=f'User {i}', generated=initial_generated,
+                          password=password)
+        user.refresh_energy_balance()
+        accounts.append(user)
+    EnergyUser.objects.bulk_create(accounts, batch_size=5000)
+    users = list(EnergyUser.objects.order_by('id').values_list('id', 'energy_number'))
+    ids = [user_id for user_id, _ in users]
+
+    rng = random.Random(11)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    table = Transaction._meta.db_table
+    sql = (f'INSERT INTO {table} (from_user_id, to_user_id, amount, transaction_type, timestamp) '
+           f'VALUES (%s, %s, %s, %s, %s)')
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, transactions, batch):
+            rows = []
+            for _ in range(offset, min(offset + batch, transactions)):
+                sender, recipient = rng.sample(ids, 2)
+                kind = rng.choice(TRADES)
+                rows.append((sender, None if kind == 'buyback' else recipient, rng.uniform(0.1, 5), kind, now))
+            cursor.executemany(sql, rows)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return users
+
+
+class ClientSession:
+    # Django's test client: the full middleware stack without a socket.
+    def __init__(self, base_url=None):
+        from django.test import Client
+        self.client = Client()
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            response = self.client.post(path, data)
+        else:
+            response = self.client.get(path)
+        return response.status_code, response.get('Location', '')
+
+
+class HttpSession:
+    # A browser-like session against a real server: cookies, CSRF header, no
+    # redirect following, so every hop is timed on its own.
+    def __init__(self, base_url):
+        self.host, _, port = base_url.split('://', 1)[-1].rstrip('/').partition(':')
+        self.port = int(port or 80)
+        self.cookies = {}
+
+    def request(self, method, path, data=None):
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response.status, response.getheader('Location', '')
+
+
+def start_server():
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def virtual_user(session, account, users, iterations, seed_value, record):
+    # login -> (dashboard -> trade form -> trade) x iterations
+    rng = random.Random(seed_value)
+    user_id, energy_number = account
+
+    def call(name, method, path, data=None, expect=(200,), location=None):
+        started = time.perf_counter()
+        try:
+            status, redirect_to = session.request(method, path, data)
+            ok = status in expect and (location is None or redirect_to.endswith(location))
+        except OSError:
+            ok = False
+        record(name, time.perf_counter() - started, ok)
+        return ok
+
+    call('GET /accounts/login/', 'GET', '/accounts/login/')
+    if not call('POST /accounts/login/', 'POST', '/accounts/login/',
+                {'username': energy_number, 'password': PASSWORD}, expect=(302,), location='/energy/'):
+        return
+    for _ in range(iterations):
+        call('GET /energy/', 'GET', '/energy/')
+        kind = rng.choice(TRADES)
+        path = f'/energy/{kind}/'
+        call(f'GET {path}', 'GET', path)
+        recipient_id, recipient_number = rng.choice([user for user in users if user[0] != user_id])
+        data = {'amount': round(rng.uniform(0.1, 2), 2)}
+        if kind == 'loan':
+            data['recipient'] = recipient_id
+        elif kind == 'donation':
+            data['energy_number'] = recipient_number
+        call(f'POST {path}', 'POST', path, data, expect=(302,), location='/energy/')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(session_class, base_url, users, clients, iterations):
+    from django.db import connections
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def record(name, elapsed, ok):
+        with lock:
+            samples[name].append(elapsed)
+            errors[name] += not ok
+
+    def client_loop(index):
+        session = session_class(base_url)
+        barrier.wait()
+        try:
+            virtual_user(session, users[index % len(users)], users, iterations, index, record)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name, latencies in sorted(samples.items()):
+        endpoints[name] = {
+            'requests': len(latencies),
+            'errors': errors[name],
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    total = sum(len(latencies) for latencies in samples.values())
+    return {
+        'seconds': round(elapsed, 3),
+        'requests': total,
+        'errors': sum(errors.values()),
+        'requests_per_second': round(total / elapsed, 1),
+        'endpoints': endpoints,
+    }
+
+
+def compare(results, baseline_path):
+    # Percent change against an earlier --output file, per endpoint.
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    changes = {}
+    for name, current in results['endpoints'].items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        changes[name] = {
+            key: round((current[key] - before[key]) / before[key] * 100, 1) if before[key] else None
+            for key in ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms')
+        }
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent login/dashboard/trade load test with per-endpoint latency')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--initial-generated', type=float, default=1000000.0)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=25, help='Trade flows per virtual user')
+    parser.add_argument('--transport', choices=['client', 'http'], default='client',
+                        help='Django test client in-process, or a threaded WSGI server on a local port')
+    parser.add_argument('--aws-latency-ms', type=float, default=0,
+                        help='Serve cloud calls from a local stub AWS endpoint with this latency (0 keeps AWS off)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--baseline', help='Report percent changes against an earlier --output file')
+    args = parser.parse_args()
+
+    server = None
+    if args.aws_latency_ms:
+        from benchmarks.async_cloud import configure, start_stub
+        server = start_stub(args.aws_latency_ms / 1000)
+        configure(f'http://127.0.0.1:{server.server_port}', lambda_batch=50)
+    else:
+        os.environ['USE_REAL_AWS'] = 'False'
+    db_path = temp_database()
+    setup_django(db_path)
+    migrate()
+
+    started = time.perf_counter()
+    users = seed(args.users, args.transactions, args.initial_generated)
+    seed_seconds = time.perf_counter() - started
+
+    base_url = None
+    if args.transport == 'http':
+        http_server = start_server()
+        base_url = f'http://127.0.0.1:{http_server.server_port}'
+    session_class = HttpSession if args.transport == 'http' else ClientSession
+    results = run(session_class, base_url, users, args.clients, args.iterations)
+    results['seed'] = {'users': args.users, 'transactions': args.transactions, 'seconds': round(seed_seconds, 2)}
+    results['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    if args.baseline:
+        results['change_pct'] = compare(results, args.baseline)
+
+    if args.transport == 'http':
+        http_server.shutdown()
+    if server is not None:
+        from energy.cloud_services import cloud_manager
+        cloud_manager.flush_buffers()
+        server.shutdown()
+    os.remove(db_path)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    print(report)
+    sys.exit(1 if results['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from accounts.models import EnergyUser
+
+PASSWORD = 'bench-password'
+
+HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'accounts.hashers.TunedArgon2PasswordHasher',
+}
+
+# (session engine, cached request.user)
+REQUEST_PROFILES = {
+    'db_sessions': ('django.contrib.sessions.backends.db', 0),
+    'cached_db_sessions': ('django.contrib.sessions.backends.cached_db', 0),
+    'cached_db_cached_user': ('django.contrib.sessions.backends.cached_db', 300),
+    'signed_cookies_cached_user': ('django.contrib.sessions.backends.signed_cookies', 300),
+}
+
+
+def bench_logins(hasher, logins):
+    # Full login_view round trips: authenticate, session rotation, redirect.
+    with override_settings(PASSWORD_HASHERS=[HASHERS[hasher]]):
+        user = EnergyUser.objects.create_user(f'LOGIN{hasher.upper()}', 'Login', PASSWORD)
+        latencies = []
+        for _ in range(logins):
+            client = Client()
+            started = time.perf_counter()
+            response = client.post('/accounts/login/', {'username': user.energy_number, 'password': PASSWORD})
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 302, response.status_code
+    return {
+        'logins_per_second': round(len(latencies) / sum(latencies), 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'hash_prefix': user.password.rsplit('$', 2)[0],
+    }
+
+
+def bench_requests(user, engine, user_cache, requests):
+    # An authenticated request whose view does no work of its own, so what
+    # is left is session load, request.user and the middleware stack.
+    with override_settings(SESSION_ENGINE=engine, AUTH_USER_CACHE_TIMEOUT=user_cache):
+        cache.clear()
+        client = Client()
+        client.force_login(user)
+        client.get('/energy/api/users/search/')
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = client.get('/energy/api/users/search/')
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.status_code
+    return {
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'queries_per_request': round(len(queries) / requests, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput per hasher and per-request auth overhead')
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    migrate()
+    results = {
+        'logins': {hasher: bench_logins(hasher, args.logins) for hasher in HASHERS},
+    }
+    user = EnergyUser.objects.first()
+    results['authenticated_requests'] = {
+        name: bench_requests(user, engine, user_cache, args.requests)
+        for name, (engine, user_cache) in REQUEST_PROFILES.items()
+    }
+    print(json.dumps(results, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
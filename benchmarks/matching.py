@@ -0,0 +1,80 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.db import connection, transaction
+from django.utils import timezone
+from accounts.models import EnergyUser
+from energy.matching import replay, run_matching_round
+from energy.models import Order
+
+
+def generate_orders(count, users, seed):
+    # Bids and asks straddle the same mid price so roughly half of them cross.
+    rng = random.Random(seed)
+    orders = []
+    for order_id in range(1, count + 1):
+        side = rng.choice(('bid', 'ask'))
+        mid = 0.15 + (0.01 if side == 'bid' else -0.01)
+        orders.append((order_id, rng.randrange(users), side, round(rng.gauss(mid, 0.02), 3), round(rng.uniform(0.5, 10), 2)))
+    return orders
+
+
+def digest(fills):
+    return hashlib.sha256(repr([tuple(fill) for fill in fills]).encode()).hexdigest()[:16]
+
+
+def persist_round(orders, users):
+    EnergyUser.objects.bulk_create([
+        EnergyUser(energy_number=f'MKT{i:06d}', name=f'Trader {i}', generated=1000, credits=1000, surplus=1000)
+        for i in range(users)
+    ], batch_size=5000)
+    ids = list(EnergyUser.objects.order_by('id').values_list('id', flat=True))
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {Order._meta.db_table} (id, user_id, side, price, quantity, remaining, status, created_at) '
+            f"VALUES (%s, %s, %s, %s, %s, %s, 'open', %s)",
+            [(order_id, ids[user], side, price, qty, qty, now) for order_id, user, side, price, qty in orders],
+        )
+    started = time.perf_counter()
+    stats = run_matching_round()
+    return dict(stats, seconds=round(time.perf_counter() - started, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Order-book matching throughput and deterministic replay')
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--persist', action='store_true', help='Also time one full database matching round')
+    args = parser.parse_args()
+
+    orders = generate_orders(args.orders, args.users, args.seed)
+    started = time.perf_counter()
+    fills, _ = replay(orders)
+    elapsed = time.perf_counter() - started
+    results = {
+        'open_orders': args.orders,
+        'fills': len(fills),
+        'match_seconds': round(elapsed, 3),
+        'matches_per_second': round(len(fills) / elapsed),
+        'replay_digest': digest(fills),
+        'replay_deterministic': digest(replay(orders)[0]) == digest(fills),
+    }
+    if args.persist:
+        migrate()
+        results['database_round'] = persist_round(orders, args.users)
+    print(json.dumps(results, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
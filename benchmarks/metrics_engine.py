@@ -0,0 +1,80 @@
+import argparse
+import json
+import random
+import time
+from benchmarks import setup_django
+
+setup_django()
+
+from energy.cloud_services import LambdaBatcher, cloud_manager
+from energy.metrics_engine import compute_metrics, compute_metrics_batch
+
+
+class StubLambdaClient:
+    # Simulates a synchronous RequestResponse round trip of the given latency.
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.calls += 1
+        if InvocationType == 'RequestResponse':
+            time.sleep(self.latency)
+        return {'StatusCode': 202 if InvocationType == 'Event' else 200}
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Lambda and in-process energy metrics')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lambda-calls', type=int, default=50)
+    parser.add_argument('--lambda-latency-ms', type=float, default=40.0)
+    parser.add_argument('--real-lambda', action='store_true', help='Invoke the deployed function (USE_REAL_AWS=true)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    generated = [rng.uniform(0, 50) for _ in range(args.users)]
+    consumed = [rng.uniform(0, 50) for _ in range(args.users)]
+
+    if args.real_lambda:
+        client, function = cloud_manager.lambda_client, cloud_manager.lambda_function
+    else:
+        client, function = StubLambdaClient(args.lambda_latency_ms / 1000), 'EnergyCalculationFunction'
+
+    def sync_lambda():
+        for i in range(args.lambda_calls):
+            client.invoke(
+                FunctionName=function,
+                InvocationType='RequestResponse',
+                Payload=json.dumps({'generated': generated[i], 'consumed': consumed[i]}),
+            )
+
+    def async_lambda_batches():
+        batcher = LambdaBatcher(client, function)
+        for i in range(args.users):
+            batcher.add({'generated': generated[i], 'consumed': consumed[i]})
+        batcher.flush()
+
+    lambda_time = timed(sync_lambda)
+    scalar_time = timed(lambda: [compute_metrics(g, c) for g, c in zip(generated, consumed)])
+    vector_time = timed(lambda: compute_metrics_batch(generated, consumed))
+    batch_time = timed(async_lambda_batches)
+
+    results = {
+        'users': args.users,
+        'lambda_request_response_ms_per_user': lambda_time / args.lambda_calls * 1000,
+        'local_scalar_ms_per_user': scalar_time / args.users * 1000,
+        'local_vectorized_ms_total': vector_time * 1000,
+        'local_vectorized_ms_per_user': vector_time / args.users * 1000,
+        'lambda_event_batches_ms_total': batch_time * 1000,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import sys
+from benchmarks import migrate, setup_django, temp_database
+
+
+def dashboard_generated(client):
+    return client.get('/energy/').context['user'].generated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that reads go to the replica and writes pin a client to the primary')
+    parser.add_argument('--pin-seconds', type=int, default=5, help='REPLICA_PIN_SECONDS for the run')
+    args = parser.parse_args()
+
+    # Two SQLite files stand in for a primary and one streaming replica.
+    primary_path, replica_path = temp_database(), temp_database()
+    os.environ['SQLITE_REPLICA_PATHS'] = replica_path
+    os.environ['REPLICA_PIN_SECONDS'] = str(args.pin_seconds)
+    os.environ['DASHBOARD_CACHE_ENABLED'] = 'False'
+    setup_django(primary_path)
+
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from accounts.models import EnergyUser
+    from energy_platform.db_routing import PIN_COOKIE
+
+    setup_test_environment()
+    migrate()
+    user = EnergyUser.objects.create(energy_number='REPL001', name='Replica User', generated=1)
+    client = Client()
+    client.force_login(user)
+    call_command('sync_sqlite_replica', stdout=open(os.devnull, 'w'))
+
+    # Changed on the primary only; the replica still holds the old row.
+    user.generated = 42
+    user.save(update_fields=['generated'])
+    checks = {'get_reads_replica': dashboard_generated(client) == 1}
+
+    response = client.post('/energy/update/', {'generated': 7, 'consumed': 0})
+    checks['write_sets_pin'] = PIN_COOKIE in response.cookies
+    checks['pin_lasts_pin_seconds'] = response.cookies[PIN_COOKIE]['max-age'] == args.pin_seconds
+    checks['pinned_get_reads_primary'] = dashboard_generated(client) == 7
+
+    client.cookies.pop(PIN_COOKIE)
+    checks['unpinned_get_reads_replica'] = dashboard_generated(client) == 1
+    call_command('sync_sqlite_replica', stdout=open(os.devnull, 'w'))
+    checks['replica_caught_up_after_sync'] = dashboard_generated(client) == 7
+
+    connections.close_all()
+    for path in (primary_path, replica_path):
+        for suffix in ('', '-wal', '-shm', '.writer-lock'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    print(json.dumps(checks, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
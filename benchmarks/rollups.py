@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from accounts.models import EnergyUser
+from energy.models import MeterReading, Transaction
+from energy.rollups import rollup_series, update_rollups
+
+
+def seed(users, days, transactions_per_day):
+    EnergyUser.objects.bulk_create([EnergyUser(energy_number=f'ROLL{i:05d}', name=f'User {i}') for i in range(users)])
+    ids = list(EnergyUser.objects.values_list('id', flat=True))
+    start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    adapt = connection.ops.adapt_datetimefield_value
+    rng = random.Random(11)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for day in range(days):
+            intervals = [adapt(start + timedelta(days=day, hours=h)) for h in range(24)]
+            cursor.executemany(
+                f'INSERT INTO {MeterReading._meta.db_table} (user_id, interval_start, generated_kwh, consumed_kwh) '
+                f'VALUES (%s, %s, %s, %s)',
+                [(user_id, interval, rng.uniform(0, 3), rng.uniform(0, 2)) for user_id in ids for interval in intervals],
+            )
+            cursor.executemany(
+                f'INSERT INTO {Transaction._meta.db_table} (from_user_id, to_user_id, amount, transaction_type, timestamp) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [(rng.choice(ids), rng.choice(ids), rng.uniform(0.1, 5), rng.choice(['buyback', 'loan', 'donation']),
+                  adapt(start + timedelta(days=day, seconds=rng.randrange(86400)))) for _ in range(transactions_per_day)],
+            )
+    return start
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Raw-table aggregation vs rollup reads')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--transactions-per-day', type=int, default=5000)
+    args = parser.parse_args()
+
+    migrate()
+    start = seed(args.users, args.days, args.transactions_per_day)
+    end = start + timedelta(days=args.days)
+
+    started = time.perf_counter()
+    totals = update_rollups()
+    rollup_seconds = time.perf_counter() - started
+
+    def raw_traded_per_day():
+        return list(
+            Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(day=Trunc('timestamp', 'day', tzinfo=dt_timezone.utc))
+            .order_by().values('day', 'transaction_type').annotate(total=Sum('amount'), count=Count('id'))
+        )
+
+    def raw_energy_per_day():
+        return list(
+            MeterReading.objects.filter(interval_start__gte=start, interval_start__lt=end)
+            .annotate(day=Trunc('interval_start', 'day', tzinfo=dt_timezone.utc))
+            .order_by().values('day').annotate(generated=Sum('generated_kwh'), consumed=Sum('consumed_kwh'))
+        )
+
+    print(json.dumps({
+        'readings': totals['readings'],
+        'transactions': totals['transactions'],
+        'rollup_rows': totals['rows'],
+        'initial_rollup_seconds': round(rollup_seconds, 2),
+        'raw_traded_per_day_ms': timed(raw_traded_per_day),
+        'raw_energy_per_day_ms': timed(raw_energy_per_day),
+        'rollup_platform_per_day_ms': timed(lambda: rollup_series('day', start, end)),
+        'rollup_user_per_hour_ms': timed(lambda: rollup_series('hour', start, start + timedelta(days=7),
+                                                              user=EnergyUser.objects.first())),
+    }, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from benchmarks import BASE_DIR
+
+
+def run_stress(tuned, args):
+    # Each run is a fresh process so settings pick up SQLITE_TUNED.
+    env = dict(os.environ, SQLITE_TUNED=str(tuned))
+    env.pop('SQLITE_PATH', None)
+    command = [
+        sys.executable, '-m', 'benchmarks.trade_stress', '--mode', 'both',
+        '--processes', str(args.processes), '--trades', str(args.trades),
+        '--users', str(args.users), '--initial-generated', str(args.initial_generated),
+    ]
+    result = subprocess.run(command, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    if not result.stdout.strip():
+        raise SystemExit(result.stderr)
+    return {
+        report['mode']: {
+            key: report.get(key, 0)
+            for key in ('trades_per_second', 'seconds', 'locked', 'settle_locked', 'errors')
+        }
+        for report in json.loads(result.stdout)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent trades on stock vs tuned SQLite settings')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--trades', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--initial-generated', type=float, default=100000)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'stock': run_stress(False, args),
+        'tuned': run_stress(True, args),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
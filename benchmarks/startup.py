@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from benchmarks import BASE_DIR, setup_django, temp_database
+
+AWS_SERVICES = ('s3', 'dynamodb', 'lambda', 'sns', 'cloudwatch')
+HEAVY_MODULES = ('boto3', 'botocore', 'reportlab', 'numpy', 'smart_energy_manager_lib')
+
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode, db_path):
+    # Runs in a fresh interpreter so every sample pays the full import cost.
+    started = time.perf_counter()
+    setup_django(db_path)
+    import energy.views  # noqa: F401
+    from energy.cloud_services import cloud_manager
+    if mode == 'eager':
+        # What every worker paid at import before clients became lazy.
+        cloud_manager.clients.warm(*AWS_SERVICES)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'seconds': elapsed,
+        'rss_mb': rss_mb(),
+        'clients': cloud_manager.clients.created,
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def import_times(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | module".
+    packages = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(own)
+    return packages
+
+
+def sample(mode, db_path):
+    env = dict(
+        os.environ,
+        USE_REAL_AWS='True',
+        AWS_ACCESS_KEY_ID='stub',
+        AWS_SECRET_ACCESS_KEY='stub',
+        AWS_REGION='us-east-1',
+        CLOUDWATCH_FLUSH_INTERVAL='0',
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'benchmarks.startup', '--child', mode, '--db', db_path],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run['packages'] = import_times(result.stderr)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker cold start: import time of energy.views and RSS')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--child', choices=['lazy', 'eager'])
+    parser.add_argument('--db')
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.db)
+
+    db_path = temp_database()
+    results = {}
+    for mode in ('eager', 'lazy'):
+        runs = [sample(mode, db_path) for _ in range(args.runs)]
+        packages = sum((run['packages'] for run in runs), Counter())
+        results[mode] = {
+            'import_seconds_median': round(statistics.median(run['seconds'] for run in runs), 3),
+            'importtime_total_ms': round(sum(packages.values()) / len(runs) / 1000, 1),
+            'rss_mb_median': round(statistics.median(run['rss_mb'] for run in runs), 1),
+            'clients_after_startup': runs[0]['clients'],
+            'heavy_modules_loaded': runs[0]['heavy_modules'],
+            'slowest_packages_ms': {
+                name: round(total / len(runs) / 1000, 1) for name, total in packages.most_common(args.top)
+            },
+        }
+    os.remove(db_path)
+    results['runs'] = args.runs
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
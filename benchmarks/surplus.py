@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import random
+import time
+from benchmarks import migrate, setup_django, temp_database
+
+DB_PATH = temp_database()
+setup_django(DB_PATH)
+
+from smart_energy_manager_lib import EnergyAccount
+from accounts.models import EnergyUser
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stored surplus/deficit vs EnergyAccount per call')
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--threshold', type=float, default=20.0)
+    args = parser.parse_args()
+
+    migrate()
+    rng = random.Random(42)
+    users = []
+    for i in range(args.users):
+        user = EnergyUser(energy_number=f'BENCH{i:07d}', name=f'User {i}',
+                          generated=rng.uniform(0, 50), consumed=rng.uniform(0, 50))
+        user.refresh_energy_balance()
+        users.append(user)
+    EnergyUser.objects.bulk_create(users, batch_size=2000)
+    loaded = list(EnergyUser.objects.all())
+
+    def before_per_request():
+        # Old model methods: a fresh EnergyAccount for surplus and again for deficit.
+        return [
+            (EnergyAccount(u.energy_number, u.name, u.generated, u.consumed).calculate_surplus(),
+             EnergyAccount(u.energy_number, u.name, u.generated, u.consumed).calculate_deficit())
+            for u in loaded
+        ]
+
+    def after_per_request():
+        return [(u.calculate_surplus(), u.calculate_deficit()) for u in loaded]
+
+    def before_filter():
+        candidates = [
+            u for u in EnergyUser.objects.all()
+            if EnergyAccount(u.energy_number, u.name, u.generated, u.consumed).calculate_surplus() > args.threshold
+        ]
+        return sorted(candidates, key=lambda u: -u.generated + u.consumed)[:10]
+
+    def after_filter():
+        return list(EnergyUser.objects.with_surplus_over(args.threshold)[:10])
+
+    results = {'users': args.users}
+    for name, func in [
+        ('calculate_before', before_per_request),
+        ('calculate_after', after_per_request),
+        ('top10_surplus_python', before_filter),
+        ('top10_surplus_sql', after_filter),
+    ]:
+        elapsed, _ = timed(func)
+        results[f'{name}_ms'] = round(elapsed * 1000, 3)
+    print(json.dumps(results, indent=2))
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
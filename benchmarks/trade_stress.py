@@ -0,0 +1,152 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from benchmarks import migrate, setup_django, temp_database
+
+OWN_DB = 'SQLITE_PATH' not in os.environ
+DB_PATH = temp_database() if OWN_DB else os.environ['SQLITE_PATH']
+setup_django(DB_PATH)
+
+from django.db import OperationalError, connections
+from django.db.models import Sum
+from accounts.models import EnergyUser
+from energy.models import TradeIntent, Transaction
+from energy.services import TradeError, execute_trade
+from energy.settlement import queue_trade, settle_batch
+
+
+def seed(users, initial_generated):
+    EnergyUser.objects.all().delete()
+    accounts = []
+    for i in range(users):
+        user = EnergyUser(energy_number=f'STRESS{i:05d}', name=f'User {i}', generated=initial_generated)
+        user.refresh_energy_balance()
+        accounts.append(user)
+    EnergyUser.objects.bulk_create(accounts)
+
+
+def worker(seed_value, trades, result_queue, mode):
+    connections.close_all()
+    rng = random.Random(seed_value)
+    ids = list(EnergyUser.objects.values_list('id', flat=True))
+    stats = {'ok': 0, 'rejected': 0, 'locked': 0}
+    for _ in range(trades):
+        sender_id, recipient_id = rng.sample(ids, 2)
+        kind = rng.choice(['loan', 'donation', 'buyback'])
+        amount = round(rng.uniform(0.1, 5), 2)
+        recipient = EnergyUser(pk=recipient_id) if kind != 'buyback' else None
+        try:
+            if mode == 'batch':
+                sender = EnergyUser.objects.only('surplus').get(pk=sender_id)
+                queue_trade(sender, kind, amount, to_user=recipient)
+            else:
+                execute_trade(EnergyUser(pk=sender_id), kind, amount, to_user=recipient)
+            stats['ok'] += 1
+        except TradeError:
+            stats['rejected'] += 1
+        except OperationalError:
+            stats['locked'] += 1
+    connections.close_all()
+    result_queue.put(stats)
+
+
+def settler(done, result_queue, batch_size):
+    # Settles continuously while the workers queue, then drains the rest.
+    connections.close_all()
+    stats = {'settled': 0, 'settle_rejected': 0, 'batches': 0, 'settle_locked': 0}
+    while True:
+        finished = done.is_set()
+        try:
+            result = settle_batch(batch_size)
+        except OperationalError:
+            stats['settle_locked'] += 1
+            continue
+        if result['settled'] or result['rejected']:
+            stats['batches'] += 1
+            stats['settled'] += result['settled']
+            stats['settle_rejected'] += result['rejected']
+        elif finished:
+            break
+        else:
+            time.sleep(0.05)
+    connections.close_all()
+    result_queue.put(stats)
+
+
+def verify(initial_generated):
+    errors = []
+    sent = dict(Transaction.objects.values_list('from_user').annotate(total=Sum('amount')))
+    received = dict(
+        Transaction.objects.exclude(to_user=None).values_list('to_user').annotate(total=Sum('amount'))
+    )
+    for user in EnergyUser.objects.all():
+        expected_generated = initial_generated + received.get(user.id, 0)
+        expected_consumed = sent.get(user.id, 0)
+        if abs(user.generated - expected_generated) > 1e-6 or abs(user.consumed - expected_consumed) > 1e-6:
+            errors.append(f'{user.energy_number}: balance does not match its transactions')
+        if user.generated - user.consumed < -1e-6:
+            errors.append(f'{user.energy_number}: overdrawn to {user.generated - user.consumed:.2f} kWh')
+        if abs(user.surplus - max(0, user.generated - user.consumed)) > 1e-6:
+            errors.append(f'{user.energy_number}: stored surplus is stale')
+    return errors
+
+
+def run(mode, args):
+    seed(args.users, args.initial_generated)
+    Transaction.objects.all().delete()
+    TradeIntent.objects.all().delete()
+    connections.close_all()
+
+    ctx = multiprocessing.get_context('fork')
+    queue, settled_queue, done = ctx.Queue(), ctx.Queue(), ctx.Event()
+    started = time.perf_counter()
+    processes = [ctx.Process(target=worker, args=(i, args.trades, queue, mode)) for i in range(args.processes)]
+    settle_process = ctx.Process(target=settler, args=(done, settled_queue, args.batch_size)) if mode == 'batch' else None
+    for process in processes + ([settle_process] if settle_process else []):
+        process.start()
+    totals = {'ok': 0, 'rejected': 0, 'locked': 0}
+    for _ in processes:
+        for key, value in queue.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+    if settle_process is not None:
+        done.set()
+        totals.update(settled_queue.get())
+        settle_process.join()
+    elapsed = time.perf_counter() - started
+
+    errors = verify(args.initial_generated)
+    committed = totals['settled'] if mode == 'batch' else totals['ok']
+    if committed != Transaction.objects.count():
+        errors.append('Transaction count does not match successful trades')
+    return dict(totals, mode=mode, processes=args.processes, seconds=round(elapsed, 3),
+                trades_per_second=round(committed / elapsed, 1), errors=errors[:20])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent trade stress test that checks balance conservation')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--trades', type=int, default=500, help='Trades per process')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--initial-generated', type=float, default=50.0)
+    parser.add_argument('--mode', choices=['immediate', 'batch', 'both'], default='immediate',
+                        help='Per-trade transactions, queued intents with batch settlement, or both')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Intents per settlement batch')
+    args = parser.parse_args()
+
+    migrate()
+    modes = ['immediate', 'batch'] if args.mode == 'both' else [args.mode]
+    reports = [run(mode, args) for mode in modes]
+    print(json.dumps(reports[0] if len(reports) == 1 else reports, indent=2))
+    if OWN_DB:
+        os.remove(DB_PATH)
+    sys.exit(1 if any(report['errors'] for report in reports) else 0)
+
+
+if __name__ == '__main__':
+    main()
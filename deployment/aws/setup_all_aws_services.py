@@ -60,32 +60,51 @@ def setup_lambda():
 import json
 import boto3
 
-def lambda_handler(event, context):
-    generated = float(event.get('generated', 0))
-    consumed = float(event.get('consumed', 0))
-    user_name = event.get('user_name', 'Unknown')
-    transaction_type = event.get('transaction_type', 'calculation')
-    sns_topic_arn = event.get('sns_topic_arn')
+def calculate(record):
+    if 'surplus_kwh' in record:
+        # Batches from the platform arrive with their metrics computed.
+        return {
+            'user_name': record.get('user_name', 'Unknown'),
+            'transaction_type': record.get('transaction_type', 'calculation'),
+            'surplus_kwh': record['surplus_kwh'],
+            'deficit_kwh': record['deficit_kwh'],
+            'efficiency_percent': record['efficiency_percent']
+        }
+    
+    generated = float(record.get('generated', 0))
+    consumed = float(record.get('consumed', 0))
     
     surplus = max(0, generated - consumed)
     deficit = max(0, consumed - generated)
     efficiency = (generated / consumed * 100) if consumed > 0 else 0
     
-    metrics = {
+    return {
+        'user_name': record.get('user_name', 'Unknown'),
+        'transaction_type': record.get('transaction_type', 'calculation'),
         'surplus_kwh': round(surplus, 2),
         'deficit_kwh': round(deficit, 2),
         'efficiency_percent': round(efficiency, 2)
     }
+
+def lambda_handler(event, context):
+    # Batched async invocations send {'records': [...]}; a bare record is
+    # still accepted for one-off calls.
+    records = event.get('records', [event])
+    metrics = [calculate(record) for record in records]
+    sns_topic_arn = next((r.get('sns_topic_arn') for r in records if r.get('sns_topic_arn')), None)
     
-    if sns_topic_arn:
+    if sns_topic_arn and metrics:
         try:
             sns = boto3.client('sns')
-            message = f"User: {user_name}\\nTransaction: {transaction_type}\\nSurplus: {surplus} kWh"
-            sns.publish(TopicArn=sns_topic_arn, Subject='Energy Transaction', Message=message)
+            lines = [
+                f"User: {m['user_name']} | Transaction: {m['transaction_type']} | Surplus: {m['surplus_kwh']} kWh"
+                for m in metrics
+            ]
+            sns.publish(TopicArn=sns_topic_arn, Subject='Energy Transactions', Message="\\n".join(lines))
         except:
             pass
     
-    return {'statusCode': 200, 'body': json.dumps({'success': True, 'metrics': metrics})}
+    return {'statusCode': 200, 'body': json.dumps({'success': True, 'metrics': metrics if 'records' in event else metrics[0]})}
 '''
     
     zip_buffer = BytesIO()
@@ -108,6 +127,8 @@ def lambda_handler(event, context):
         print("Lambda function already exists")
 
 def setup_cloudwatch_dashboard():
+    # Operational view only: reporting reads the EnergyRollup tables kept by
+    # `manage.py update_rollups` (see /energy/api/rollups/).
     cloudwatch = boto3.client('cloudwatch')
     
     dashboard_body = {
@@ -1,3 +1,16 @@
 from django.contrib import admin
+from .models import EnergyRollup
 
-# Register your models here.
+@admin.register(EnergyRollup)
+class EnergyRollupAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'period', 'user', 'metric', 'total', 'count')
+    list_filter = ('period', 'metric', ('user', admin.EmptyFieldListFilter))
+    date_hierarchy = 'bucket'
+    search_fields = ('user__energy_number',)
+    list_select_related = ('user',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 class EnergyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'energy'
+    
+    def ready(self):
+        post_save.connect(invalidate_user_dashboard, sender='accounts.EnergyUser')
+        post_delete.connect(invalidate_user_dashboard, sender='accounts.EnergyUser')
+
+def invalidate_user_dashboard(sender, instance, update_fields=None, **kwargs):
+    # The version also keys the cached request.user, so any other field
+    # (password, is_active) evicts too. Logins save last_login only; that
+    # must not evict the cached dashboard.
+    # Bumped on commit: a bump inside the transaction would let a concurrent
+    # request cache the old row (still active, old password) under the new
+    # version.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    from django.db import transaction
+    from .cache import invalidate_dashboard
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_dashboard(user_id), using=kwargs.get('using'))
@@ -0,0 +1,146 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render, redirect
+from accounts.models import EnergyUser
+from energy_platform.profiling import span
+from .cache import adashboard_context
+from .services import TradeError
+from .settlement import submit_trade
+
+# Rendering reads the session (messages, CSRF), which only has a sync backend.
+arender = sync_to_async(render)
+
+# transaction.atomic() cannot be entered from async code, so the whole
+# settlement runs in one thread hop rather than one per query.
+asubmit_trade = sync_to_async(submit_trade)
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user is loaded lazily from the session and the database.
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        # Registers the event loop's thread with an active profile.
+        with span(view.__name__):
+            return await view(request, *args, **kwargs)
+    return wrapper
+
+@login_required
+async def dashboard(request):
+    user = request.user
+    context = dict(await adashboard_context(user), user=user)
+    return await arender(request, 'energy/dashboard.html', context)
+
+@login_required
+async def buyback_view(request):
+    user = request.user
+    surplus = user.calculate_surplus()
+    
+    if request.method == 'POST':
+        if surplus <= 0:
+            messages.error(request, 'No surplus energy available')
+            return redirect('energy:buyback')
+        
+        kwh_amount = float(request.POST.get('amount', 0))
+        
+        if kwh_amount <= 0 or kwh_amount > surplus:
+            messages.error(request, 'Invalid amount')
+            return redirect('energy:buyback')
+        
+        try:
+            trade = await asubmit_trade(user, 'buyback', kwh_amount)
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:buyback')
+        
+        if trade.queued:
+            messages.success(request, f'Buyback of {kwh_amount} kWh queued for settlement')
+        else:
+            messages.success(request, f'Buyback successful: {kwh_amount} kWh for {trade.credits_earned} credits')
+        return redirect('energy:dashboard')
+    
+    context = {'user': user, 'surplus': surplus}
+    return await arender(request, 'energy/buyback.html', context)
+
+@login_required
+async def loan_view(request):
+    user = request.user
+    surplus = user.calculate_surplus()
+    
+    if request.method == 'POST':
+        if surplus <= 0:
+            messages.error(request, 'No surplus energy available')
+            return redirect('energy:loan')
+        
+        try:
+            recipient_id = int(request.POST.get('recipient', ''))
+        except ValueError:
+            messages.error(request, 'Select a recipient')
+            return redirect('energy:loan')
+        kwh_amount = float(request.POST.get('amount', 0))
+        
+        if kwh_amount <= 0 or kwh_amount > surplus:
+            messages.error(request, 'Invalid amount')
+            return redirect('energy:loan')
+        
+        try:
+            recipient = await EnergyUser.objects.aget(id=recipient_id)
+            trade = await asubmit_trade(user, 'loan', kwh_amount, to_user=recipient)
+        except EnergyUser.DoesNotExist:
+            messages.error(request, 'Recipient not found')
+            return redirect('energy:loan')
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:loan')
+        
+        if trade.queued:
+            messages.success(request, f'Loan of {kwh_amount} kWh to {recipient.name} queued for settlement')
+        else:
+            messages.success(request, f'Loan successful: {kwh_amount} kWh to {recipient.name}')
+        return redirect('energy:dashboard')
+    
+    context = {'user': user, 'surplus': surplus}
+    return await arender(request, 'energy/loan.html', context)
+
+@login_required
+async def donation_view(request):
+    user = request.user
+    surplus = user.calculate_surplus()
+    
+    if request.method == 'POST':
+        if surplus <= 0:
+            messages.error(request, 'No surplus energy available')
+            return redirect('energy:donation')
+        
+        recipient_energy_number = request.POST.get('energy_number', '').strip()
+        kwh_amount = float(request.POST.get('amount', 0))
+        
+        if kwh_amount <= 0 or kwh_amount > surplus:
+            messages.error(request, 'Invalid amount')
+            return redirect('energy:donation')
+        
+        try:
+            recipient = await EnergyUser.objects.aget(energy_number=recipient_energy_number)
+            
+            if recipient.id == user.id:
+                messages.error(request, 'Cannot donate to yourself')
+                return redirect('energy:donation')
+            
+            trade = await asubmit_trade(user, 'donation', kwh_amount, to_user=recipient)
+            if trade.queued:
+                messages.success(request, f'Donation of {kwh_amount} kWh to {recipient.name} queued for settlement')
+            else:
+                messages.success(request, f'Donation successful: {kwh_amount} kWh donated to {recipient.name}')
+            return redirect('energy:dashboard')
+        
+        except EnergyUser.DoesNotExist:
+            messages.error(request, f'Energy number {recipient_energy_number} not found')
+            return redirect('energy:donation')
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:donation')
+    
+    context = {'user': user, 'surplus': surplus}
+    return await arender(request, 'energy/donation.html', context)
@@ -0,0 +1,132 @@
+import atexit
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+DYNAMODB_BATCH_SIZE = 25
+
+class BackupError(Exception):
+    pass
+
+def user_backup_item(user, transaction_type=None, amount=None, timestamp=None):
+    item = {
+        'energy_number': {'S': user.energy_number},
+        'timestamp': {'S': (timestamp or datetime.now()).isoformat()},
+        'name': {'S': user.name},
+        'generated': {'N': str(user.generated)},
+        'consumed': {'N': str(user.consumed)},
+        'credits': {'N': str(user.credits)},
+    }
+    if transaction_type is not None:
+        item['transaction_type'] = {'S': transaction_type}
+        item['amount'] = {'N': str(amount)}
+    else:
+        item['backup_type'] = {'S': 'snapshot'}
+    return item
+
+class InMemoryDynamoDB:
+    def __init__(self, unprocessed_rounds=0):
+        self.tables = defaultdict(dict)
+        self.calls = 0
+        self.unprocessed_rounds = unprocessed_rounds
+        self._lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        unprocessed = {}
+        with self._lock:
+            self.calls += 1
+            for table, requests in RequestItems.items():
+                if len(requests) > DYNAMODB_BATCH_SIZE:
+                    raise ValueError('Too many items in batch_write_item')
+                # Simulate throttling by bouncing the second half of the batch back.
+                if self.unprocessed_rounds > 0 and len(requests) > 1:
+                    self.unprocessed_rounds -= 1
+                    half = len(requests) // 2
+                    requests, unprocessed[table] = requests[:half], requests[half:]
+                for request in requests:
+                    item = request['PutRequest']['Item']
+                    key = (item['energy_number']['S'], item['timestamp']['S'])
+                    self.tables[table][key] = item
+        return {'UnprocessedItems': unprocessed}
+
+    def put_item(self, TableName, Item):
+        return self.batch_write_item({TableName: [{'PutRequest': {'Item': Item}}]})
+
+class BackupWriter:
+    def __init__(self, client, table_name, window=5.0, max_retries=5, backoff=0.05):
+        self.client = client
+        self.table_name = table_name
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._pending = {}
+        self._window_started = None
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def add(self, item):
+        # Writes for the same energy number within one window collapse into the latest.
+        with self._lock:
+            if self._window_started is None:
+                self._window_started = time.monotonic()
+            self._pending[item['energy_number']['S']] = item
+            due = (
+                len(self._pending) >= DYNAMODB_BATCH_SIZE
+                or time.monotonic() - self._window_started >= self.window
+            )
+            if not self._registered:
+                atexit.register(self.flush)
+                self._registered = True
+        if due:
+            self.flush()
+
+    def reset_after_fork(self):
+        self._pending = {}
+        self._window_started = None
+        self._lock = threading.Lock()
+
+    def flush_if_due(self):
+        with self._lock:
+            due = self._window_started is not None and time.monotonic() - self._window_started >= self.window
+        return self.flush() if due else 0
+
+    def flush(self, requeue=True):
+        # requeue=False drops a failed batch, for callers that retry it themselves.
+        with self._lock:
+            items, self._pending = list(self._pending.values()), {}
+            self._window_started = None
+        if not items:
+            return 0
+        try:
+            return self.write_items(items)
+        except Exception:
+            if requeue:
+                with self._lock:
+                    for item in items:
+                        self._pending.setdefault(item['energy_number']['S'], item)
+                    if self._window_started is None:
+                        self._window_started = time.monotonic()
+            raise
+
+    def write_items(self, items):
+        written = 0
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == DYNAMODB_BATCH_SIZE:
+                written += self._write_chunk(chunk)
+                chunk = []
+        if chunk:
+            written += self._write_chunk(chunk)
+        return written
+
+    def _write_chunk(self, items):
+        requests = [{'PutRequest': {'Item': item}} for item in items]
+        for attempt in range(self.max_retries + 1):
+            response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return len(items)
+            time.sleep(self.backoff * 2 ** attempt)
+        raise BackupError(f'{len(requests)} items still unprocessed after {self.max_retries} retries')
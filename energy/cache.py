@@ -0,0 +1,97 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .history import atransaction_history, transaction_history
+from .rollups import arecent_daily_rollups, recent_daily_rollups
+
+RECENT_TRANSACTIONS = 10
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+def _version_key(user_id):
+    return f'dashboard:version:{user_id}'
+
+def dashboard_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted version never reuses an old number.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+async def adashboard_version(user_id):
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+def invalidate_dashboard(*user_ids):
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            pass
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def dashboard_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def _dashboard_context(user, transactions, daily_rollups):
+    return {
+        'surplus': user.calculate_surplus(),
+        'deficit': user.calculate_deficit(),
+        'recent_transactions': [{
+            'transaction_type': tx.transaction_type,
+            'amount': tx.amount,
+            'direction': tx.direction,
+            'timestamp': tx.timestamp,
+        } for tx in transactions],
+        'daily_rollups': daily_rollups,
+    }
+
+def build_dashboard_context(user):
+    transactions, _ = transaction_history(user, limit=RECENT_TRANSACTIONS)
+    return _dashboard_context(user, transactions, recent_daily_rollups(user))
+
+async def abuild_dashboard_context(user):
+    transactions, _ = await atransaction_history(user, limit=RECENT_TRANSACTIONS)
+    return _dashboard_context(user, transactions, await arecent_daily_rollups(user))
+
+def dashboard_context(user):
+    if not settings.DASHBOARD_CACHE_ENABLED:
+        return build_dashboard_context(user)
+
+    key = f'dashboard:{user.id}:{dashboard_version(user.id)}'
+    context = cache.get(key)
+    if context is None:
+        _count('misses')
+        context = build_dashboard_context(user)
+        cache.set(key, context, settings.DASHBOARD_CACHE_TIMEOUT)
+    else:
+        _count('hits')
+    return context
+
+async def adashboard_context(user):
+    if not settings.DASHBOARD_CACHE_ENABLED:
+        return await abuild_dashboard_context(user)
+
+    key = f'dashboard:{user.id}:{await adashboard_version(user.id)}'
+    context = await cache.aget(key)
+    if context is None:
+        _count('misses')
+        context = await abuild_dashboard_context(user)
+        await cache.aset(key, context, settings.DASHBOARD_CACHE_TIMEOUT)
+    else:
+        _count('hits')
+    return context
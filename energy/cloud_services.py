@@ -1,14 +1,319 @@
-import boto3
+import asyncio
+import atexit
+import importlib
 import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from energy_platform.perf import timed
+from energy_platform.profiling import span, traced
+from .backup import BackupWriter, user_backup_item
+from .metrics_engine import compute_metrics, compute_metrics_batch
+
+CLOUDWATCH_NAMESPACE = 'SmartEnergyPlatform'
+CLOUDWATCH_MAX_DATUMS = 1000
+STUB_METRICS_MAX_CALLS = 1000
+
+class StubMetricsBackend:
+    # Keeps only the latest calls, so a long-running stub process stays bounded.
+    def __init__(self, max_calls=STUB_METRICS_MAX_CALLS):
+        self.calls = deque(maxlen=max_calls)
+        self._lock = threading.Lock()
+    
+    def put_metric_data(self, Namespace, MetricData):
+        with self._lock:
+            self.calls.append({'Namespace': Namespace, 'MetricData': MetricData})
+        return {}
+    
+    @property
+    def datums(self):
+        with self._lock:
+            calls = list(self.calls)
+        return [datum for call in calls for datum in call['MetricData']]
+
+class MetricsBuffer:
+    def __init__(self, backend, namespace=CLOUDWATCH_NAMESPACE, flush_interval=60.0, max_datums=CLOUDWATCH_MAX_DATUMS):
+        self.backend = backend
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.max_datums = max_datums
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def record(self, metric_name, value):
+        value = float(value)
+        with self._lock:
+            stats = self._stats.get(metric_name)
+            if stats is None:
+                self._stats[metric_name] = [value, 1, value, value]
+            else:
+                stats[0] += value
+                stats[1] += 1
+                stats[2] = min(stats[2], value)
+                stats[3] = max(stats[3], value)
+        if self._thread is None:
+            self.start()
+    
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self.flush_interval <= 0:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='metrics-buffer', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+    
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+    
+    def _merge(self, stats):
+        with self._lock:
+            for name, (total, count, low, high) in stats.items():
+                current = self._stats.get(name)
+                if current is None:
+                    self._stats[name] = [total, count, low, high]
+                else:
+                    current[0] += total
+                    current[1] += count
+                    current[2] = min(current[2], low)
+                    current[3] = max(current[3], high)
+    
+    def flush(self, requeue=True):
+        with self._flush_lock:
+            with self._lock:
+                stats, self._stats = self._stats, {}
+            if not stats:
+                return 0
+            
+            timestamp = datetime.utcnow()
+            datums = [{
+                'MetricName': name,
+                'Timestamp': timestamp,
+                'StatisticValues': {'Sum': total, 'SampleCount': count, 'Minimum': low, 'Maximum': high},
+            } for name, (total, count, low, high) in stats.items()]
+            
+            sent = 0
+            try:
+                for start in range(0, len(datums), self.max_datums):
+                    self.backend.put_metric_data(Namespace=self.namespace, MetricData=datums[start:start + self.max_datums])
+                    sent = start + self.max_datums
+            except Exception:
+                # Keep the unsent aggregates so they go out with the next flush.
+                if requeue:
+                    self._merge({name: stats[name] for name in list(stats)[sent:]})
+                raise
+            return len(datums)
+    
+    def reset_after_fork(self):
+        # The parent keeps flushing what it buffered; the child starts empty.
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+LAMBDA_MAX_BATCH_RECORDS = 500
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+CLOUD_IO_THREADS = int(os.getenv('CLOUD_IO_THREADS', '32'))
+CLOUD_SERVICE_TIMEOUT = float(os.getenv('CLOUD_SERVICE_TIMEOUT', '5'))
+BREAKER_FAILURES = int(os.getenv('CLOUD_BREAKER_FAILURES', '5'))
+BREAKER_RESET = float(os.getenv('CLOUD_BREAKER_RESET', '30'))
+
+class LambdaBatcher:
+    def __init__(self, client, function_name, window=10.0, max_records=LAMBDA_MAX_BATCH_RECORDS):
+        self.client = client
+        self.function_name = function_name
+        self.window = window
+        self.max_records = max_records
+        self._records = []
+        self._window_started = None
+        self._lock = threading.Lock()
+        self._registered = False
+    
+    def add(self, record):
+        with self._lock:
+            if self._window_started is None:
+                self._window_started = time.monotonic()
+            self._records.append(record)
+            due = len(self._records) >= self.max_records
+            if not self._registered:
+                atexit.register(self.flush)
+                self._registered = True
+        if due:
+            self.flush()
+    
+    def flush_if_due(self):
+        with self._lock:
+            due = self._window_started is not None and time.monotonic() - self._window_started >= self.window
+        return self.flush() if due else 0
+    
+    def flush(self, requeue=True):
+        with self._lock:
+            records, self._records = self._records, []
+            self._window_started = None
+        sent = 0
+        try:
+            for start in range(0, len(records), self.max_records):
+                self.invoke(records[start:start + self.max_records])
+                sent = start + self.max_records
+        except Exception:
+            if requeue:
+                with self._lock:
+                    self._records[:0] = records[sent:]
+                    if self._window_started is None:
+                        self._window_started = time.monotonic()
+            raise
+        return len(records)
+    
+    def reset_after_fork(self):
+        self._records = []
+        self._window_started = None
+        self._lock = threading.Lock()
+    
+    def invoke(self, records):
+        # The batch's metrics are computed here in one NumPy pass, so the
+        # function only formats and publishes them. Event invocations return
+        # immediately, so no caller waits on a cold start.
+        metrics = compute_metrics_batch(
+            [record['generated'] for record in records], [record['consumed'] for record in records],
+        )
+        records = [
+            dict(record, **{name: float(values[i]) for name, values in metrics.items()})
+            for i, record in enumerate(records)
+        ]
+        return self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'records': records}),
+        )
+
+def client_config():
+    from botocore.config import Config
+    # One pool slot per I/O thread so fan-out calls never queue for a
+    # connection; adaptive retries back off client-side when AWS throttles.
+    return Config(
+        max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', str(CLOUD_IO_THREADS))),
+        retries={'mode': 'adaptive', 'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '3'))},
+        connect_timeout=float(os.getenv('AWS_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.getenv('AWS_READ_TIMEOUT', '5')),
+        tcp_keepalive=True,
+    )
+
+class LazyClient:
+    def __init__(self, registry, service):
+        self._registry = registry
+        self._service = service
+    
+    def __getattr__(self, name):
+        return getattr(self._registry.client(self._service), name)
+
+class ClientRegistry:
+    # Clients share one Session (and its loaded service models) and are only
+    # built when a service is first called, so importing the app stays cheap.
+    def __init__(self, region_name, config=None):
+        self.region_name = region_name
+        self.config = config
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+    
+    def client(self, service):
+        client = self._clients.get(service)
+        if client is None:
+            # Sessions are not thread-safe, so creation is serialized.
+            with self._lock:
+                client = self._clients.get(service)
+                if client is None:
+                    if self._session is None:
+                        import boto3
+                        self._session = boto3.session.Session(region_name=self.region_name)
+                        self.config = self.config or client_config()
+                    client = self._clients[service] = self._session.client(service, config=self.config)
+        return client
+    
+    def lazy(self, service):
+        return LazyClient(self, service)
+    
+    def reset_after_fork(self):
+        # Pooled HTTP connections must never be shared with the parent.
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+    
+    def warm(self, *services):
+        for service in services:
+            self.client(service)
+    
+    @property
+    def created(self):
+        return sorted(self._clients)
+
+class CircuitBreaker:
+    # Opens after `failures` consecutive errors and skips calls until
+    # `reset_timeout` has passed; then one trial call is let through and its
+    # outcome closes the breaker or opens it again.
+    def __init__(self, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if self._trial else 'open'
+    
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+    
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
 
 class CloudServiceManager:
     def __init__(self):
         self.use_aws = os.getenv('USE_REAL_AWS', 'False').lower() == 'true'
+        self._io_pool = None
+        self._pool_lock = threading.Lock()
+        self.timeouts = {
+            name: float(os.getenv(f'CLOUD_TIMEOUT_{name.upper()}', CLOUD_SERVICE_TIMEOUT))
+            for name in self.SERVICES
+        }
+        self.breakers = {name: CircuitBreaker() for name in self.SERVICES}
         
         if self.use_aws:
             self.aws_region = os.getenv('AWS_REGION', 'us-east-1')
@@ -17,98 +322,251 @@ class CloudServiceManager:
             self.sns_topic_arn = os.getenv('AWS_SNS_TOPIC_ARN', '')
             self.lambda_function = os.getenv('AWS_LAMBDA_FUNCTION', 'EnergyCalculationFunction')
             
-            try:
-                self.s3 = boto3.client('s3', region_name=self.aws_region)
-                self.dynamodb = boto3.client('dynamodb', region_name=self.aws_region)
-                self.lambda_client = boto3.client('lambda', region_name=self.aws_region)
-                self.sns = boto3.client('sns', region_name=self.aws_region)
-                self.cloudwatch = boto3.client('cloudwatch', region_name=self.aws_region)
-            except:
-                self.use_aws = False
-    
-    def process_transaction_with_cloud(self, user, transaction_type, amount):
-        if not self.use_aws:
-            return {'success': True, 'message': 'AWS disabled', 'services_used': {}}
+            self.clients = ClientRegistry(self.aws_region)
+            self.s3 = self.clients.lazy('s3')
+            self.dynamodb = self.clients.lazy('dynamodb')
+            self.lambda_client = self.clients.lazy('lambda')
+            self.sns = self.clients.lazy('sns')
+            self.cloudwatch = self.clients.lazy('cloudwatch')
         
-        results = {}
+        if os.getenv('CLOUDWATCH_BACKEND', 'aws') == 'stub':
+            self.cloudwatch = StubMetricsBackend()
         
-        try:
-            self.cloudwatch.put_metric_data(
-                Namespace='SmartEnergyPlatform',
-                MetricData=[{
-                    'MetricName': f'Transaction_{transaction_type}',
-                    'Value': amount,
-                    'Timestamp': datetime.utcnow()
-                }]
-            )
-            results['cloudwatch'] = True
-        except:
-            results['cloudwatch'] = False
+        self.metrics = MetricsBuffer(
+            getattr(self, 'cloudwatch', None) or StubMetricsBackend(),
+            flush_interval=float(os.getenv('CLOUDWATCH_FLUSH_INTERVAL', '60')),
+            max_datums=int(os.getenv('CLOUDWATCH_BATCH_SIZE', str(CLOUDWATCH_MAX_DATUMS))),
+        )
         
-        try:
-            response = self.lambda_client.invoke(
-                FunctionName=self.lambda_function,
-                InvocationType='RequestResponse',
-                Payload=json.dumps({
-                    'generated': float(user.generated),
-                    'consumed': float(user.consumed),
-                    'user_name': user.name,
-                    'transaction_type': transaction_type,
-                    'sns_topic_arn': self.sns_topic_arn
-                })
+        if self.use_aws:
+            self.backup = BackupWriter(
+                self.dynamodb,
+                self.dynamodb_table,
+                window=float(os.getenv('DYNAMODB_BACKUP_WINDOW', '5')),
             )
-            results['lambda'] = True
-        except:
-            results['lambda'] = False
-        
-        try:
-            self.dynamodb.put_item(
-                TableName=self.dynamodb_table,
-                Item={
-                    'energy_number': {'S': user.energy_number},
-                    'timestamp': {'S': datetime.now().isoformat()},
-                    'name': {'S': user.name},
-                    'generated': {'N': str(user.generated)},
-                    'consumed': {'N': str(user.consumed)},
-                    'credits': {'N': str(user.credits)},
-                    'transaction_type': {'S': transaction_type},
-                    'amount': {'N': str(amount)}
-                }
+            self.lambda_batch = LambdaBatcher(
+                self.lambda_client,
+                self.lambda_function,
+                window=float(os.getenv('LAMBDA_BATCH_WINDOW', '10')),
+                max_records=int(os.getenv('LAMBDA_BATCH_SIZE', str(LAMBDA_MAX_BATCH_RECORDS))),
             )
-            results['dynamodb'] = True
-        except:
-            results['dynamodb'] = False
+    
+    SERVICES = ('cloudwatch', 'lambda', 'dynamodb', 's3')
+    
+    def _configured(self, name):
+        return name != 's3' or bool(self.s3_bucket)
+    
+    @timed('cloud')
+    def active_services(self):
+        if not self.use_aws:
+            return []
+        return [name for name in self.SERVICES if self._configured(name)]
+    
+    @property
+    def io_pool(self):
+        # asyncio's default executor is sized from the CPU count, which is far
+        # too small for calls that spend their time waiting on the network.
+        with self._pool_lock:
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=CLOUD_IO_THREADS, thread_name_prefix='cloud-io')
+            return self._io_pool
+    
+    def reset_after_fork(self):
+        self._io_pool = None
+        self._pool_lock = threading.Lock()
+        self.breakers = {name: CircuitBreaker() for name in self.SERVICES}
+        self.metrics.reset_after_fork()
+        if self.use_aws:
+            self.clients.reset_after_fork()
+            self.backup.reset_after_fork()
+            self.lambda_batch.reset_after_fork()
+    
+    def _handlers(self):
+        return {
+            'cloudwatch': self._send_cloudwatch,
+            'lambda': self._send_lambda,
+            'dynamodb': self._send_dynamodb,
+            's3': self._send_s3,
+        }
+    
+    def _summary(self, user, results):
+        successful = sum(result['ok'] for result in results.values())
+        return {
+            'success': True,
+            'message': f'{successful}/{len(results)} AWS services used',
+            'services_used': results,
+            'metrics': compute_metrics(user.generated, user.consumed),
+        }
+    
+    def _skipped(self, name):
+        if name not in self.breakers:
+            return {'ok': False, 'latency_ms': 0.0, 'error': 'unknown service'}
+        if not self.breakers[name].allow():
+            return {'ok': False, 'latency_ms': 0.0, 'error': 'circuit open'}
+        return None
+    
+    def _finish(self, name, started, ok, error=None):
+        self.breakers[name].record(ok)
+        return {'ok': ok, 'latency_ms': round((time.perf_counter() - started) * 1000, 3), 'error': error}
+    
+    @timed('cloud')
+    def process_transaction_with_cloud(self, user, transaction_type, amount, services=None):
+        if not self.use_aws:
+            return {'success': True, 'message': 'AWS disabled', 'services_used': {}}
         
-        try:
-            if self.s3_bucket:
-                pdf = self._generate_pdf(user, transaction_type, amount)
-                filename = f"reports/{user.energy_number}_{transaction_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                self.s3.put_object(Bucket=self.s3_bucket, Key=filename, Body=pdf.getvalue(), ContentType='application/pdf')
-                results['s3'] = True
-            else:
-                results['s3'] = False
-        except:
-            results['s3'] = False
+        # Unconfigured services are left out rather than failed, so they
+        # neither trip their breaker nor keep an outbox event retrying.
+        services = [name for name in (self.SERVICES if services is None else services) if self._configured(name)]
         
-        successful = sum(results.values())
-        return {'success': True, 'message': f'{successful}/4 AWS services used', 'services_used': results}
+        handlers = self._handlers()
+        started = time.perf_counter()
+        results, futures = {}, {}
+        for name in services:
+            results[name] = self._skipped(name)
+            if results[name] is None:
+                futures[name] = self.io_pool.submit(traced(f'cloud.{name}', handlers[name]), user, transaction_type, amount)
+        
+        # Every deadline counts from the same start, so the fan-out takes as
+        # long as the slowest call rather than the sum of all four. A call that
+        # times out keeps its pool thread until boto3 gives up; the breaker
+        # stops a stalled service from tying up more of them.
+        for name, future in futures.items():
+            remaining = started + self.timeouts[name] - time.perf_counter()
+            try:
+                results[name] = self._finish(name, started, bool(future.result(timeout=max(remaining, 0))))
+            except FutureTimeout:
+                future.cancel()
+                results[name] = self._finish(name, started, False, 'timeout')
+            except Exception as e:
+                results[name] = self._finish(name, started, False, repr(e))
+        return self._summary(user, results)
     
-    def _generate_pdf(self, user, transaction_type, amount):
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
+    @timed('cloud')
+    async def aprocess_transaction_with_cloud(self, user, transaction_type, amount, services=None):
+        if not self.use_aws:
+            return {'success': True, 'message': 'AWS disabled', 'services_used': {}}
+        
+        # Unconfigured services are left out rather than failed, so they
+        # neither trip their breaker nor keep an outbox event retrying.
+        services = [name for name in (self.SERVICES if services is None else services) if self._configured(name)]
         
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(100, height - 100, "Smart Energy Platform")
-        p.setFont("Helvetica", 12)
-        p.drawString(100, height - 130, f"User: {user.name}")
-        p.drawString(100, height - 150, f"Transaction: {transaction_type}")
-        p.drawString(100, height - 170, f"Amount: {amount} kWh")
-        p.drawString(100, height - 190, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        # boto3 clients block, so every service call runs on the I/O pool and
+        # all of them are in flight at once instead of one after another.
+        handlers = self._handlers()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
         
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return buffer
+        async def call(name):
+            skipped = self._skipped(name)
+            if skipped is not None:
+                return skipped
+            try:
+                ok = await asyncio.wait_for(
+                    loop.run_in_executor(self.io_pool, traced(f'cloud.{name}', handlers[name]), user, transaction_type, amount),
+                    self.timeouts[name],
+                )
+                return self._finish(name, started, bool(ok))
+            except asyncio.TimeoutError:
+                return self._finish(name, started, False, 'timeout')
+            except Exception as e:
+                return self._finish(name, started, False, repr(e))
+        
+        outcomes = await asyncio.gather(*(call(name) for name in services))
+        return self._summary(user, dict(zip(services, outcomes)))
+    
+    def _send_cloudwatch(self, user, transaction_type, amount):
+        self.metrics.record(f'Transaction_{transaction_type}', amount)
+        return True
+    
+    @timed('cloud')
+    def flush_due_buffers(self):
+        if not self.use_aws:
+            return 0
+        flushed = 0
+        for buffer in (self.backup, self.lambda_batch):
+            try:
+                flushed += buffer.flush_if_due()
+            except Exception:
+                pass
+        return flushed
+    
+    def _deferred(self):
+        # Handlers that only buffer: an outbox event using them is done once
+        # flush_deferred() has written (or invoked) the batch, not when the
+        # handler returns.
+        return {'cloudwatch': self.metrics, 'dynamodb': self.backup, 'lambda': self.lambda_batch}
+    
+    @timed('cloud')
+    def flush_deferred(self):
+        # Returns {service: error} for the buffers that failed to flush. Their
+        # contents are dropped, since the outbox retries those events.
+        errors = {}
+        if not self.use_aws:
+            return errors
+        for name, buffer in self._deferred().items():
+            try:
+                buffer.flush(requeue=False)
+            except Exception as e:
+                errors[name] = repr(e)
+                self.breakers[name].record(False)
+        return errors
+    
+    @timed('cloud')
+    def flush_buffers(self):
+        flushed = 0
+        buffers = [self.metrics]
+        if self.use_aws:
+            buffers += [self.backup, self.lambda_batch]
+        for buffer in buffers:
+            try:
+                flushed += buffer.flush()
+            except Exception:
+                pass
+        return flushed
+    
+    def _send_lambda(self, user, transaction_type, amount):
+        self.lambda_batch.add({
+            'generated': float(user.generated),
+            'consumed': float(user.consumed),
+            'user_name': user.name,
+            'transaction_type': transaction_type,
+            'sns_topic_arn': self.sns_topic_arn
+        })
+        return True
+    
+    def _send_dynamodb(self, user, transaction_type, amount):
+        self.backup.add(user_backup_item(user, transaction_type, amount))
+        return True
+    
+    def _send_s3(self, user, transaction_type, amount):
+        from .reports import get_report_template, spooled_pdf
+        filename = f"reports/{user.energy_number}_{transaction_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        with spooled_pdf() as pdf:
+            with span('report.render'):
+                get_report_template().render_receipt(pdf, user, transaction_type, amount)
+            with span('s3.upload'):
+                self.upload_report(pdf, filename)
+        return True
+    
+    @timed('cloud')
+    def upload_report(self, fileobj, key):
+        from boto3.s3.transfer import TransferConfig
+        fileobj.seek(0)
+        self.s3.upload_fileobj(
+            fileobj,
+            self.s3_bucket,
+            key,
+            ExtraArgs={'ContentType': 'application/pdf'},
+            Config=TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_THRESHOLD),
+        )
+
+def preload_modules():
+    # Imports only, for a gunicorn master that forks its workers: the
+    # libraries are shared copy-on-write, while clients, threads and
+    # connections are still created in each worker.
+    if cloud_manager.use_aws:
+        for module in ('boto3.s3.transfer', 'botocore.config', 'energy.reports'):
+            importlib.import_module(module)
 
 cloud_manager = CloudServiceManager()
+os.register_at_fork(after_in_child=cloud_manager.reset_after_fork)
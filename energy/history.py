@@ -0,0 +1,49 @@
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+from .models import Transaction
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(tx):
+    raw = f"{tx.timestamp.isoformat()}|{tx.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp, tx_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(tx_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def _page(queryset, position, limit):
+    # Seek on the (user, -timestamp, -id) index instead of counting past an OFFSET.
+    if position is not None:
+        timestamp, tx_id = position
+        queryset = queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, id__gte=tx_id)
+    return queryset.order_by('-timestamp', '-id')[:limit]
+
+def _history_base(user, cursor, limit):
+    position = decode_cursor(cursor) if cursor else None
+    base = Transaction.objects.select_related('from_user', 'to_user')
+    return _page(base.filter(from_user=user), position, limit + 1), _page(base.filter(to_user=user), position, limit + 1)
+
+def _merge_page(user, sent, received, limit):
+    merged = heapq.merge(sent, received, key=lambda tx: (tx.timestamp, tx.id), reverse=True)
+    page = list(islice(merged, limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+    for tx in page:
+        tx.direction = 'sent' if tx.from_user_id == user.id else 'received'
+        tx.counterparty = tx.to_user if tx.direction == 'sent' else tx.from_user
+    return page, encode_cursor(page[-1]) if has_more else None
+
+def transaction_history(user, cursor=None, limit=PAGE_SIZE):
+    sent, received = _history_base(user, cursor, limit)
+    return _merge_page(user, sent, received, limit)
+
+async def atransaction_history(user, cursor=None, limit=PAGE_SIZE):
+    sent, received = _history_base(user, cursor, limit)
+    return _merge_page(user, [tx async for tx in sent], [tx async for tx in received], limit)
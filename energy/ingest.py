@@ -0,0 +1,157 @@
+import csv
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+from django.db import IntegrityError, connection, transaction
+from accounts.models import EnergyUser
+from .cache import invalidate_dashboard
+from .models import MeterReading
+
+INGEST_BATCH_SIZE = 5000
+INGEST_ATTEMPTS = 3
+READING_FIELDS = ('energy_number', 'interval_start', 'generated_kwh', 'consumed_kwh')
+
+INSERT_READING_SQL = (
+    f'INSERT INTO {MeterReading._meta.db_table} (user_id, interval_start, generated_kwh, consumed_kwh) '
+    f'VALUES (%s, %s, %s, %s)'
+)
+
+class IngestError(ValueError):
+    pass
+
+def parse_csv(lines):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    missing = set(READING_FIELDS) - set(header)
+    if missing:
+        raise IngestError(f"CSV header is missing: {', '.join(sorted(missing))}")
+    positions = [header.index(field) for field in READING_FIELDS]
+    width = max(positions) + 1
+    for row in reader:
+        if row:
+            # A short row is yielded as None and counted invalid.
+            yield tuple(row[i] for i in positions) if len(row) >= width else None
+
+def parse_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            yield tuple(record.get(field) for field in READING_FIELDS) if isinstance(record, dict) else None
+
+PARSERS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+}
+
+def _parse_interval(value):
+    interval = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if interval.tzinfo is None:
+        interval = interval.replace(tzinfo=dt_timezone.utc)
+    return interval
+
+def ingest_batch(rows):
+    stats = {'inserted': 0, 'duplicates': 0, 'unknown_users': 0, 'invalid': 0}
+    # Rows the parsers could not map to fields, or whose energy number is not
+    # a string (a JSON list or object would not even hash).
+    valid = [row for row in rows if row is not None and isinstance(row[0], str)]
+    stats['invalid'] = len(rows) - len(valid)
+    rows = valid
+    user_ids = dict(
+        EnergyUser.objects.filter(energy_number__in={row[0] for row in rows})
+        .values_list('energy_number', 'id')
+    )
+
+    # Meters report on shared interval boundaries, so parse each timestamp once.
+    intervals = {}
+    parsed = {}
+    for energy_number, interval_start, generated, consumed in rows:
+        user_id = user_ids.get(energy_number)
+        if user_id is None:
+            stats['unknown_users'] += 1
+            continue
+        try:
+            interval = intervals.get(interval_start)
+            if interval is None:
+                interval = intervals[interval_start] = _parse_interval(interval_start)
+            key = (user_id, interval)
+            values = (float(generated or 0), float(consumed or 0))
+        except (TypeError, ValueError):
+            stats['invalid'] += 1
+            continue
+        # float() accepts 'nan', 'inf' and '-1e9', none of them a meter reading.
+        if not all(math.isfinite(value) and value >= 0 for value in values):
+            stats['invalid'] += 1
+            continue
+        if key in parsed:
+            stats['duplicates'] += 1
+        parsed[key] = values
+    if not parsed:
+        return stats
+
+    # A concurrent ingest of the same readings can commit between our read of
+    # the existing rows and the INSERT; the batch then rolls back and is
+    # retried, and finds those rows as duplicates.
+    for attempt in range(INGEST_ATTEMPTS):
+        try:
+            inserted, duplicates = _write_readings(parsed)
+            break
+        except IntegrityError:
+            if attempt == INGEST_ATTEMPTS - 1:
+                raise
+    stats['inserted'] = inserted
+    stats['duplicates'] += duplicates
+    return stats
+
+def _existing_readings(parsed):
+    intervals = {interval for _, interval in parsed}
+    return set(
+        MeterReading.objects.filter(
+            user_id__in={user_id for user_id, _ in parsed},
+            interval_start__gte=min(intervals),
+            interval_start__lte=max(intervals),
+        ).values_list('user_id', 'interval_start')
+    )
+
+def _write_readings(parsed):
+    with transaction.atomic():
+        existing = _existing_readings(parsed)
+        adapted = {interval: connection.ops.adapt_datetimefield_value(interval) for _, interval in parsed}
+        readings = []
+        duplicates = 0
+        deltas = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for (user_id, interval), (generated, consumed) in parsed.items():
+            if (user_id, interval) in existing:
+                duplicates += 1
+                continue
+            readings.append((user_id, adapted[interval], generated, consumed))
+            deltas[user_id][0] += generated
+            deltas[user_id][1] += consumed
+
+        # bulk_create prepares every field of every instance in Python, which
+        # caps it far below the ingest target; rows are already validated here.
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_READING_SQL, readings)
+        # Roll every user's totals forward with a single aggregate UPDATE.
+        if deltas:
+            EnergyUser.objects.apply_energy_deltas(deltas)
+            user_list = list(deltas)
+            transaction.on_commit(lambda: invalidate_dashboard(*user_list))
+    return len(readings), duplicates
+
+def ingest_readings(rows, batch_size=INGEST_BATCH_SIZE, on_batch=None):
+    totals = {'inserted': 0, 'duplicates': 0, 'unknown_users': 0, 'invalid': 0}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        for key, value in ingest_batch(batch).items():
+            totals[key] += value
+        if on_batch is not None:
+            on_batch(totals)
+    return totals
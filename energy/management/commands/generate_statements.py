@@ -0,0 +1,69 @@
+import shutil
+import time
+from datetime import datetime, time as dt_time, timedelta
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from accounts.models import EnergyUser
+from energy.cloud_services import cloud_manager
+from energy.models import Transaction
+from energy.reports import get_report_template, spooled_pdf
+
+class Command(BaseCommand):
+    help = 'Render one multi-page PDF statement per user for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--end', required=True, help='Last day, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--energy-number', help='Only render the statement for this user')
+        parser.add_argument('--output-dir', help='Write PDFs locally instead of uploading to S3')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start_day, end_day = parse_date(options['start']), parse_date(options['end'])
+        if start_day is None or end_day is None or end_day < start_day:
+            raise CommandError('--start and --end must be YYYY-MM-DD dates with start <= end')
+        start = timezone.make_aware(datetime.combine(start_day, dt_time.min))
+        end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), dt_time.min))
+
+        output_dir = Path(options['output_dir']) if options['output_dir'] else None
+        if output_dir is None and not (cloud_manager.use_aws and cloud_manager.s3_bucket):
+            raise CommandError('S3 is not configured; pass --output-dir to write statements locally')
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+        in_range = Transaction.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        users = EnergyUser.objects.filter(
+            Q(id__in=in_range.values('from_user')) | Q(id__in=in_range.values('to_user'))
+        ).order_by('id')
+        if options['energy_number']:
+            users = users.filter(energy_number=options['energy_number'])
+
+        template = get_report_template()
+        started = time.monotonic()
+        statements = total_rows = 0
+        for user in users.iterator(chunk_size=options['chunk_size']):
+            transactions = (
+                in_range.filter(Q(from_user=user) | Q(to_user=user))
+                .select_related('from_user', 'to_user')
+                .only('timestamp', 'transaction_type', 'amount', 'from_user__energy_number', 'to_user__energy_number')
+                .order_by('timestamp', 'id')
+                .iterator(chunk_size=options['chunk_size'])
+            )
+            filename = f"{user.energy_number}_{start_day:%Y%m%d}_{end_day:%Y%m%d}.pdf"
+            with spooled_pdf() as pdf:
+                pages, rows = template.render_statement(pdf, user, transactions, start_day, end_day)
+                if output_dir is not None:
+                    with open(output_dir / filename, 'wb') as out:
+                        shutil.copyfileobj(pdf, out)
+                else:
+                    cloud_manager.upload_report(pdf, f"statements/{filename}")
+            statements += 1
+            total_rows += rows
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {statements} statements ({total_rows} transactions) in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,37 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from energy.ingest import INGEST_BATCH_SIZE, PARSERS, IngestError, ingest_readings
+
+class Command(BaseCommand):
+    help = 'Stream smart-meter readings from CSV or NDJSON into MeterReading'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=sorted(PARSERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        started = time.monotonic()
+
+        def report(totals):
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{totals['inserted']} readings ({totals['inserted'] / elapsed:.0f}/s)")
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            totals = ingest_readings(PARSERS[fmt](stream), batch_size=options['batch_size'], on_batch=report)
+        except (IngestError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {totals['inserted']} readings in {elapsed:.2f}s "
+            f"({totals['duplicates']} duplicates, {totals['unknown_users']} unknown users, "
+            f"{totals['invalid']} invalid)"
+        ))
@@ -0,0 +1,42 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+from energy.matching import MatchingConflict, run_matching_round
+
+class Command(BaseCommand):
+    help = 'Match open bids and asks in price-time priority, one round per interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between matching rounds')
+        parser.add_argument('--once', action='store_true', help='Run one round and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.running:
+            started = time.monotonic()
+            try:
+                stats = run_matching_round()
+            except MatchingConflict as e:
+                # Rolled back; the next round matches the current book.
+                self.stderr.write(f'Round abandoned: {e}')
+                stats = {'orders': 0, 'fills': 0, 'volume': 0.0}
+            except OperationalError as e:
+                # A lock timeout or a dropped connection: retried next interval.
+                self.stderr.write(f'Round failed: {e}')
+                close_old_connections()
+                stats = {'orders': 0, 'fills': 0, 'volume': 0.0}
+            if stats['fills'] or options['once']:
+                self.stdout.write(
+                    f"Matched {stats['fills']} fills ({stats['volume']:.2f} kWh) "
+                    f"from {stats['orders']} open orders in {time.monotonic() - started:.2f}s"
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def stop(self, signum, frame):
+        self.running = False
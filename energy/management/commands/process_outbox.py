@@ -0,0 +1,67 @@
+import asyncio
+import signal
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from energy_platform.profiling import capture
+from energy.cloud_services import cloud_manager
+from energy.outbox import aprocess_events, claim_events, process_events, purge_processed
+
+class Command(BaseCommand):
+    help = 'Drain the cloud outbox with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--purge-days', type=int, default=7)
+        parser.add_argument('--once', action='store_true', help='Process one batch and exit')
+        parser.add_argument(
+            '--async', dest='use_async', action='store_true',
+            help='Run each batch on an event loop; --workers then caps events in flight',
+        )
+        parser.add_argument('--profile', action='store_true', help='Write a sampling profile of every batch to PROFILE_DIR')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        purge_after = timedelta(days=options['purge_days'])
+        last_purge = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while self.running:
+                events = claim_events(options['batch_size'])
+                if events:
+                    with capture('outbox') if options['profile'] else nullcontext() as profile:
+                        if options['use_async']:
+                            statuses = asyncio.run(aprocess_events(events, options['workers']))
+                        else:
+                            statuses = process_events(events, pool)
+                    if profile is not None:
+                        self.stdout.write(f'Profile written to {profile.filename}')
+                    self.stdout.write(
+                        f"Processed {len(events)} events: "
+                        f"{statuses.count('done')} done, "
+                        f"{statuses.count('pending')} retrying, "
+                        f"{statuses.count('failed')} failed"
+                    )
+
+                cloud_manager.flush_due_buffers()
+
+                if time.monotonic() - last_purge > 3600:
+                    purge_processed(purge_after)
+                    last_purge = time.monotonic()
+
+                if options['once']:
+                    break
+                if not events:
+                    time.sleep(options['poll_interval'])
+        
+        cloud_manager.flush_buffers()
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,34 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from energy.settlement import SETTLEMENT_BATCH_SIZE, settle_batch
+
+class Command(BaseCommand):
+    help = 'Settle queued trade intents in netted batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SETTLEMENT_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Settle one batch and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.running:
+            started = time.monotonic()
+            stats = settle_batch(options['batch_size'])
+            busy = stats['settled'] or stats['rejected']
+            if busy or options['once']:
+                self.stdout.write(
+                    f"Settled {stats['settled']} trades, rejected {stats['rejected']} "
+                    f"in {time.monotonic() - started:.3f}s"
+                )
+            if options['once']:
+                break
+            if not busy:
+                time.sleep(options['interval'])
+
+    def stop(self, signum, frame):
+        self.running = False
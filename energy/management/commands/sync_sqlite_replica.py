@@ -0,0 +1,36 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto the local replica files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep syncing every N seconds')
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite' or not settings.DATABASE_REPLICAS:
+            raise CommandError('Needs a SQLite primary and SQLITE_REPLICA_PATHS')
+        while True:
+            started = time.monotonic()
+            for alias in settings.DATABASE_REPLICAS:
+                self.sync(str(primary.settings_dict['NAME']), str(connections[alias].settings_dict['NAME']))
+            self.stdout.write(f"Synced {len(settings.DATABASE_REPLICAS)} replica(s) in {time.monotonic() - started:.2f}s")
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, source_path, replica_path):
+        # The online backup API copies a consistent snapshot of the primary
+        # and writes it into the replica in one transaction, so open replica
+        # connections never see a half-copied file.
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(replica_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
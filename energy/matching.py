@@ -0,0 +1,215 @@
+import heapq
+from collections import defaultdict, namedtuple
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from accounts.models import EnergyUser
+from .cache import invalidate_dashboard
+from .models import Order, OutboxEvent, Transaction
+from .outbox import cloud_transaction_event
+from .services import TradeError, lock_users
+
+MIN_QUANTITY = 1e-6
+BOOK_DEPTH = 10
+
+INSERT_TRADE_SQL = (
+    f'INSERT INTO {Transaction._meta.db_table} (from_user_id, to_user_id, amount, price, transaction_type, timestamp) '
+    f"VALUES (%s, %s, %s, %s, 'trade', %s)"
+)
+# Only open orders are written: one cancelled or filled since the book was
+# read matches no row, and the round is abandoned as a conflict.
+UPDATE_ORDER_SQL = f"UPDATE {Order._meta.db_table} SET remaining = %s, status = %s WHERE id = %s AND status = 'open'"
+
+Fill = namedtuple('Fill', 'bid_id ask_id buyer_id seller_id price quantity')
+
+class MatchingConflict(Exception):
+    pass
+
+class BookOrder:
+    __slots__ = ('id', 'user_id', 'side', 'price', 'remaining')
+
+    def __init__(self, id, user_id, side, price, remaining):
+        self.id = id
+        self.user_id = user_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+
+class OrderBook:
+    # Price-time priority: the best price wins, ties go to the lower id.
+    # Bids sit in a max-heap on price, asks in a min-heap; removed orders are
+    # dropped lazily when they surface at the top.
+    def __init__(self):
+        self.orders = {}
+        self._bids = []
+        self._asks = []
+
+    def add(self, order):
+        self.orders[order.id] = order
+        if order.side == 'bid':
+            heapq.heappush(self._bids, (-order.price, order.id))
+        else:
+            heapq.heappush(self._asks, (order.price, order.id))
+
+    def remove(self, order_id):
+        return self.orders.pop(order_id, None)
+
+    def _best(self, heap):
+        while heap and heap[0][1] not in self.orders:
+            heapq.heappop(heap)
+        return self.orders[heap[0][1]] if heap else None
+
+    def match(self, surplus=None, credits=None):
+        # surplus/credits cap what each seller can deliver and each buyer can
+        # pay for this round; orders whose owner runs dry are cancelled.
+        fills, cancelled, parked = [], [], []
+        while True:
+            bid, ask = self._best(self._bids), self._best(self._asks)
+            if bid is None or ask is None or bid.price < ask.price:
+                break
+            if bid.user_id == ask.user_id:
+                # No self-trades: sit the newer order out for this round.
+                newer = bid if bid.id > ask.id else ask
+                parked.append(self.remove(newer.id))
+                continue
+
+            price = ask.price if ask.id < bid.id else bid.price
+            quantity = min(bid.remaining, ask.remaining)
+            if surplus is not None and surplus.get(ask.user_id, 0) < quantity:
+                quantity = surplus.get(ask.user_id, 0)
+                if quantity < MIN_QUANTITY:
+                    cancelled.append(self.remove(ask.id))
+                    continue
+            if credits is not None and price > 0 and credits.get(bid.user_id, 0) < quantity * price:
+                quantity = credits.get(bid.user_id, 0) / price
+                if quantity < MIN_QUANTITY:
+                    cancelled.append(self.remove(bid.id))
+                    continue
+
+            fills.append(Fill(bid.id, ask.id, bid.user_id, ask.user_id, price, quantity))
+            if surplus is not None:
+                surplus[ask.user_id] -= quantity
+            if credits is not None:
+                credits[bid.user_id] -= quantity * price
+            for order in (bid, ask):
+                order.remaining -= quantity
+                if order.remaining < MIN_QUANTITY:
+                    order.remaining = 0.0
+                    self.remove(order.id)
+        for order in parked:
+            self.add(order)
+        return fills, cancelled
+
+def place_order(user, side, quantity, price):
+    if side not in ('bid', 'ask'):
+        raise TradeError('Invalid order side')
+    if quantity <= 0 or price < 0:
+        raise TradeError('Invalid amount')
+    # Open orders already reserve part of the owner's surplus or credits.
+    reserved = Order.objects.filter(user=user, side=side, status='open')
+    if side == 'ask':
+        committed = reserved.aggregate(total=Sum('remaining'))['total'] or 0
+        if quantity + committed > user.calculate_surplus():
+            raise TradeError('Insufficient surplus energy')
+    else:
+        committed = reserved.aggregate(total=Sum(F('remaining') * F('price')))['total'] or 0
+        if quantity * price + committed > user.credits:
+            raise TradeError('Insufficient credits')
+    return Order.objects.create(user=user, side=side, price=price, quantity=quantity, remaining=quantity)
+
+def cancel_order(user, order_id):
+    return Order.objects.filter(id=order_id, user=user, status='open').update(status='cancelled')
+
+def replay(orders, surplus=None, credits=None):
+    # Deterministic: the same order sequence always produces the same fills.
+    book = OrderBook()
+    for order in orders:
+        book.add(BookOrder(*order))
+    return book.match(surplus, credits)
+
+def open_book(lock=False):
+    book = OrderBook()
+    orders = Order.objects.filter(status='open').order_by('id')
+    if lock:
+        orders = orders.select_for_update()
+    for row in orders.values_list('id', 'user_id', 'side', 'price', 'remaining'):
+        book.add(BookOrder(*row))
+    return book
+
+def run_matching_round():
+    with transaction.atomic():
+        # Orders, then their owners, each in id order, so a cancel or a trade
+        # waits for the round instead of changing what it read. SQLite has no
+        # row locks; the tuned backend opens the block with BEGIN IMMEDIATE.
+        lock = connection.features.has_select_for_update
+        book = open_book(lock)
+        if not book.orders:
+            return {'orders': 0, 'fills': 0, 'volume': 0.0}
+        user_ids = {order.user_id for order in book.orders.values()}
+        if lock:
+            lock_users(*user_ids)
+        balances = EnergyUser.objects.filter(id__in=user_ids).values_list('id', 'surplus', 'credits')
+        surplus, credits = {}, {}
+        for user_id, user_surplus, user_credits in balances:
+            surplus[user_id] = user_surplus
+            credits[user_id] = user_credits
+
+        open_orders = len(book.orders)
+        touched = {order.id: order for order in book.orders.values()}
+        fills, cancelled = book.match(surplus, credits)
+        persist_round(fills, cancelled, touched)
+    return {'orders': open_orders, 'fills': len(fills), 'volume': sum(fill.quantity for fill in fills)}
+
+def persist_round(fills, cancelled, touched):
+    if not fills and not cancelled:
+        return
+    changed_ids = {fill.bid_id for fill in fills} | {fill.ask_id for fill in fills}
+    cancelled_ids = {order.id for order in cancelled}
+    updates = []
+    for order_id in changed_ids | cancelled_ids:
+        order = touched[order_id]
+        if order_id in cancelled_ids:
+            status = 'cancelled'
+        else:
+            status = 'filled' if order.remaining == 0 else 'open'
+        updates.append((order.remaining, status, order_id))
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    deltas = defaultdict(lambda: [0.0, 0.0, 0.0])
+    trades = []
+    for fill in fills:
+        value = fill.quantity * fill.price
+        trades.append((fill.seller_id, fill.buyer_id, fill.quantity, fill.price, now))
+        seller, buyer = deltas[fill.seller_id], deltas[fill.buyer_id]
+        seller[1] += fill.quantity
+        seller[2] += value
+        buyer[0] += fill.quantity
+        buyer[2] -= value
+
+    # A round can touch tens of thousands of rows; bulk_create/bulk_update
+    # spend longer building per-row SQL than the database spends writing.
+    # The order updates go first: they are the round's conflict check, and on
+    # SQLite its first write, which fails rather than writing over a newer
+    # snapshot than the one the book was read from.
+    with connection.cursor() as cursor:
+        cursor.executemany(UPDATE_ORDER_SQL, updates)
+        if cursor.rowcount != len(updates):
+            raise MatchingConflict(f'{len(updates) - cursor.rowcount} orders changed during the round')
+        cursor.executemany(INSERT_TRADE_SQL, trades)
+    EnergyUser.objects.apply_energy_deltas(deltas)
+
+    sellers = EnergyUser.objects.in_bulk({fill.seller_id for fill in fills})
+    events = [cloud_transaction_event(sellers[fill.seller_id], 'trade', fill.quantity) for fill in fills]
+    OutboxEvent.objects.bulk_create([event for event in events if event is not None], batch_size=1000)
+
+    user_ids = list(deltas)
+    transaction.on_commit(lambda: invalidate_dashboard(*user_ids))
+
+def book_depth(levels=BOOK_DEPTH):
+    open_orders = Order.objects.filter(status='open').values('price').annotate(
+        quantity=Sum('remaining'), orders=Count('id')
+    )
+    return {
+        'bids': list(open_orders.filter(side='bid').order_by('-price')[:levels]),
+        'asks': list(open_orders.filter(side='ask').order_by('price')[:levels]),
+    }
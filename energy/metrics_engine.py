@@ -0,0 +1,27 @@
+# Mirrors the calculations of the EnergyCalculationFunction Lambda so trades
+# can compute metrics in-process instead of invoking it synchronously.
+
+def compute_metrics(generated, consumed):
+    generated = float(generated)
+    consumed = float(consumed)
+    surplus = max(0, generated - consumed)
+    deficit = max(0, consumed - generated)
+    efficiency = (generated / consumed * 100) if consumed > 0 else 0
+    return {
+        'surplus_kwh': round(surplus, 2),
+        'deficit_kwh': round(deficit, 2),
+        'efficiency_percent': round(efficiency, 2),
+    }
+
+def compute_metrics_batch(generated, consumed):
+    import numpy as np
+    generated = np.asarray(generated, dtype=np.float64)
+    consumed = np.asarray(consumed, dtype=np.float64)
+    surplus = np.maximum(generated - consumed, 0)
+    deficit = np.maximum(consumed - generated, 0)
+    efficiency = np.divide(generated * 100, consumed, out=np.zeros_like(generated), where=consumed > 0)
+    return {
+        'surplus_kwh': np.round(surplus, 2),
+        'deficit_kwh': np.round(deficit, 2),
+        'efficiency_percent': np.round(efficiency, 2),
+    }
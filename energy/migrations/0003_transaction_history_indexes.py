@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('energy', '0002_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['from_user', '-timestamp', '-id'], name='tx_from_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['to_user', '-timestamp', '-id'], name='tx_to_user_recent'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('energy', '0003_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval_start', models.DateTimeField()),
+                ('generated_kwh', models.FloatField(default=0)),
+                ('consumed_kwh', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_readings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-interval_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='meterreading',
+            constraint=models.UniqueConstraint(fields=('user', 'interval_start'), name='unique_meter_interval'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('energy', '0005_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='price',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('buyback', 'Buyback'), ('loan', 'Loan'), ('donation', 'Donation'), ('trade', 'Trade')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('side', models.CharField(choices=[('bid', 'Bid'), ('ask', 'Ask')], max_length=3)),
+                ('price', models.FloatField()),
+                ('quantity', models.FloatField()),
+                ('remaining', models.FloatField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('filled', 'Filled'), ('cancelled', 'Cancelled')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'side', 'price'], name='order_book_level'), models.Index(fields=['user', 'status'], name='order_user_status')],
+            },
+        ),
+    ]
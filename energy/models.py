@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from accounts.models import EnergyUser
 
 class Transaction(models.Model):
@@ -6,12 +7,14 @@ class Transaction(models.Model):
         ('buyback', 'Buyback'),
         ('loan', 'Loan'),
         ('donation', 'Donation'),
+        ('trade', 'Trade'),
     ]
     
     from_user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, related_name='transactions_sent')
     to_user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, null=True, blank=True, related_name='transactions_received')
     amount = models.FloatField()
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
+    price = models.FloatField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -19,3 +22,141 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['from_user', '-timestamp', '-id'], name='tx_from_user_recent'),
+            models.Index(fields=['to_user', '-timestamp', '-id'], name='tx_to_user_recent'),
+        ]
+
+class OutboxEvent(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.id} ({self.status})"
+    
+    class Meta:
+        ordering = ['available_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+class MeterReading(models.Model):
+    user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, related_name='meter_readings')
+    interval_start = models.DateTimeField()
+    generated_kwh = models.FloatField(default=0)
+    consumed_kwh = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id} @ {self.interval_start}"
+    
+    class Meta:
+        ordering = ['-interval_start']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'interval_start'], name='unique_meter_interval'),
+        ]
+
+class EnergyRollup(models.Model):
+    PERIOD_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+    
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, null=True, blank=True, related_name='energy_rollups')
+    metric = models.CharField(max_length=20)
+    total = models.FloatField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        scope = self.user_id or 'platform'
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {scope} {self.metric}"
+    
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'metric', 'bucket'], name='unique_user_rollup'),
+            models.UniqueConstraint(
+                fields=['period', 'metric', 'bucket'], condition=models.Q(user__isnull=True),
+                name='unique_platform_rollup',
+            ),
+        ]
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # [id, first seen] for ids below last_id not yet visible when it passed them.
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+class Order(models.Model):
+    SIDE_CHOICES = [
+        ('bid', 'Bid'),
+        ('ask', 'Ask'),
+    ]
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('filled', 'Filled'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, related_name='orders')
+    side = models.CharField(max_length=3, choices=SIDE_CHOICES)
+    price = models.FloatField()
+    quantity = models.FloatField()
+    remaining = models.FloatField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.side} {self.remaining}/{self.quantity} kWh @ {self.price} ({self.status})"
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'side', 'price'], name='order_book_level'),
+            models.Index(fields=['user', 'status'], name='order_user_status'),
+        ]
+
+class TradeIntent(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('settled', 'Settled'),
+        ('rejected', 'Rejected'),
+    ]
+    
+    from_user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, related_name='trade_intents')
+    to_user = models.ForeignKey(EnergyUser, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.FloatField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.transaction_type} {self.amount} kWh ({self.status})"
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='tradeintent_queue'),
+        ]
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import random
+import uuid
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from accounts.models import EnergyUser
+from energy_platform.profiling import traced
+from .models import OutboxEvent
+from .cloud_services import cloud_manager
+
+CLOUD_TRANSACTION = 'cloud_transaction'
+
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', '2'))
+BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', '600'))
+LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+
+USER_SNAPSHOT_FIELDS = ('id', 'energy_number', 'name', 'generated', 'consumed', 'credits')
+
+def cloud_transaction_event(user, transaction_type, amount, services=None):
+    services = cloud_manager.active_services() if services is None else services
+    if not services:
+        return None
+    return OutboxEvent(
+        event_type=CLOUD_TRANSACTION,
+        payload={
+            'user': {field: getattr(user, field) for field in USER_SNAPSHOT_FIELDS},
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'services': services,
+        }
+    )
+
+def enqueue_cloud_transaction(user, transaction_type, amount):
+    # Called inside the trade's transaction.atomic() block so the event is
+    # committed (or rolled back) together with the balance change.
+    event = cloud_transaction_event(user, transaction_type, amount)
+    if event is not None:
+        event.save()
+    return event
+
+def claim_events(limit):
+    now = timezone.now()
+    due = Q(status='pending') | Q(status='processing')
+    ids = list(
+        OutboxEvent.objects.filter(due, available_at__lte=now)
+        .order_by('available_at', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    # Expired 'processing' leases belong to a crashed worker and are reclaimed.
+    token = uuid.uuid4().hex
+    OutboxEvent.objects.filter(due, id__in=ids, available_at__lte=now).update(
+        status='processing',
+        locked_by=token,
+        available_at=now + timedelta(seconds=LEASE_SECONDS),
+        attempts=F('attempts') + 1,
+    )
+    return list(OutboxEvent.objects.filter(id__in=ids, locked_by=token))
+
+def backoff_delay(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+    return delay * random.uniform(0.5, 1.0)
+
+def _cloud_event_args(event):
+    if event.event_type != CLOUD_TRANSACTION:
+        raise ValueError(f'Unknown outbox event type: {event.event_type}')
+
+    payload = event.payload
+    user = EnergyUser(**payload['user'])
+    return user, payload['transaction_type'], payload['amount'], payload.get('services')
+
+def handle_event(event):
+    user, transaction_type, amount, services = _cloud_event_args(event)
+    result = cloud_manager.process_transaction_with_cloud(user, transaction_type, amount, services=services)
+    return result['services_used']
+
+async def ahandle_event(event):
+    user, transaction_type, amount, services = _cloud_event_args(event)
+    result = await cloud_manager.aprocess_transaction_with_cloud(user, transaction_type, amount, services=services)
+    return result['services_used']
+
+def finish_event(event, failed, error):
+    updates = {'locked_by': '', 'last_error': error}
+    if not error:
+        updates.update(status='done', processed_at=timezone.now())
+    elif event.attempts >= MAX_ATTEMPTS:
+        updates.update(status='failed', processed_at=timezone.now())
+    else:
+        updates.update(
+            status='pending',
+            available_at=timezone.now() + timedelta(seconds=backoff_delay(event.attempts)),
+        )
+
+    # Only retry the services that failed so successful calls are not repeated.
+    if failed:
+        payload = dict(event.payload, services=failed)
+        updates['payload'] = payload
+
+    OutboxEvent.objects.filter(id=event.id, locked_by=event.locked_by).update(**updates)
+    close_old_connections()
+    return updates['status']
+
+def _run_event(event):
+    close_old_connections()
+    try:
+        return handle_event(event)
+    except Exception as e:
+        return e
+
+def _settle(event, outcome, deferred_errors):
+    # outcome is the event's services_used, or the exception that stopped it.
+    if isinstance(outcome, Exception):
+        return finish_event(event, None, repr(outcome))
+    failed = [name for name, status in outcome.items() if not status['ok'] or name in deferred_errors]
+    error = f'Failed services: {", ".join(failed)}' if failed else ''
+    return finish_event(event, failed, error)
+
+def process_events(events, pool=None):
+    # Buffered services (DynamoDB backups, Lambda batches) are flushed before
+    # any event is finished, so an event is only marked done once its writes
+    # and invocations succeeded.
+    run = traced('outbox.event', _run_event)
+    outcomes = list(pool.map(run, events) if pool is not None else map(run, events))
+    deferred_errors = cloud_manager.flush_deferred()
+    return [_settle(event, outcome, deferred_errors) for event, outcome in zip(events, outcomes)]
+
+def process_event(event):
+    return process_events([event])[0]
+
+async def aprocess_events(events, concurrency):
+    # One worker keeps up to `concurrency` events' cloud calls in flight.
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(event):
+        async with limit:
+            try:
+                return await ahandle_event(event)
+            except Exception as e:
+                return e
+
+    outcomes = await asyncio.gather(*(run(event) for event in events))
+    deferred_errors = await sync_to_async(cloud_manager.flush_deferred, thread_sensitive=False)()
+    settle = sync_to_async(_settle)
+    return [await settle(event, outcome, deferred_errors) for event, outcome in zip(events, outcomes)]
+
+def purge_processed(older_than):
+    cutoff = timezone.now() - older_than
+    deleted, _ = OutboxEvent.objects.filter(status='done', processed_at__lt=cutoff).delete()
+    return deleted
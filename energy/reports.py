@@ -0,0 +1,109 @@
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+STATEMENT_ROWS_PER_PAGE = 30
+STATIC_FORM = 'static'
+
+def spooled_pdf():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+class ReportTemplate:
+    def __init__(self, pagesize=letter):
+        self.pagesize = pagesize
+        self.width, self.height = pagesize
+        self._static_code = self._compile_static()
+
+    def _register_fonts(self, c):
+        # Fonts get their internal names (/F1, /F2) in registration order, so
+        # every document registers them identically to keep the precompiled
+        # operators valid.
+        c.setFont('Helvetica-Bold', 16)
+        c.setFont('Helvetica', 12)
+
+    def _compile_static(self):
+        proto = canvas.Canvas(BytesIO(), pagesize=self.pagesize)
+        self._register_fonts(proto)
+        title = proto.beginText(100, self.height - 100)
+        title.setFont('Helvetica-Bold', 16)
+        title.textLine('Smart Energy Platform')
+        footer = proto.beginText(100, 40)
+        footer.setFont('Helvetica', 8)
+        footer.textLine('Smart Energy Platform - Powered by AWS')
+        return title.getCode() + '\n' + footer.getCode()
+
+    def new_canvas(self, fileobj):
+        c = canvas.Canvas(fileobj, pagesize=self.pagesize)
+        self._register_fonts(c)
+        c.beginForm(STATIC_FORM)
+        c.addLiteral(self._static_code)
+        c.endForm()
+        return c
+
+    def render_receipt(self, fileobj, user, transaction_type, amount, when=None):
+        c = self.new_canvas(fileobj)
+        c.doForm(STATIC_FORM)
+        text = c.beginText(100, self.height - 130)
+        text.setFont('Helvetica', 12)
+        text.setLeading(20)
+        text.textLine(f"User: {user.name}")
+        text.textLine(f"Transaction: {transaction_type}")
+        text.textLine(f"Amount: {amount} kWh")
+        text.textLine(f"Date: {(when or datetime.now()).strftime('%Y-%m-%d %H:%M')}")
+        c.drawText(text)
+        c.showPage()
+        c.save()
+        fileobj.seek(0)
+        return fileobj
+
+    def render_statement(self, fileobj, user, transactions, start, end):
+        c = self.new_canvas(fileobj)
+        pages = 0
+        text = None
+        rows = 0
+        for tx in transactions:
+            if rows % STATEMENT_ROWS_PER_PAGE == 0:
+                if text is not None:
+                    c.drawText(text)
+                    c.showPage()
+                text = self._start_statement_page(c, user, start, end, pages + 1)
+                pages += 1
+            if tx.from_user_id == user.id:
+                counterparty = f" to {tx.to_user.energy_number}" if tx.to_user_id else ''
+            else:
+                counterparty = f" from {tx.from_user.energy_number}"
+            text.textLine(
+                f"{tx.timestamp.strftime('%Y-%m-%d %H:%M')}  {tx.transaction_type:<10} "
+                f"{tx.amount:>10.2f} kWh{counterparty}"
+            )
+            rows += 1
+
+        if text is None:
+            text = self._start_statement_page(c, user, start, end, 1)
+            text.textLine('No transactions in this period')
+            pages = 1
+        c.drawText(text)
+        c.showPage()
+        c.save()
+        fileobj.seek(0)
+        return pages, rows
+
+    def _start_statement_page(self, c, user, start, end, page):
+        c.doForm(STATIC_FORM)
+        text = c.beginText(100, self.height - 130)
+        text.setFont('Helvetica', 12)
+        text.setLeading(18)
+        text.textLine(f"Statement for {user.name} ({user.energy_number})")
+        text.textLine(f"Period: {start:%Y-%m-%d} to {end:%Y-%m-%d}    Page {page}")
+        text.textLine('')
+        text.setFont('Courier', 9)
+        text.setLeading(14)
+        return text
+
+@lru_cache(maxsize=None)
+def get_report_template():
+    return ReportTemplate()
@@ -0,0 +1,245 @@
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import EnergyRollup, MeterReading, RollupWatermark, Transaction
+
+ROLLUP_PERIODS = ('hour', 'day')
+READING_METRICS = ('generated', 'consumed')
+ROLLUP_BATCH_SIZE = 50000
+# How long an id skipped by the watermark is re-checked: a transaction that
+# took it may still commit (PostgreSQL hands out ids before commit).
+ROLLUP_GAP_SECONDS = float(os.getenv('ROLLUP_GAP_SECONDS', '600'))
+ROLLUP_MAX_GAPS = 10000
+# Recipients get these on top of the sender's per-type metric.
+RECEIVED_TYPES = ('loan', 'donation', 'trade')
+SOURCES = {
+    'readings': MeterReading,
+    'transactions': Transaction,
+}
+
+def rollup_metrics():
+    return (
+        READING_METRICS
+        + tuple(kind for kind, _ in Transaction.TRANSACTION_TYPES)
+        + tuple(f'{kind}_received' for kind in RECEIVED_TYPES)
+    )
+
+def _reading_totals(readings, period):
+    rows = (
+        readings.annotate(bucket=Trunc('interval_start', period, tzinfo=dt_timezone.utc))
+        .order_by().values('user_id', 'bucket')
+        .annotate(generated=Sum('generated_kwh'), consumed=Sum('consumed_kwh'), count=Count('id'))
+    )
+    for row in rows:
+        for metric in READING_METRICS:
+            yield row['bucket'], row['user_id'], metric, row[metric], row['count']
+
+def _transaction_totals(transactions, period):
+    rows = (
+        transactions.annotate(bucket=Trunc('timestamp', period, tzinfo=dt_timezone.utc))
+        .order_by().values('from_user_id', 'bucket', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    for row in rows:
+        yield row['bucket'], row['from_user_id'], row['transaction_type'], row['total'], row['count']
+
+def _received_totals(transactions, period):
+    rows = (
+        transactions.filter(to_user__isnull=False, transaction_type__in=RECEIVED_TYPES)
+        .annotate(bucket=Trunc('timestamp', period, tzinfo=dt_timezone.utc))
+        .order_by().values('to_user_id', 'bucket', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    for row in rows:
+        yield row['bucket'], row['to_user_id'], f"{row['transaction_type']}_received", row['total'], row['count']
+
+def collect_rollups(readings, transactions):
+    # Per-user rows plus a platform row (user None) for every bucket/metric.
+    # The recipient side is per user only, so platform totals count each
+    # transaction once.
+    totals = defaultdict(lambda: [0.0, 0])
+    for period in ROLLUP_PERIODS:
+        sources = (
+            (_reading_totals(readings, period), True),
+            (_transaction_totals(transactions, period), True),
+            (_received_totals(transactions, period), False),
+        )
+        for source, platform in sources:
+            for bucket, user_id, metric, total, count in source:
+                keys = [(period, bucket, user_id, metric)]
+                if platform:
+                    keys.append((period, bucket, None, metric))
+                for key in keys:
+                    totals[key][0] += total or 0
+                    totals[key][1] += count
+    return totals
+
+ROLLUP_TABLE = EnergyRollup._meta.db_table
+# Upserts add onto existing buckets; platform rows (user_id NULL) need the
+# partial unique index as their conflict target.
+UPSERT_USER_SQL = (
+    f'INSERT INTO {ROLLUP_TABLE} (period, bucket, user_id, metric, total, count) VALUES (%s, %s, %s, %s, %s, %s) '
+    f'ON CONFLICT (user_id, period, metric, bucket) '
+    f'DO UPDATE SET total = {ROLLUP_TABLE}.total + excluded.total, count = {ROLLUP_TABLE}.count + excluded.count'
+)
+UPSERT_PLATFORM_SQL = (
+    f'INSERT INTO {ROLLUP_TABLE} (period, bucket, user_id, metric, total, count) VALUES (%s, %s, NULL, %s, %s, %s) '
+    f'ON CONFLICT (period, metric, bucket) WHERE user_id IS NULL '
+    f'DO UPDATE SET total = {ROLLUP_TABLE}.total + excluded.total, count = {ROLLUP_TABLE}.count + excluded.count'
+)
+
+def merge_rollups(totals):
+    adapt = connection.ops.adapt_datetimefield_value
+    buckets = {bucket: adapt(bucket) for _, bucket, _, _ in totals}
+    per_user, platform = [], []
+    for (period, bucket, user_id, metric), (total, count) in totals.items():
+        if user_id is None:
+            platform.append((period, buckets[bucket], metric, total, count))
+        else:
+            per_user.append((period, buckets[bucket], user_id, metric, total, count))
+    with connection.cursor() as cursor:
+        if per_user:
+            cursor.executemany(UPSERT_USER_SQL, per_user)
+        if platform:
+            cursor.executemany(UPSERT_PLATFORM_SQL, platform)
+    return len(totals)
+
+def _next_high_id(model, low, batch_size):
+    ids = model.objects.filter(id__gt=low).order_by('id').values_list('id', flat=True)
+    high = ids[batch_size - 1:batch_size].first()
+    return high if high is not None else model.objects.filter(id__gt=low).aggregate(high=Max('id'))['high']
+
+def _invalidate(user_ids):
+    from .cache import invalidate_dashboard
+    invalidate_dashboard(*user_ids)
+
+def _advance(model, watermark, batch_size, now):
+    # Returns the ids to roll up as (low, high, found gap ids). An id the
+    # watermark passes without seeing may belong to a transaction that has
+    # not committed yet, so it is kept in watermark.gaps and looked for again
+    # on every step until ROLLUP_GAP_SECONDS have passed.
+    gaps = {gap_id: seen for gap_id, seen in watermark.gaps if now - seen < ROLLUP_GAP_SECONDS}
+    found = list(model.objects.filter(id__in=list(gaps)).values_list('id', flat=True)) if gaps else []
+    for gap_id in found:
+        del gaps[gap_id]
+
+    low = watermark.last_id
+    high = _next_high_id(model, low, batch_size)
+    if high is not None:
+        batch = model.objects.filter(id__gt=low, id__lte=high)
+        if batch.count() < high - low:
+            seen = set(batch.values_list('id', flat=True))
+            # Newest first: in-flight transactions hold the highest ids.
+            missing = [gap_id for gap_id in range(high - 1, low, -1) if gap_id not in seen]
+            gaps.update((gap_id, now) for gap_id in missing[:ROLLUP_MAX_GAPS])
+        watermark.last_id = high
+    watermark.gaps = sorted([gap_id, seen] for gap_id, seen in gaps.items())
+    watermark.save(update_fields=['last_id', 'gaps', 'updated_at'])
+    return low, high, found
+
+def update_rollups_step(batch_size=ROLLUP_BATCH_SIZE):
+    stats = {'readings': 0, 'transactions': 0, 'rows': 0}
+    now = time.time()
+    with transaction.atomic():
+        querysets = {}
+        for name, model in SOURCES.items():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+            low, high, found = _advance(model, watermark, batch_size, now)
+            if high is None and not found:
+                querysets[name] = model.objects.none()
+                continue
+            scope = Q(id__in=found)
+            if high is not None:
+                scope |= Q(id__gt=low, id__lte=high)
+            querysets[name] = model.objects.filter(scope)
+            stats[name] = querysets[name].count()
+        if not stats['readings'] and not stats['transactions']:
+            return stats
+
+        totals = collect_rollups(querysets['readings'], querysets['transactions'])
+        stats['rows'] = merge_rollups(totals)
+        user_ids = {user_id for _, _, user_id, _ in totals if user_id is not None}
+        transaction.on_commit(lambda: _invalidate(user_ids))
+    return stats
+
+def update_rollups(batch_size=ROLLUP_BATCH_SIZE, on_step=None):
+    totals = {'readings': 0, 'transactions': 0, 'rows': 0}
+    while True:
+        stats = update_rollups_step(batch_size)
+        if not stats['readings'] and not stats['transactions']:
+            return totals
+        for key, value in stats.items():
+            totals[key] += value
+        if on_step is not None:
+            on_step(totals)
+
+def day_bounds(start_day, end_day):
+    start = datetime.combine(start_day, dt_time.min, tzinfo=dt_timezone.utc)
+    end = datetime.combine(end_day + timedelta(days=1), dt_time.min, tzinfo=dt_timezone.utc)
+    return start, end
+
+def rebuild_rollups(start, end):
+    # start/end must fall on UTC day boundaries so daily buckets are rebuilt
+    # whole. Only rows behind the watermarks are counted; anything newer, or
+    # still tracked as a gap, is left for the incremental job so nothing is
+    # added twice.
+    with transaction.atomic():
+        marks = {
+            name: RollupWatermark.objects.select_for_update().get_or_create(name=name)[0]
+            for name in SOURCES
+        }
+        deleted, _ = EnergyRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        behind = {
+            name: model.objects.filter(id__lte=marks[name].last_id)
+            .exclude(id__in=[gap_id for gap_id, _ in marks[name].gaps])
+            for name, model in SOURCES.items()
+        }
+        readings = behind['readings'].filter(interval_start__gte=start, interval_start__lt=end)
+        transactions = behind['transactions'].filter(timestamp__gte=start, timestamp__lt=end)
+        totals = collect_rollups(readings, transactions)
+        rows = merge_rollups(totals)
+        user_ids = {user_id for _, _, user_id, _ in totals if user_id is not None}
+        transaction.on_commit(lambda: _invalidate(user_ids))
+    return {'deleted': deleted, 'rows': rows}
+
+def _series_rows(period, start, end, user):
+    rows = EnergyRollup.objects.filter(period=period, user=user)
+    if start is not None:
+        rows = rows.filter(bucket__gte=start)
+    if end is not None:
+        rows = rows.filter(bucket__lt=end)
+    return rows.order_by('bucket').values_list('bucket', 'metric', 'total', 'count')
+
+def _build_series(rows):
+    metrics = rollup_metrics()
+    series = {}
+    for bucket, metric, total, count in rows:
+        point = series.get(bucket)
+        if point is None:
+            point = series[bucket] = dict(
+                {'bucket': bucket}, **{m: 0.0 for m in metrics}, **{f'{m}_count': 0 for m in metrics}
+            )
+        point[metric] = round(total, 3)
+        point[f'{metric}_count'] = count
+    return list(series.values())
+
+def rollup_series(period='day', start=None, end=None, user=None):
+    return _build_series(_series_rows(period, start, end, user))
+
+async def arollup_series(period='day', start=None, end=None, user=None):
+    return _build_series([row async for row in _series_rows(period, start, end, user)])
+
+def _recent_days(days):
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    return day_bounds(today - timedelta(days=days - 1), today)
+
+def recent_daily_rollups(user, days=7):
+    return rollup_series('day', *_recent_days(days), user=user)
+
+async def arecent_daily_rollups(user, days=7):
+    return await arollup_series('day', *_recent_days(days), user=user)
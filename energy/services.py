@@ -0,0 +1,64 @@
+from django.db import connection, transaction
+from accounts.models import EnergyUser
+from .cache import invalidate_dashboard
+from .models import Transaction
+from .outbox import enqueue_cloud_transaction
+
+TRADE_RATES = {
+    'buyback': 0.15,
+    'loan': 0.10,
+    'donation': 0.0,
+}
+
+BALANCE_FIELDS = ['generated', 'consumed', 'credits', 'surplus', 'deficit']
+
+class TradeError(Exception):
+    pass
+
+def lock_users(*user_ids):
+    # Always lock in primary key order so two opposite trades cannot deadlock.
+    ids = sorted({user_id for user_id in user_ids if user_id is not None})
+    return list(EnergyUser.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+def debit_surplus(user_id, amount, credits=0):
+    return EnergyUser.objects.filter(pk=user_id, surplus__gte=amount).apply_energy_delta(
+        consumed=amount, credits=credits
+    )
+
+def credit_generation(user_id, amount):
+    return EnergyUser.objects.filter(pk=user_id).apply_energy_delta(generated=amount)
+
+def execute_trade(from_user, transaction_type, amount, to_user=None):
+    if amount <= 0:
+        raise TradeError('Invalid amount')
+    if to_user is not None and to_user.pk == from_user.pk:
+        raise TradeError('Cannot trade with yourself')
+
+    credits = amount * TRADE_RATES[transaction_type]
+    with transaction.atomic():
+        # SQLite has no row locks; a leading SELECT would only take a shared
+        # lock that fails to upgrade under contention, so the first statement
+        # there is the conditional UPDATE itself.
+        if connection.features.has_select_for_update:
+            lock_users(from_user.pk, to_user.pk if to_user else None)
+
+        if debit_surplus(from_user.pk, amount, credits) != 1:
+            raise TradeError('Insufficient surplus energy')
+        if to_user is not None and credit_generation(to_user.pk, amount) != 1:
+            raise TradeError('Recipient not found')
+
+        trade = Transaction.objects.create(
+            from_user=from_user,
+            to_user=to_user,
+            amount=amount,
+            transaction_type=transaction_type
+        )
+
+        from_user.refresh_from_db(fields=BALANCE_FIELDS)
+        if to_user is not None:
+            to_user.refresh_from_db(fields=BALANCE_FIELDS)
+        enqueue_cloud_transaction(from_user, transaction_type, amount)
+        transaction.on_commit(lambda: invalidate_dashboard(from_user.pk, to_user.pk if to_user else None))
+
+    trade.credits_earned = credits
+    return trade
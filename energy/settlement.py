@@ -0,0 +1,109 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from accounts.models import EnergyUser
+from .cache import invalidate_dashboard
+from .models import OutboxEvent, TradeIntent, Transaction
+from .outbox import cloud_transaction_event
+from .services import TRADE_RATES, TradeError, execute_trade, lock_users
+
+SETTLEMENT_BATCH_SIZE = 1000
+
+def queue_trade(from_user, transaction_type, amount, to_user=None):
+    if amount <= 0:
+        raise TradeError('Invalid amount')
+    if to_user is not None and to_user.pk == from_user.pk:
+        raise TradeError('Cannot trade with yourself')
+    # Early rejection only; settle_trades re-checks against the live balance.
+    pending = TradeIntent.objects.filter(from_user=from_user, status='pending').aggregate(total=Sum('amount'))['total']
+    if amount + (pending or 0) > from_user.calculate_surplus():
+        raise TradeError('Insufficient surplus energy')
+    intent = TradeIntent.objects.create(
+        from_user=from_user, to_user=to_user, transaction_type=transaction_type, amount=amount
+    )
+    intent.credits_earned = amount * TRADE_RATES[transaction_type]
+    return intent
+
+def submit_trade(from_user, transaction_type, amount, to_user=None):
+    if settings.TRADE_SETTLEMENT_MODE == 'batch':
+        trade = queue_trade(from_user, transaction_type, amount, to_user=to_user)
+        trade.queued = True
+    else:
+        trade = execute_trade(from_user, transaction_type, amount, to_user=to_user)
+        trade.queued = False
+    return trade
+
+def settle_batch(limit=SETTLEMENT_BATCH_SIZE):
+    stats = {'settled': 0, 'rejected': 0}
+    with transaction.atomic():
+        # Claim with an UPDATE first: on SQLite that takes the write lock up
+        # front instead of failing to upgrade a read lock, and elsewhere it
+        # keeps two settlers off the same intents. The claim commits or rolls
+        # back with the batch, so 'processing' is never visible outside it.
+        pending = TradeIntent.objects.filter(status='pending').order_by('id').values('id')[:limit]
+        if not TradeIntent.objects.filter(id__in=pending, status='pending').update(status='processing'):
+            return stats
+        intents = list(TradeIntent.objects.filter(status='processing').order_by('id'))
+        user_ids = {intent.from_user_id for intent in intents} | {intent.to_user_id for intent in intents}
+        if connection.features.has_select_for_update:
+            lock_users(*user_ids)
+        users = EnergyUser.objects.in_bulk(user_ids - {None})
+        balances = {user_id: [user.generated, user.consumed] for user_id, user in users.items()}
+
+        # Intents settle in arrival order against a running balance, so a
+        # later trade is rejected once an earlier one used up the surplus.
+        deltas = defaultdict(lambda: [0.0, 0.0, 0.0])
+        settled, rejected, trades = [], defaultdict(list), []
+        for intent in intents:
+            if intent.from_user_id not in users or (intent.to_user_id and intent.to_user_id not in users):
+                rejected['User not found'].append(intent.id)
+                continue
+            sender_balance = balances[intent.from_user_id]
+            if max(sender_balance[0] - sender_balance[1], 0) < intent.amount:
+                rejected['Insufficient surplus energy'].append(intent.id)
+                continue
+            sender_balance[1] += intent.amount
+            credits = intent.amount * TRADE_RATES[intent.transaction_type]
+            sender = deltas[intent.from_user_id]
+            sender[1] += intent.amount
+            sender[2] += credits
+            if intent.to_user_id:
+                deltas[intent.to_user_id][0] += intent.amount
+                balances[intent.to_user_id][0] += intent.amount
+            trades.append(Transaction(
+                from_user_id=intent.from_user_id, to_user_id=intent.to_user_id,
+                amount=intent.amount, transaction_type=intent.transaction_type,
+            ))
+            settled.append(intent)
+
+        EnergyUser.objects.apply_energy_deltas(deltas)
+        Transaction.objects.bulk_create(trades, batch_size=SETTLEMENT_BATCH_SIZE)
+        now = timezone.now()
+        TradeIntent.objects.filter(id__in=[intent.id for intent in settled]).update(status='settled', settled_at=now)
+        for error, ids in rejected.items():
+            TradeIntent.objects.filter(id__in=ids).update(status='rejected', error=error, settled_at=now)
+
+        if settled:
+            senders = EnergyUser.objects.in_bulk({intent.from_user_id for intent in settled})
+            events = [
+                cloud_transaction_event(senders[intent.from_user_id], intent.transaction_type, intent.amount)
+                for intent in settled
+            ]
+            OutboxEvent.objects.bulk_create([event for event in events if event is not None])
+        changed = list(deltas)
+        transaction.on_commit(lambda: invalidate_dashboard(*changed))
+
+    stats['settled'] = len(settled)
+    stats['rejected'] = sum(len(ids) for ids in rejected.values())
+    return stats
+
+def settle_pending(limit=SETTLEMENT_BATCH_SIZE):
+    totals = {'settled': 0, 'rejected': 0}
+    while True:
+        stats = settle_batch(limit)
+        if not stats['settled'] and not stats['rejected']:
+            return totals
+        for key, value in stats.items():
+            totals[key] += value
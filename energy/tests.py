@@ -1,3 +1,1026 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import time
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, router
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from accounts.models import EnergyUser
+from energy_platform import perf, profiling
+from energy_platform.db_routing import PIN_COOKIE, ReplicaPinningMiddleware
+from . import async_views, ingest
+from .backup import BackupWriter, InMemoryDynamoDB, user_backup_item
+from .cloud_services import BREAKER_FAILURES, CircuitBreaker, CloudServiceManager, LambdaBatcher, MetricsBuffer, StubMetricsBackend
+from .metrics_engine import compute_metrics, compute_metrics_batch
+from .cache import dashboard_cache_stats
+from .history import transaction_history
+from .matching import MatchingConflict, cancel_order, open_book, place_order, replay, run_matching_round
+from .models import EnergyRollup, MeterReading, Order, OutboxEvent, RollupWatermark, TradeIntent, Transaction
+from .outbox import aprocess_events, claim_events, cloud_transaction_event, enqueue_cloud_transaction, process_event, process_events
+from .rollups import day_bounds, rebuild_rollups, rollup_series, update_rollups
+from .services import TradeError, execute_trade
+from .settlement import settle_batch
 
-# Create your tests here.
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = EnergyUser.objects.create_user('EN1', 'Alice', 'pass')
+        patcher = mock.patch('energy.outbox.cloud_manager')
+        self.cloud = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cloud.active_services.return_value = ['cloudwatch', 'lambda']
+
+    def test_failed_services_are_retried_alone(self):
+        enqueue_cloud_transaction(self.user, 'buyback', 1.5)
+        self.cloud.process_transaction_with_cloud.return_value = {
+            'services_used': {
+                'cloudwatch': {'ok': True, 'latency_ms': 1.0, 'error': None},
+                'lambda': {'ok': False, 'latency_ms': 5.0, 'error': 'timeout'},
+            },
+        }
+
+        event, = claim_events(10)
+        self.assertEqual(process_event(event), 'pending')
+
+        event.refresh_from_db()
+        self.assertEqual(event.payload['services'], ['lambda'])
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(claim_events(10), [])
+
+    def test_event_is_done_only_after_backup_is_written(self):
+        manager = CloudServiceManager()
+        manager.use_aws = True
+        client = InMemoryDynamoDB()
+        manager.backup = BackupWriter(client, 'backup', window=60, max_retries=0)
+        manager.lambda_batch = LambdaBatcher(mock.Mock(), 'calc')
+        cloud_transaction_event(self.user, 'loan', 1.0, services=['dynamodb']).save()
+
+        with mock.patch('energy.outbox.cloud_manager', manager):
+            with mock.patch.object(client, 'batch_write_item', side_effect=RuntimeError('throttled')):
+                event, = claim_events(10)
+                self.assertEqual(process_event(event), 'pending')
+            event.refresh_from_db()
+            self.assertEqual(event.payload['services'], ['dynamodb'])
+            self.assertIn('dynamodb', event.last_error)
+            self.assertEqual(manager.backup.flush(), 0)
+
+            OutboxEvent.objects.update(available_at=timezone.now())
+            event, = claim_events(10)
+            self.assertEqual(process_event(event), 'done')
+        self.assertEqual(len(client.tables['backup']), 1)
+
+    def test_event_is_done_only_after_lambda_batch_is_invoked(self):
+        manager = CloudServiceManager()
+        manager.use_aws = True
+        manager.sns_topic_arn = ''
+        client = mock.Mock()
+        client.invoke.side_effect = [RuntimeError('throttled'), {'StatusCode': 202}]
+        manager.lambda_batch = LambdaBatcher(client, 'calc', window=60)
+        manager.backup = BackupWriter(InMemoryDynamoDB(), 'backup')
+        for amount in (1.0, 2.0):
+            cloud_transaction_event(self.user, 'loan', amount, services=['lambda']).save()
+
+        with mock.patch('energy.outbox.cloud_manager', manager):
+            self.assertEqual([process_event(event) for event in claim_events(10)[:1]], ['pending'])
+            self.assertEqual(manager.lambda_batch.flush(), 0)
+
+            OutboxEvent.objects.update(available_at=timezone.now())
+            statuses = process_events(claim_events(10))
+        self.assertEqual(statuses, ['done', 'done'])
+        self.assertEqual(client.invoke.call_count, 2)
+        self.assertEqual(len(json.loads(client.invoke.call_args.kwargs['Payload'])['records']), 2)
+
+    def test_event_is_done_only_after_metrics_are_published(self):
+        manager = CloudServiceManager()
+        manager.use_aws = True
+        backend = StubMetricsBackend()
+        manager.metrics = MetricsBuffer(backend, flush_interval=0)
+        manager.backup = BackupWriter(InMemoryDynamoDB(), 'backup')
+        manager.lambda_batch = LambdaBatcher(mock.Mock(), 'calc')
+        cloud_transaction_event(self.user, 'loan', 1.0, services=['cloudwatch']).save()
+
+        with mock.patch('energy.outbox.cloud_manager', manager):
+            with mock.patch.object(backend, 'put_metric_data', side_effect=RuntimeError('throttled')):
+                event, = claim_events(10)
+                self.assertEqual(process_event(event), 'pending')
+            event.refresh_from_db()
+            self.assertEqual(event.payload['services'], ['cloudwatch'])
+            self.assertEqual(manager.metrics.flush(), 0)
+
+            OutboxEvent.objects.update(available_at=timezone.now())
+            event, = claim_events(10)
+            self.assertEqual(process_event(event), 'done')
+        self.assertEqual([datum['StatisticValues']['Sum'] for datum in backend.datums], [1.0])
+
+    def test_trade_enqueues_event_in_same_transaction(self):
+        self.user.generated = 10
+        self.user.save()
+        self.client.force_login(self.user)
+
+        self.client.post('/energy/buyback/', {'amount': 2})
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.payload['transaction_type'], 'buyback')
+        self.assertEqual(event.payload['user']['energy_number'], 'EN1')
+        self.cloud.process_transaction_with_cloud.assert_not_called()
+
+    async def test_async_drain_settles_events_concurrently(self):
+        for amount in (1, 2, 3):
+            await sync_to_async(enqueue_cloud_transaction)(self.user, 'buyback', amount)
+        self.cloud.aprocess_transaction_with_cloud = mock.AsyncMock(side_effect=[
+            {'services_used': {'cloudwatch': {'ok': True}, 'lambda': {'ok': True}}},
+            {'services_used': {'cloudwatch': {'ok': True}, 'lambda': {'ok': False}}},
+            RuntimeError('endpoint down'),
+        ])
+
+        events = await sync_to_async(claim_events)(10)
+        statuses = await aprocess_events(events, 2)
+
+        self.assertEqual(statuses, ['done', 'pending', 'pending'])
+        retried = await OutboxEvent.objects.aget(id=events[1].id)
+        self.assertEqual(retried.payload['services'], ['lambda'])
+        failed = await OutboxEvent.objects.aget(id=events[2].id)
+        self.assertIn('endpoint down', failed.last_error)
+
+
+class MetricsBufferTests(TestCase):
+    def test_aggregates_statistic_sets_and_batches(self):
+        backend = StubMetricsBackend()
+        buffer = MetricsBuffer(backend, flush_interval=0, max_datums=2)
+        for value in (1, 4, 2):
+            buffer.record('Transaction_buyback', value)
+        buffer.record('Transaction_loan', 3)
+        buffer.record('Transaction_donation', 5)
+
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(len(backend.calls), 2)
+        stats = {d['MetricName']: d['StatisticValues'] for d in backend.datums}
+        self.assertEqual(stats['Transaction_buyback'], {'Sum': 7.0, 'SampleCount': 3, 'Minimum': 1.0, 'Maximum': 4.0})
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_stub_backend_keeps_only_the_latest_calls(self):
+        backend = StubMetricsBackend(max_calls=2)
+        for value in range(5):
+            backend.put_metric_data(Namespace='test', MetricData=[{'Value': value}])
+        self.assertEqual([datum['Value'] for datum in backend.datums], [3, 4])
+
+
+class CloudFanoutTests(TestCase):
+    def setUp(self):
+        self.manager = CloudServiceManager()
+        self.manager.use_aws = True
+        self.manager.s3_bucket = 'reports'
+        self.user = EnergyUser(energy_number='EN1', name='Alice', generated=5, consumed=2)
+
+    def handlers(self, delay=0.2, **outcomes):
+        def slow(ok, delay=delay):
+            def send(user, transaction_type, amount):
+                time.sleep(delay)
+                if ok is None:
+                    raise RuntimeError('boom')
+                return ok
+            return send
+        return mock.patch.object(self.manager, '_handlers', return_value={
+            name: slow(*outcomes.get(name, (True,))) for name in CloudServiceManager.SERVICES
+        })
+
+    def test_services_run_concurrently_and_failures_are_isolated(self):
+        runs = {
+            'sync': lambda: self.manager.process_transaction_with_cloud(self.user, 'buyback', 1.0),
+            'async': lambda: asyncio.run(self.manager.aprocess_transaction_with_cloud(self.user, 'buyback', 1.0)),
+        }
+        for mode, run in runs.items():
+            with self.subTest(mode), self.handlers(dynamodb=(None,), s3=(False,)):
+                started = time.monotonic()
+                result = run()
+                self.assertLess(time.monotonic() - started, 0.6)
+
+            used = result['services_used']
+            self.assertEqual({name: status['ok'] for name, status in used.items()},
+                             {'cloudwatch': True, 'lambda': True, 'dynamodb': False, 's3': False})
+            self.assertEqual(used['dynamodb']['error'], "RuntimeError('boom')")
+            self.assertGreaterEqual(used['lambda']['latency_ms'], 200)
+            self.assertEqual(result['message'], '2/4 AWS services used')
+
+    def test_unconfigured_s3_is_skipped_not_failed(self):
+        self.manager.s3_bucket = ''
+        with self.handlers(delay=0):
+            for _ in range(BREAKER_FAILURES):
+                result = self.manager.process_transaction_with_cloud(self.user, 'buyback', 1.0, services=['s3', 'cloudwatch'])
+        self.assertEqual(list(result['services_used']), ['cloudwatch'])
+        self.assertEqual(self.manager.breakers['s3'].state, 'closed')
+        self.assertNotIn('s3', self.manager.active_services())
+
+    def test_clients_are_built_lazily_from_one_session(self):
+        env = {'USE_REAL_AWS': 'True', 'AWS_ACCESS_KEY_ID': 'stub', 'AWS_SECRET_ACCESS_KEY': 'stub'}
+        with mock.patch.dict(os.environ, env):
+            manager = CloudServiceManager()
+        self.assertEqual(manager.clients.created, [])
+
+        self.assertEqual(manager.s3.meta.region_name, 'us-east-1')
+        self.assertEqual(manager.dynamodb.meta.service_model.service_name, 'dynamodb')
+        self.assertEqual(manager.clients.created, ['dynamodb', 's3'])
+        config = manager.clients.client('s3').meta.config
+        self.assertEqual(config.max_pool_connections, 32)
+        self.assertEqual(config.retries['mode'], 'adaptive')
+
+    def test_heavy_libraries_are_not_imported_at_startup(self):
+        script = (
+            "import sys, django; django.setup(); import energy.views; "
+            "print(sorted(m for m in ('boto3', 'botocore', 'reportlab', 'numpy', 'smart_energy_manager_lib') "
+            "if m in sys.modules))"
+        )
+        env = dict(os.environ, USE_REAL_AWS='True', DJANGO_SETTINGS_MODULE='energy_platform.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.stdout.strip(), '[]', result.stderr)
+
+    def test_fork_drops_clients_pool_and_buffers(self):
+        env = {'USE_REAL_AWS': 'True', 'AWS_ACCESS_KEY_ID': 'stub', 'AWS_SECRET_ACCESS_KEY': 'stub',
+               'CLOUDWATCH_FLUSH_INTERVAL': '0'}
+        with mock.patch.dict(os.environ, env):
+            manager = CloudServiceManager()
+        manager.clients.warm('s3')
+        manager.io_pool.submit(int).result()
+        manager.metrics.record('Transaction_loan', 1)
+        manager.backup.add(user_backup_item(EnergyUser(energy_number='EN1', name='Alice')))
+
+        manager.reset_after_fork()
+        self.assertEqual(manager.clients.created, [])
+        self.assertIsNone(manager._io_pool)
+        self.assertEqual(manager.metrics.flush(), 0)
+        self.assertEqual(manager.backup.flush(), 0)
+
+    def test_deadline_and_circuit_breaker(self):
+        self.manager.timeouts['s3'] = 0.05
+        self.manager.breakers['s3'] = CircuitBreaker(failures=2, reset_timeout=0.3)
+
+        with self.handlers(delay=0, s3=(True, 0.3)):
+            for _ in range(2):
+                started = time.monotonic()
+                used = self.manager.process_transaction_with_cloud(self.user, 'buyback', 1.0)['services_used']
+                self.assertLess(time.monotonic() - started, 0.25)
+                self.assertEqual(used['s3']['error'], 'timeout')
+            self.assertEqual(self.manager.breakers['s3'].state, 'open')
+            used = self.manager.process_transaction_with_cloud(self.user, 'buyback', 1.0)['services_used']
+            self.assertEqual(used['s3'], {'ok': False, 'latency_ms': 0.0, 'error': 'circuit open'})
+            self.assertTrue(used['cloudwatch']['ok'])
+
+        time.sleep(0.3)
+        with self.handlers(delay=0):
+            used = self.manager.process_transaction_with_cloud(self.user, 'buyback', 1.0)['services_used']
+        self.assertTrue(used['s3']['ok'])
+        self.assertEqual(self.manager.breakers['s3'].state, 'closed')
+
+
+class BackupWriterTests(TestCase):
+    def test_coalesces_per_energy_number_within_window(self):
+        client = InMemoryDynamoDB()
+        writer = BackupWriter(client, 'backup', window=60)
+        user = EnergyUser(energy_number='EN1', name='Alice', generated=5)
+        writer.add(user_backup_item(user, 'loan', 1))
+        user.generated = 7
+        writer.add(user_backup_item(user, 'loan', 2))
+
+        self.assertEqual(writer.flush(), 1)
+        item, = client.tables['backup'].values()
+        self.assertEqual(item['generated'], {'N': '7'})
+
+    def test_retries_unprocessed_items_in_chunks_of_25(self):
+        client = InMemoryDynamoDB(unprocessed_rounds=2)
+        writer = BackupWriter(client, 'backup', backoff=0)
+        items = [
+            user_backup_item(EnergyUser(energy_number=f'EN{i}', name='User'))
+            for i in range(60)
+        ]
+
+        self.assertEqual(writer.write_items(items), 60)
+        self.assertEqual(len(client.tables['backup']), 60)
+        self.assertEqual(client.calls, 5)
+
+    def test_backup_users_command_streams_snapshot(self):
+        for i in range(30):
+            EnergyUser.objects.create(energy_number=f'EN{i}', name='User')
+        out = StringIO()
+        call_command('backup_users', '--dry-run', '--chunk-size', '7', stdout=out)
+        self.assertIn('Backed up 30 users', out.getvalue())
+
+
+class MetricsEngineTests(TestCase):
+    def test_batch_matches_scalar_metrics(self):
+        generated = [10, 2.5, 0, 7]
+        consumed = [4, 5, 0, 7]
+        batch = compute_metrics_batch(generated, consumed)
+        for i, (g, c) in enumerate(zip(generated, consumed)):
+            expected = compute_metrics(g, c)
+            self.assertEqual({name: float(values[i]) for name, values in batch.items()}, expected)
+
+    def test_lambda_batches_carry_their_metrics(self):
+        client = mock.Mock()
+        batcher = LambdaBatcher(client, 'calc')
+        batcher.add({'user_name': 'Alice', 'generated': 10.0, 'consumed': 4.0})
+        batcher.add({'user_name': 'Bob', 'generated': 2.5, 'consumed': 5.0})
+        batcher.flush()
+        records = json.loads(client.invoke.call_args.kwargs['Payload'])['records']
+        self.assertEqual(records[0], {'user_name': 'Alice', 'generated': 10.0, 'consumed': 4.0, **compute_metrics(10, 4)})
+        self.assertEqual(records[1]['efficiency_percent'], 50.0)
+
+
+class StatementTests(TestCase):
+    def test_generate_statements_writes_one_pdf_per_user(self):
+        alice = EnergyUser.objects.create(energy_number='EN1', name='Alice')
+        bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+        for i in range(40):
+            Transaction.objects.create(from_user=alice, to_user=bob, amount=i + 1, transaction_type='loan')
+        today = timezone.now().date()
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            out = StringIO()
+            call_command(
+                'generate_statements', '--start', today.isoformat(), '--end', today.isoformat(),
+                '--output-dir', output_dir, stdout=out,
+            )
+            files = sorted(os.listdir(output_dir))
+
+        stamp = f'{today:%Y%m%d}'
+        self.assertEqual(files, [f'EN1_{stamp}_{stamp}.pdf', f'EN2_{stamp}_{stamp}.pdf'])
+        self.assertIn('Rendered 2 statements (80 transactions)', out.getvalue())
+
+
+class TradeServiceTests(TestCase):
+    def setUp(self):
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def test_loan_moves_energy_and_credits_atomically(self):
+        trade = execute_trade(self.alice, 'loan', 4, to_user=self.bob)
+
+        self.assertEqual(trade.credits_earned, 0.4)
+        self.assertEqual((self.alice.consumed, self.alice.surplus, self.alice.credits), (4, 6, 0.4))
+        self.bob.refresh_from_db()
+        self.assertEqual((self.bob.generated, self.bob.surplus), (4, 4))
+
+    def test_stale_surplus_is_rejected_without_side_effects(self):
+        stale = EnergyUser.objects.get(pk=self.alice.pk)
+        execute_trade(self.alice, 'buyback', 8)
+
+        with self.assertRaises(TradeError):
+            execute_trade(stale, 'donation', 5, to_user=self.bob)
+
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.generated, 0)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_concurrent_processes_conserve_balances(self):
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.trade_stress', '--processes', '4', '--trades', '50'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice')
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+        for i in range(5):
+            Transaction.objects.create(from_user=self.alice, to_user=self.bob, amount=i, transaction_type='loan')
+            Transaction.objects.create(from_user=self.bob, to_user=self.alice, amount=i, transaction_type='donation')
+        Transaction.objects.update(timestamp=timezone.now())
+
+    def test_keyset_pages_cover_sent_and_received_once(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = transaction_history(self.alice, cursor=cursor, limit=3)
+            seen += [(tx.id, tx.direction) for tx in page]
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), 10)
+        self.assertEqual([tx_id for tx_id, _ in seen], sorted((tx_id for tx_id, _ in seen), reverse=True))
+        self.assertEqual({direction for _, direction in seen}, {'sent', 'received'})
+
+    def test_history_api(self):
+        self.client.force_login(self.alice)
+        response = self.client.get('/energy/api/history/', {'limit': 4}).json()
+        self.assertEqual(len(response['results']), 4)
+        self.assertIsNotNone(response['next_cursor'])
+        self.assertEqual(self.client.get('/energy/api/history/', {'cursor': 'bogus'}).status_code, 400)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = EnergyUser.objects.create(energy_number='EN01001', name='Alice Smith')
+        EnergyUser.objects.create(energy_number='EN01002', name='Bob Jones')
+        EnergyUser.objects.create(energy_number='EN02001', name='Alicia Keys')
+        self.client.force_login(self.alice)
+
+    def search(self, query):
+        response = self.client.get('/energy/api/users/search/', {'q': query})
+        return sorted(user['energy_number'] for user in response.json()['results'])
+
+    def test_prefix_matches_name_and_energy_number(self):
+        self.assertEqual(self.search('EN01'), ['EN01002'])
+        self.assertEqual(self.search('ali'), ['EN02001'])
+        self.assertEqual(self.search('jon'), ['EN01002'])
+        self.assertEqual(self.search(''), [])
+
+    def test_search_index_follows_renames(self):
+        EnergyUser.objects.filter(energy_number='EN01002').update(name='Carol Jones')
+        self.assertEqual(self.search('carol'), ['EN01002'])
+
+    def test_prefix_fallback(self):
+        with mock.patch('accounts.search.fts_enabled', return_value=False):
+            self.assertEqual(self.search('en02'), ['EN02001'])
+            self.assertEqual(self.search('bob'), ['EN01002'])
+
+    def test_lowercase_energy_numbers_are_found_by_prefix(self):
+        EnergyUser.objects.create(energy_number='gb-meter7', name='Dana')
+        self.assertEqual(self.search('GB-met'), ['gb-meter7'])
+        cache.clear()
+        with mock.patch('accounts.search.fts_enabled', return_value=False):
+            self.assertEqual(self.search('GB-met'), ['gb-meter7'])
+            self.assertEqual(self.search('gb-m'), ['gb-meter7'])
+
+
+@override_settings(DASHBOARD_CACHE_ENABLED=True)
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def test_trades_and_updates_invalidate_cached_context(self):
+        self.client.force_login(self.bob)
+        before = dashboard_cache_stats()
+        self.client.get('/energy/')
+        response = self.client.get('/energy/')
+        after = dashboard_cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(response.context['recent_transactions'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_trade(self.alice, 'loan', 3, to_user=self.bob)
+        response = self.client.get('/energy/')
+        self.assertEqual(response.context['surplus'], 3)
+        self.assertEqual(response.context['recent_transactions'][0]['direction'], 'received')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/energy/update/', {'generated': 1, 'consumed': 0})
+        self.assertEqual(self.client.get('/energy/').context['surplus'], 1)
+
+    def test_enabled_by_default_only_with_a_shared_backend(self):
+        script = 'import django; django.setup(); from django.conf import settings; print(settings.DASHBOARD_CACHE_ENABLED)'
+        for backend, enabled in (('locmem', 'False'), ('db', 'True')):
+            env = dict(os.environ, CACHE_BACKEND=backend, DJANGO_SETTINGS_MODULE='energy_platform.settings')
+            env.pop('DASHBOARD_CACHE_ENABLED', None)
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+            )
+            self.assertEqual(result.stdout.strip(), enabled, result.stderr)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def request(self, method, path, data=None, user=None):
+        request = getattr(AsyncRequestFactory(), method)(path, data or {})
+        request.user = user or self.alice
+        request.session = SessionStore()
+        request._messages = default_storage(request)
+        return request
+
+    async def test_trade_and_dashboard_views(self):
+        response = await async_views.loan_view(self.request('post', '/energy/loan/', {'recipient': self.bob.id, 'amount': 4}))
+        self.assertEqual(response.url, '/energy/')
+        request = self.request('post', '/energy/donation/', {'energy_number': 'EN9', 'amount': 1})
+        response = await async_views.donation_view(request)
+        self.assertEqual(response.url, '/energy/donation/')
+        self.assertEqual([str(m) for m in get_messages(request)], ['Energy number EN9 not found'])
+
+        response = await async_views.dashboard(self.request('get', '/energy/', user=self.bob))
+        self.assertContains(response, 'Bob')
+        await self.alice.arefresh_from_db()
+        bob = await EnergyUser.objects.aget(id=self.bob.id)
+        self.assertEqual((self.alice.surplus, bob.surplus), (6, 4))
+        self.assertEqual(await Transaction.objects.acount(), 1)
+
+    async def test_anonymous_requests_redirect_to_login(self):
+        request = AsyncRequestFactory().get('/energy/buyback/')
+        request.user = AnonymousUser()
+        response = await async_views.buyback_view(request)
+        self.assertEqual(response.url, '/accounts/login/?next=/energy/buyback/')
+
+
+class MeterIngestTests(TestCase):
+    def setUp(self):
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=1)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob', is_admin=True)
+
+    def test_command_streams_batches_and_rolls_up_totals(self):
+        rows = ['energy_number,interval_start,generated_kwh,consumed_kwh']
+        rows += [f'EN1,2025-11-20T{hour:02d}:00:00,2.0,0.5' for hour in range(10)]
+        rows += ['EN9,2025-11-20T00:00:00,1,1', 'EN1,2025-11-20T00:00:00,2.0,0.5']
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('\n'.join(rows))
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('ingest_readings', f.name, '--batch-size', '4', stdout=out)
+
+        self.assertIn('Ingested 10 readings', out.getvalue())
+        self.assertIn('1 duplicates, 1 unknown users', out.getvalue())
+        self.alice.refresh_from_db()
+        self.assertEqual((self.alice.generated, self.alice.consumed, self.alice.surplus), (21, 5, 16))
+
+    def test_rejects_non_finite_and_negative_readings(self):
+        rows = [('EN1', '2025-11-20T00:00:00', value, '0') for value in ('nan', 'inf', '-1', '1e400', '2')]
+        stats = ingest.ingest_readings(rows)
+        self.assertEqual((stats['inserted'], stats['invalid']), (1, 4))
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.generated, 3)
+
+    def test_malformed_rows_are_counted_invalid(self):
+        csv_rows = list(ingest.parse_csv([
+            'energy_number,interval_start,generated_kwh,consumed_kwh', 'EN1,2025-11-20T00:00:00', 'EN1,2025-11-20T01:00:00,1,0',
+        ]))
+        ndjson_rows = list(ingest.parse_ndjson([
+            '[1, 2]', '5', json.dumps({'energy_number': ['EN1'], 'interval_start': '2025-11-20T02:00:00'}),
+            json.dumps({'energy_number': {'EN': 1}, 'interval_start': '2025-11-20T02:00:00'}),
+            json.dumps({'energy_number': 'EN1', 'interval_start': ['2025-11-20T02:00:00'], 'generated_kwh': 1}),
+        ]))
+        stats = ingest.ingest_readings(csv_rows + ndjson_rows)
+        self.assertEqual((stats['inserted'], stats['invalid']), (1, 6))
+
+        self.client.force_login(self.bob)
+        response = self.client.post('/energy/api/readings/', '[1, 2]\n{"energy_number": ["EN1"]}', content_type='application/x-ndjson')
+        self.assertEqual((response.status_code, response.json()['invalid']), (200, 2))
+        response = self.client.post(
+            '/energy/api/readings/', 'energy_number,interval_start,generated_kwh,consumed_kwh\nEN1', content_type='text/csv',
+        )
+        self.assertEqual((response.status_code, response.json()['invalid']), (200, 1))
+
+    def test_concurrent_duplicate_is_retried_and_reported(self):
+        interval = timezone.datetime(2025, 11, 20, tzinfo=timezone.utc)
+        MeterReading.objects.create(user=self.alice, interval_start=interval, generated_kwh=2)
+        rows = [('EN1', interval, '2', '0'), ('EN1', interval + timezone.timedelta(hours=1), '2', '0')]
+
+        # The first check misses the reading, as if another ingest committed it just after.
+        real = ingest._existing_readings
+        with mock.patch('energy.ingest._existing_readings') as existing:
+            existing.side_effect = lambda parsed: set() if existing.call_count == 1 else real(parsed)
+            stats = ingest.ingest_readings(rows)
+        self.assertEqual(existing.call_count, 2)
+        self.assertEqual((stats['inserted'], stats['duplicates']), (1, 1))
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.generated, 3)
+
+    def test_bulk_endpoint_accepts_ndjson_from_staff_only(self):
+        body = '\n'.join(
+            json.dumps({'energy_number': 'EN2', 'interval_start': f'2025-11-20T0{i}:00:00Z', 'consumed_kwh': 1})
+            for i in range(3)
+        )
+        self.client.force_login(self.alice)
+        response = self.client.post('/energy/api/readings/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.bob)
+        response = self.client.post('/energy/api/readings/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['inserted'], 3)
+        self.assertEqual(MeterReading.objects.filter(user=self.bob).count(), 3)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob', is_admin=True)
+        self.day = timezone.datetime(2025, 11, 20, tzinfo=timezone.utc)
+
+    def add_readings(self, user, hours):
+        MeterReading.objects.bulk_create([
+            MeterReading(user=user, interval_start=self.day + timezone.timedelta(hours=h), generated_kwh=2, consumed_kwh=1)
+            for h in hours
+        ])
+
+    def test_incremental_job_follows_watermark(self):
+        self.add_readings(self.alice, [0, 0.5, 1])
+        self.add_readings(self.bob, [1])
+        tx = Transaction.objects.create(from_user=self.alice, to_user=self.bob, amount=3, transaction_type='loan')
+        Transaction.objects.filter(id=tx.id).update(timestamp=self.day + timezone.timedelta(hours=1, minutes=5))
+
+        self.assertEqual(update_rollups(batch_size=2)['readings'], 4)
+        self.add_readings(self.alice, [23])
+        self.assertEqual(update_rollups()['readings'], 1)
+        self.assertEqual(update_rollups()['readings'], 0)
+
+        day = rollup_series('day', *day_bounds(self.day.date(), self.day.date()), user=self.alice)
+        self.assertEqual(len(day), 1)
+        self.assertEqual((day[0]['generated'], day[0]['generated_count'], day[0]['loan']), (8, 4, 3))
+        hours = rollup_series('hour', user=self.alice)
+        self.assertEqual([point['consumed'] for point in hours], [2, 1, 1])
+        platform = rollup_series('day', user=None)
+        self.assertEqual((platform[0]['generated'], platform[0]['loan_count']), (10, 1))
+
+    def test_recipients_are_credited_and_late_commits_are_picked_up(self):
+        tx = Transaction.objects.create(from_user=self.alice, to_user=self.bob, amount=3, transaction_type='donation')
+        Transaction.objects.filter(id=tx.id).update(timestamp=self.day)
+        self.add_readings(self.alice, [0, 1, 2])
+        # The middle reading's id was taken by a transaction that commits after this run.
+        late = MeterReading.objects.order_by('id')[1]
+        late_id = late.id
+        late.delete()
+        self.assertEqual(update_rollups()['readings'], 2)
+        self.assertEqual(RollupWatermark.objects.get(name='readings').gaps[0][0], late_id)
+
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertEqual(update_rollups()['readings'], 1)
+        self.assertEqual(RollupWatermark.objects.get(name='readings').gaps, [])
+        self.assertEqual(rollup_series('day', user=self.alice)[0]['generated_count'], 3)
+
+        bob = rollup_series('day', user=self.bob)[0]
+        self.assertEqual((bob['donation'], bob['donation_received'], bob['donation_received_count']), (0, 3, 1))
+        self.assertEqual(rollup_series('day', user=self.alice)[0]['donation'], 3)
+        platform = rollup_series('day', user=None)[0]
+        self.assertEqual((platform['donation'], platform['donation_received']), (3, 0))
+
+    def test_rebuild_replaces_range_and_api_scopes_platform_to_staff(self):
+        self.add_readings(self.alice, [0, 1])
+        update_rollups()
+        MeterReading.objects.filter(user=self.alice).update(generated_kwh=5)
+        EnergyRollup.objects.filter(metric='consumed').delete()
+        rebuild_rollups(*day_bounds(self.day.date(), self.day.date()))
+        self.assertEqual(rollup_series('day', user=self.alice)[0]['generated'], 10)
+        self.assertEqual(rollup_series('day', user=self.alice)[0]['consumed'], 2)
+
+        self.client.force_login(self.alice)
+        url = '/energy/api/rollups/?period=day&start=2025-11-20&end=2025-11-20'
+        self.assertEqual(self.client.get(url).json()['results'][0]['generated'], 10)
+        self.assertEqual(self.client.get(url + '&scope=platform').status_code, 403)
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get(url + '&scope=platform').json()['results'][0]['generated_count'], 2)
+
+
+class MatchingEngineTests(TestCase):
+    def test_price_time_priority_and_limits(self):
+        orders = [
+            (1, 10, 'ask', 0.20, 5.0),
+            (2, 11, 'ask', 0.10, 2.0),
+            (3, 12, 'ask', 0.10, 2.0),
+            (4, 20, 'bid', 0.25, 3.0),
+            (5, 21, 'bid', 0.15, 4.0),
+            (6, 10, 'bid', 0.30, 1.0),
+        ]
+        fills, cancelled = replay(orders)
+        self.assertEqual(fills, replay(orders)[0])
+        self.assertEqual([(f.bid_id, f.ask_id, f.price, f.quantity) for f in fills], [
+            (6, 2, 0.10, 1.0), (4, 2, 0.10, 1.0), (4, 3, 0.10, 2.0),
+        ])
+        self.assertEqual(cancelled, [])
+
+        fills, cancelled = replay(orders[:2] + [(4, 20, 'bid', 0.25, 3.0)], surplus={10: 5, 11: 0.5}, credits={20: 0.3})
+        self.assertEqual([(f.ask_id, f.quantity) for f in fills], [(2, 0.5), (1, 1.25)])
+        self.assertEqual([order.id for order in cancelled], [2, 4])
+
+    def test_round_persists_fills_in_bulk(self):
+        seller = EnergyUser.objects.create(energy_number='EN1', name='Seller', generated=10)
+        buyer = EnergyUser.objects.create(energy_number='EN2', name='Buyer', credits=5)
+        place_order(seller, 'ask', 4, 0.5)
+        with self.assertRaises(TradeError):
+            place_order(seller, 'ask', 7, 0.5)
+        bid = place_order(buyer, 'bid', 6, 0.6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = run_matching_round()
+        self.assertEqual((stats['fills'], stats['volume']), (1, 4))
+        seller.refresh_from_db()
+        buyer.refresh_from_db()
+        self.assertEqual((seller.surplus, seller.credits), (6, 2))
+        self.assertEqual((buyer.generated, buyer.credits), (4, 3))
+        trade = Transaction.objects.get(transaction_type='trade')
+        self.assertEqual((trade.from_user, trade.to_user, trade.price), (seller, buyer, 0.5))
+        bid.refresh_from_db()
+        self.assertEqual((bid.status, bid.remaining), ('open', 2))
+        self.assertEqual(Order.objects.get(side='ask').status, 'filled')
+
+        self.client.force_login(buyer)
+        self.client.post(f'/energy/market/orders/{bid.id}/cancel/')
+        bid.refresh_from_db()
+        self.assertEqual(bid.status, 'cancelled')
+        self.assertContains(self.client.get('/energy/market/'), 'No open orders')
+
+    def test_order_cancelled_mid_round_abandons_the_round(self):
+        seller = EnergyUser.objects.create(energy_number='EN1', name='Seller', generated=10)
+        buyer = EnergyUser.objects.create(energy_number='EN2', name='Buyer', credits=5)
+        ask = place_order(seller, 'ask', 4, 0.5)
+        place_order(buyer, 'bid', 4, 0.5)
+
+        def read_then_cancel(lock=False):
+            book = open_book(lock)
+            cancel_order(seller, ask.id)
+            return book
+
+        with mock.patch('energy.matching.open_book', side_effect=read_then_cancel):
+            with self.assertRaises(MatchingConflict):
+                run_matching_round()
+        self.assertFalse(Transaction.objects.exists())
+        seller.refresh_from_db()
+        self.assertEqual((seller.surplus, seller.credits), (10, 0))
+
+    def test_matcher_retries_after_a_locked_database(self):
+        rounds = [OperationalError('database is locked'), {'orders': 2, 'fills': 1, 'volume': 4.0}, KeyboardInterrupt]
+        out, err = StringIO(), StringIO()
+        with mock.patch('energy.management.commands.match_orders.run_matching_round', side_effect=rounds), \
+                mock.patch('energy.management.commands.match_orders.time.sleep'), \
+                mock.patch('energy.management.commands.match_orders.signal.signal'):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('match_orders', '--interval', '0', stdout=out, stderr=err)
+        self.assertIn('Round failed: database is locked', err.getvalue())
+        self.assertIn('Matched 1 fills', out.getvalue())
+
+
+@override_settings(TRADE_SETTLEMENT_MODE='batch')
+class BatchSettlementTests(TestCase):
+    def setUp(self):
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def test_views_queue_and_batch_nets_deltas(self):
+        self.client.force_login(self.alice)
+        self.client.post('/energy/loan/', {'recipient': self.bob.id, 'amount': 4})
+        self.client.post('/energy/buyback/', {'amount': 5})
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.surplus, 10)
+        self.assertEqual(TradeIntent.objects.filter(status='pending').count(), 2)
+        response = self.client.post('/energy/buyback/', {'amount': 2}, follow=True)
+        self.assertContains(response, 'Insufficient surplus energy')
+
+        # A stale intent beyond the live surplus is rejected, not applied.
+        TradeIntent.objects.create(from_user=self.alice, transaction_type='donation', to_user=self.bob, amount=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(settle_batch(), {'settled': 2, 'rejected': 1})
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.alice.consumed, self.alice.surplus), (9, 1))
+        self.assertAlmostEqual(self.alice.credits, 4 * 0.10 + 5 * 0.15)
+        self.assertEqual((self.bob.generated, self.bob.surplus), (4, 4))
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(TradeIntent.objects.get(status='rejected').error, 'Insufficient surplus energy')
+        self.assertEqual(settle_batch(), {'settled': 0, 'rejected': 0})
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    def route(self, request, write=False):
+        seen = {}
+
+        def view(request):
+            seen['before'] = router.db_for_read(EnergyUser)
+            if write:
+                router.db_for_write(EnergyUser)
+                seen['after'] = router.db_for_read(EnergyUser)
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(view)(request)
+        return seen, response
+
+    def test_reads_go_to_replica_until_a_write_pins_the_client(self):
+        factory = RequestFactory()
+        self.assertEqual(router.db_for_read(EnergyUser), 'default')
+
+        seen, response = self.route(factory.get('/energy/'))
+        self.assertEqual(seen['before'], 'replica_0')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        seen, response = self.route(factory.get('/energy/'), write=True)
+        self.assertEqual((seen['before'], seen['after']), ('replica_0', 'default'))
+        pin = response.cookies[PIN_COOKIE].value
+
+        seen, _ = self.route(factory.post('/energy/loan/'))
+        self.assertEqual(seen['before'], 'default')
+        pinned = factory.get('/energy/')
+        pinned.COOKIES[PIN_COOKIE] = pin
+        self.assertEqual(self.route(pinned)[0]['before'], 'default')
+
+    def test_async_requests_route_and_pin_without_a_thread_hop(self):
+        seen = {}
+
+        async def view(request):
+            seen['before'] = await sync_to_async(router.db_for_read)(EnergyUser)
+            await sync_to_async(router.db_for_write)(EnergyUser)
+            seen['after'] = router.db_for_read(EnergyUser)
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/energy/'))
+        self.assertEqual((seen['before'], seen['after']), ('replica_0', 'default'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_two_sqlite_files_as_primary_and_replica(self):
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.replica_routing'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+class SqliteWriterLockTests(TestCase):
+    def connect(self, path, mode='IMMEDIATE'):
+        from energy_platform.sqlite.base import DatabaseWrapper
+        wrapper = DatabaseWrapper(dict(
+            connection.settings_dict, NAME=path,
+            OPTIONS={'transaction_mode': mode, 'pragmas': {'busy_timeout': 100}},
+        ), alias='writer_lock_test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def test_writer_waits_up_to_busy_timeout_then_fails(self):
+        path = os.path.join(tempfile.mkdtemp(), 'lock.sqlite3')
+        holder = self.connect(path)
+        holder._start_transaction_under_autocommit()
+        self.addCleanup(holder._rollback)
+
+        writer = self.connect(path)
+        started = time.monotonic()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            writer._start_transaction_under_autocommit()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+        # A deferred transaction does not queue on the writer lock.
+        reader = self.connect(path, mode='DEFERRED')
+        reader._start_transaction_under_autocommit()
+        reader._rollback()
+
+
+@override_settings(PERF_METRICS_DIR='', PERF_METRICS_TOKEN='')
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        perf.recorder.reset()
+        self.addCleanup(perf.recorder.reset)
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def test_hdr_buckets_keep_relative_error_small(self):
+        histogram = perf.Histogram(bounds=(0, 63, 100000))
+        for value in range(1, 100001):
+            histogram.record(value)
+            low, high = perf.bucket_bounds(perf.bucket_index(value))
+            self.assertTrue(low <= value < high)
+        for q in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q) / (q * 100000), 1, delta=0.035)
+        self.assertEqual(histogram.cumulative([0, 63, 100000]), [0, 63, 100000])
+
+    def test_exposition_buckets_count_values_on_the_bound(self):
+        # 1000us and 1001us share an HDR bucket; le="0.001" must hold only the first.
+        for value in (1000, 1000.5, 2500, 2501):
+            perf.recorder.record('request_duration_seconds', 'energy:dashboard', value)
+        body = perf.render_prometheus(perf.recorder.snapshot())
+        self.assertIn('energy_request_duration_seconds_bucket{view="energy:dashboard",le="0.001"} 1', body)
+        self.assertIn('energy_request_duration_seconds_bucket{view="energy:dashboard",le="0.0025"} 3', body)
+        self.assertIn('energy_request_duration_seconds_bucket{view="energy:dashboard",le="0.005"} 4', body)
+
+        histogram = perf.Histogram()
+        for value in (1000, 1001):
+            histogram.record(value)
+        self.assertEqual(histogram.cumulative([999, 1000, 1007]), [0, 0, 2])
+
+    def test_metrics_endpoint_reports_per_view_timings(self):
+        self.client.force_login(self.alice)
+        self.client.get('/energy/')
+        self.client.post('/energy/loan/', {'recipient': self.bob.id, 'amount': 2})
+
+        snapshot = perf.recorder.snapshot()
+        self.assertGreater(snapshot[('request_db_queries', 'energy:loan')].total, 2)
+        self.assertGreater(snapshot[('request_db_duration_seconds', 'energy:loan')].total, 0)
+        self.assertGreater(snapshot[('request_cloud_duration_seconds', 'energy:loan')].total, 0)
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.bob)
+        EnergyUser.objects.filter(pk=self.bob.pk).update(is_admin=True)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('energy_request_duration_seconds_count{view="energy:dashboard"} 1', body)
+        self.assertIn('energy_request_db_queries_bucket{view="energy:loan",le="+Inf"} 1', body)
+        self.assertIn('energy_request_latency_quantile_seconds{view="energy:loan",quantile="0.99"}', body)
+        with override_settings(PERF_METRICS_TOKEN='secret'):
+            self.client.logout()
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_async_requests_are_timed_without_a_thread_hop(self):
+        async def view(request):
+            await EnergyUser.objects.acount()
+            return HttpResponse()
+
+        middleware = perf.PerformanceMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(AsyncRequestFactory().get('/'))
+        snapshot = perf.recorder.snapshot()
+        self.assertEqual(snapshot[('request_db_queries', 'unmatched')].total, 1)
+        self.assertGreater(snapshot[('request_db_duration_seconds', 'unmatched')].total, 0)
+
+    def test_file_store_merges_workers(self):
+        directory = tempfile.mkdtemp()
+        other = perf.Histogram()
+        other.record(5000)
+        with open(os.path.join(directory, '999999.json'), 'w') as f:
+            json.dump([['request_duration_seconds', 'energy:dashboard', other.to_dict()]], f)
+
+        with override_settings(PERF_METRICS_DIR=directory):
+            self.client.force_login(self.alice)
+            self.client.get('/energy/')
+            merged = perf.collect()
+            perf.FileStore(directory).clear()
+        self.assertEqual(merged[('request_duration_seconds', 'energy:dashboard')].count, 2)
+        self.assertEqual(os.listdir(directory), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.alice = EnergyUser.objects.create(energy_number='EN1', name='Alice', generated=10, is_admin=True)
+        self.bob = EnergyUser.objects.create(energy_number='EN2', name='Bob')
+
+    def read(self, filename):
+        with open(os.path.join(self.directory, filename)) as f:
+            return f.read()
+
+    def test_admin_header_writes_a_profile(self):
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_FORMAT='speedscope'):
+            self.client.force_login(self.bob)
+            response = self.client.get('/energy/', HTTP_X_PROFILE='1')
+            self.assertFalse(response.has_header('X-Profile'))
+
+            self.client.force_login(self.alice)
+            response = self.client.post('/energy/loan/', {'recipient': self.bob.id, 'amount': 2}, HTTP_X_PROFILE='1')
+        profile = json.loads(self.read(response['X-Profile']))
+        self.assertEqual(profile['name'], 'energy:loan')
+        self.assertEqual(os.listdir(self.directory), [response['X-Profile']])
+
+    def test_async_requests_skip_the_thread_hop(self):
+        async def view(request):
+            await asyncio.sleep(0.02)
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = AsyncRequestFactory()
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_FORMAT='collapsed'):
+            for user, profiled in ((self.bob, False), (self.alice, True)):
+                request = factory.get('/energy/', headers={'X-Profile': '1'})
+                request.user = user
+                response = async_to_sync(middleware)(request)
+                self.assertEqual(response.has_header('X-Profile'), profiled)
+        self.assertEqual(os.listdir(self.directory), [response['X-Profile']])
+
+    def test_spans_follow_calls_onto_pool_threads(self):
+        def work():
+            with profiling.span('inner'):
+                time.sleep(0.05)
+
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_FORMAT='collapsed', PROFILE_INTERVAL=0.002):
+            with profiling.capture('job') as profile, ThreadPoolExecutor(1) as pool:
+                pool.submit(profiling.traced('outer', work)).result()
+                pool.submit(work).result()
+        stacks = self.read(profile.filename).splitlines()
+        self.assertTrue(any(';[outer];work (energy/tests.py:' in stack and ';[inner]' in stack for stack in stacks))
+        # The untraced call never joined the profile.
+        self.assertEqual(sum(';[inner]' in stack and ';[outer]' not in stack for stack in stacks), 0)
+        self.assertIs(profiling.traced('outer', work), work)
+
+
+class LoadTestTests(TestCase):
+    def test_trading_flows_run_clean_over_http(self):
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.load_test', '--users', '10', '--transactions', '200',
+             '--clients', '2', '--iterations', '6', '--transport', 'http'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(report['errors'], 0)
+        self.assertIn('POST /accounts/login/', report['endpoints'])
+        self.assertIn('GET /energy/', report['endpoints'])
@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'energy'
 
+trade_views = async_views if settings.ENERGY_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.dashboard, name='dashboard'),
+    path('', trade_views.dashboard, name='dashboard'),
     path('update/', views.update_energy, name='update_energy'),
-    path('buyback/', views.buyback_view, name='buyback'),
-    path('loan/', views.loan_view, name='loan'),
-    path('donation/', views.donation_view, name='donation'),
+    path('buyback/', trade_views.buyback_view, name='buyback'),
+    path('loan/', trade_views.loan_view, name='loan'),
+    path('donation/', trade_views.donation_view, name='donation'),
+    path('history/', views.history, name='history'),
+    path('market/', views.market_view, name='market'),
+    path('market/orders/<int:order_id>/cancel/', views.cancel_order_view, name='cancel_order'),
+    path('api/history/', views.history_api, name='history_api'),
+    path('api/users/search/', views.user_search, name='user_search'),
+    path('api/readings/', views.ingest_readings_api, name='ingest_readings'),
+    path('api/rollups/', views.rollups_api, name='rollups_api'),
 ]
@@ -1,26 +1,62 @@
+import codecs
+from django.db import IntegrityError
 from django.shortcuts import render, redirect
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
+from django.utils.dateparse import parse_date
 from accounts.models import EnergyUser
-from .models import Transaction
-from .cloud_services import cloud_manager
+from accounts.search import search_users
+from .cache import dashboard_context
+from .history import MAX_PAGE_SIZE, PAGE_SIZE, transaction_history
+from .ingest import PARSERS, IngestError, ingest_readings
+from .matching import book_depth, cancel_order, place_order
+from .rollups import ROLLUP_PERIODS, day_bounds, rollup_series
+from .services import TradeError
+from .settlement import submit_trade
 
 @login_required
 def dashboard(request):
     user = request.user
-    surplus = user.calculate_surplus()
-    deficit = user.calculate_deficit()
-    recent_transactions = Transaction.objects.filter(from_user=user)[:10]
-    
-    context = {
-        'user': user,
-        'surplus': surplus,
-        'deficit': deficit,
-        'recent_transactions': recent_transactions,
-    }
+    context = dict(dashboard_context(user), user=user)
     return render(request, 'energy/dashboard.html', context)
 
+def _history_page(request):
+    try:
+        limit = min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    return transaction_history(request.user, cursor=request.GET.get('cursor') or None, limit=max(limit, 1))
+
+@login_required
+def history(request):
+    try:
+        transactions, next_cursor = _history_page(request)
+    except ValueError:
+        messages.error(request, 'Invalid page')
+        return redirect('energy:history')
+    
+    context = {'user': request.user, 'transactions': transactions, 'next_cursor': next_cursor}
+    return render(request, 'energy/history.html', context)
+
+@login_required
+def history_api(request):
+    try:
+        transactions, next_cursor = _history_page(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    results = [{
+        'id': tx.id,
+        'transaction_type': tx.transaction_type,
+        'amount': tx.amount,
+        'direction': tx.direction,
+        'counterparty': tx.counterparty.energy_number if tx.counterparty else None,
+        'timestamp': tx.timestamp.isoformat(),
+    } for tx in transactions]
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
 @login_required
 def update_energy(request):
     user = request.user
@@ -31,7 +67,7 @@ def update_energy(request):
         
         user.generated = generated
         user.consumed = consumed
-        user.save()
+        user.save(update_fields=['generated', 'consumed'])
         
         messages.success(request, 'Energy data updated')
         return redirect('energy:dashboard')
@@ -59,28 +95,16 @@ def buyback_view(request):
             messages.error(request, 'Invalid amount')
             return redirect('energy:buyback')
         
-        buyback_rate = 0.15
-        credits_earned = kwh_amount * buyback_rate
-        
-        with transaction.atomic():
-            user.consumed += kwh_amount
-            user.credits += credits_earned
-            user.save()
-            
-            Transaction.objects.create(
-                from_user=user,
-                amount=kwh_amount,
-                transaction_type='buyback'
-            )
-            
-            try:
-                result = cloud_manager.process_transaction_with_cloud(
-                    user, 'buyback', kwh_amount
-                )
-                messages.success(request, f'Buyback successful: {kwh_amount} kWh for {credits_earned} credits. {result["message"]}')
-            except:
-                messages.success(request, f'Buyback successful: {kwh_amount} kWh for {credits_earned} credits')
+        try:
+            trade = submit_trade(user, 'buyback', kwh_amount)
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:buyback')
         
+        if trade.queued:
+            messages.success(request, f'Buyback of {kwh_amount} kWh queued for settlement')
+        else:
+            messages.success(request, f'Buyback successful: {kwh_amount} kWh for {trade.credits_earned} credits')
         return redirect('energy:dashboard')
     
     context = {'user': user, 'surplus': surplus}
@@ -90,52 +114,47 @@ def buyback_view(request):
 def loan_view(request):
     user = request.user
     surplus = user.calculate_surplus()
-    other_users = EnergyUser.objects.exclude(id=user.id)
     
     if request.method == 'POST':
         if surplus <= 0:
             messages.error(request, 'No surplus energy available')
             return redirect('energy:loan')
         
-        recipient_id = int(request.POST.get('recipient'))
+        try:
+            recipient_id = int(request.POST.get('recipient', ''))
+        except ValueError:
+            messages.error(request, 'Select a recipient')
+            return redirect('energy:loan')
         kwh_amount = float(request.POST.get('amount', 0))
         
         if kwh_amount <= 0 or kwh_amount > surplus:
             messages.error(request, 'Invalid amount')
             return redirect('energy:loan')
         
-        recipient = EnergyUser.objects.get(id=recipient_id)
-        loan_rate = 0.10
-        credits_earned = kwh_amount * loan_rate
-        
-        with transaction.atomic():
-            user.consumed += kwh_amount
-            user.credits += credits_earned
-            user.save()
-            
-            recipient.generated += kwh_amount
-            recipient.save()
-            
-            Transaction.objects.create(
-                from_user=user,
-                to_user=recipient,
-                amount=kwh_amount,
-                transaction_type='loan'
-            )
-            
-            try:
-                result = cloud_manager.process_transaction_with_cloud(
-                    user, 'loan', kwh_amount
-                )
-                messages.success(request, f'Loan successful: {kwh_amount} kWh to {recipient.name}. {result["message"]}')
-            except:
-                messages.success(request, f'Loan successful: {kwh_amount} kWh to {recipient.name}')
+        try:
+            recipient = EnergyUser.objects.get(id=recipient_id)
+            trade = submit_trade(user, 'loan', kwh_amount, to_user=recipient)
+        except EnergyUser.DoesNotExist:
+            messages.error(request, 'Recipient not found')
+            return redirect('energy:loan')
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:loan')
         
+        if trade.queued:
+            messages.success(request, f'Loan of {kwh_amount} kWh to {recipient.name} queued for settlement')
+        else:
+            messages.success(request, f'Loan successful: {kwh_amount} kWh to {recipient.name}')
         return redirect('energy:dashboard')
     
-    context = {'user': user, 'surplus': surplus, 'other_users': other_users}
+    context = {'user': user, 'surplus': surplus}
     return render(request, 'energy/loan.html', context)
 
+@login_required
+def user_search(request):
+    results = search_users(request.GET.get('q', ''), exclude_id=request.user.id)
+    return JsonResponse({'results': results})
+
 @login_required
 def donation_view(request):
     user = request.user
@@ -160,33 +179,98 @@ def donation_view(request):
                 messages.error(request, 'Cannot donate to yourself')
                 return redirect('energy:donation')
             
-            with transaction.atomic():
-                user.consumed += kwh_amount
-                user.save()
-                
-                recipient.generated += kwh_amount
-                recipient.save()
-                
-                Transaction.objects.create(
-                    from_user=user,
-                    to_user=recipient,
-                    amount=kwh_amount,
-                    transaction_type='donation'
-                )
-                
-                try:
-                    result = cloud_manager.process_transaction_with_cloud(
-                        user, 'donation', kwh_amount
-                    )
-                    messages.success(request, f'Donation successful: {kwh_amount} kWh donated to {recipient.name}. {result["message"]}')
-                except:
-                    messages.success(request, f'Donation successful: {kwh_amount} kWh donated to {recipient.name}')
-            
+            trade = submit_trade(user, 'donation', kwh_amount, to_user=recipient)
+            if trade.queued:
+                messages.success(request, f'Donation of {kwh_amount} kWh to {recipient.name} queued for settlement')
+            else:
+                messages.success(request, f'Donation successful: {kwh_amount} kWh donated to {recipient.name}')
             return redirect('energy:dashboard')
             
         except EnergyUser.DoesNotExist:
             messages.error(request, f'Energy number {recipient_energy_number} not found')
             return redirect('energy:donation')
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:donation')
     
     context = {'user': user, 'surplus': surplus}
     return render(request, 'energy/donation.html', context)
+
+@login_required
+def market_view(request):
+    user = request.user
+    
+    if request.method == 'POST':
+        side = request.POST.get('side', '')
+        try:
+            quantity = float(request.POST.get('quantity', 0))
+            price = float(request.POST.get('price', 0))
+        except ValueError:
+            messages.error(request, 'Invalid amount')
+            return redirect('energy:market')
+        
+        try:
+            place_order(user, side, quantity, price)
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('energy:market')
+        
+        messages.success(request, f'{"Bid" if side == "bid" else "Ask"} placed: {quantity} kWh at {price} credits/kWh')
+        return redirect('energy:market')
+    
+    context = {
+        'user': user,
+        'surplus': user.calculate_surplus(),
+        'orders': user.orders.filter(status='open'),
+        'depth': book_depth(),
+    }
+    return render(request, 'energy/market.html', context)
+
+@login_required
+@require_POST
+def cancel_order_view(request, order_id):
+    if cancel_order(request.user, order_id):
+        messages.success(request, 'Order cancelled')
+    else:
+        messages.error(request, 'Order not found')
+    return redirect('energy:market')
+
+@login_required
+@require_POST
+def ingest_readings_api(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+    
+    content_type = request.content_type or ''
+    fmt = 'ndjson' if 'ndjson' in content_type or 'jsonl' in content_type else 'csv'
+    lines = codecs.iterdecode(request, 'utf-8')
+    try:
+        totals = ingest_readings(PARSERS[fmt](lines))
+    except (IngestError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except IntegrityError:
+        # Still racing another upload of the same readings after the retries.
+        return JsonResponse({'error': 'Conflicting concurrent ingest, retry the request'}, status=409)
+    return JsonResponse(totals)
+
+@login_required
+def rollups_api(request):
+    period = request.GET.get('period', 'day')
+    if period not in ROLLUP_PERIODS:
+        return JsonResponse({'error': f"period must be one of {', '.join(ROLLUP_PERIODS)}"}, status=400)
+    try:
+        start_day, end_day = parse_date(request.GET.get('start', '')), parse_date(request.GET.get('end', ''))
+    except ValueError:
+        start_day = end_day = None
+    if start_day is None or end_day is None or end_day < start_day:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates with start <= end'}, status=400)
+    
+    user = request.user
+    if request.GET.get('scope') == 'platform':
+        if not user.is_staff:
+            return JsonResponse({'error': 'Staff access required'}, status=403)
+        user = None
+    series = rollup_series(period, *day_bounds(start_day, end_day), user=user)
+    for point in series:
+        point['bucket'] = point['bucket'].isoformat()
+    return JsonResponse({'period': period, 'results': series})
@@ -0,0 +1,392 @@
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Log-linear buckets in the style of HdrHistogram: values below 2 * SUB_BUCKETS
+# are exact, above that each power of two is split into SUB_BUCKETS, so a
+# recorded value is off by at most 1 / SUB_BUCKETS (about 3%).
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name -> (help, unit scale, exposition buckets); durations are recorded in
+# microseconds and exported in seconds.
+METRICS = {
+    'request_duration_seconds': ('Wall time per request', 1e-6, SECONDS_BUCKETS),
+    'request_db_duration_seconds': ('Time spent in database queries per request', 1e-6, SECONDS_BUCKETS),
+    'request_db_queries': ('Database queries per request', 1, QUERY_BUCKETS),
+    'request_cloud_duration_seconds': ('Time spent in cloud_manager per request', 1e-6, SECONDS_BUCKETS),
+}
+PREFIX = 'energy_'
+# Exposition buckets in recorded units; each histogram counts these exactly,
+# since an HDR bucket can straddle a bound.
+RAW_BOUNDS = {
+    metric: tuple(round(bound / scale) for bound in bounds) for metric, (_, scale, bounds) in METRICS.items()
+}
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+def bucket_bounds(index):
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'bounds', 'le')
+
+    def __init__(self, counts=None, count=0, total=0, bounds=(), le=None):
+        self.counts = counts or {}
+        self.count = count
+        self.total = total
+        # Values per exposition bound: le[i] counts bounds[i - 1] < value <= bounds[i].
+        self.bounds = tuple(bounds)
+        self.le = le or [0] * len(self.bounds)
+
+    def record(self, value):
+        value = max(value, 0)
+        position = bisect_left(self.bounds, value)
+        if position < len(self.bounds):
+            self.le[position] += 1
+        value = int(value)
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            # An empty histogram takes on the other's bounds; mixed bounds
+            # fall back to the HDR buckets.
+            if self.count:
+                self.bounds, self.le = (), []
+            else:
+                self.bounds, self.le = other.bounds, [0] * len(other.bounds)
+        if self.bounds:
+            self.le = [mine + theirs for mine, theirs in zip(self.le, other.le)]
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return (low + high - 1) / 2
+        return bucket_bounds(max(self.counts))[0]
+
+    def cumulative(self, bounds):
+        # Values <= each bound. Other bounds than the histogram's own only
+        # count HDR buckets that lie entirely at or below the bound.
+        if tuple(bounds) == self.bounds:
+            result, seen = [], 0
+            for count in self.le:
+                seen += count
+                result.append(seen)
+            return result
+        indexes = sorted(self.counts)
+        result, seen, position = [], 0, 0
+        for bound in bounds:
+            while position < len(indexes) and bucket_bounds(indexes[position])[1] - 1 <= bound:
+                seen += self.counts[indexes[position]]
+                position += 1
+            result.append(seen)
+        return result
+
+    def to_dict(self):
+        return {'counts': self.counts, 'count': self.count, 'total': self.total, 'bounds': self.bounds, 'le': self.le}
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = {int(index): count for index, count in data['counts'].items()}
+        return cls(counts, data['count'], data['total'], data.get('bounds', ()), data.get('le'))
+
+class Recorder:
+    # Each thread records into its own shard, so the request path never takes
+    # a lock; shards are only merged when a snapshot is taken.
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, metric, view, value):
+        shard = self._shard()
+        histogram = shard.get((metric, view))
+        if histogram is None:
+            histogram = shard[(metric, view)] = Histogram(bounds=RAW_BOUNDS.get(metric, ()))
+        histogram.record(value)
+
+    def snapshot(self):
+        merged = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, histogram in list(shard.items()):
+                merged.setdefault(key, Histogram()).merge(histogram)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._shards = []
+            self._local = threading.local()
+
+class FileStore:
+    # Every worker writes its own snapshot to <dir>/<pid>.json and a scrape
+    # merges them all. Files of exited workers are kept so counters never go
+    # backwards; gunicorn.conf.py clears the directory when the master starts.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, snapshot):
+        data = [[metric, view, histogram.to_dict()] for (metric, view), histogram in snapshot.items()]
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def read(self):
+        merged = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric, view, histogram in data:
+                merged.setdefault((metric, view), Histogram()).merge(Histogram.from_dict(histogram))
+        return merged
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(self.directory, name))
+
+recorder = Recorder()
+_store = None
+_flusher = None
+_flusher_lock = threading.Lock()
+_request_timings = ContextVar('perf_request_timings', default=None)
+
+def get_store():
+    global _store
+    directory = settings.PERF_METRICS_DIR
+    if not directory:
+        return None
+    if _store is None or _store.directory != directory:
+        _store = FileStore(directory)
+    return _store
+
+def flush():
+    store = get_store()
+    if store is not None:
+        store.write(recorder.snapshot())
+
+def _flush_loop():
+    written = None
+    while True:
+        time.sleep(settings.PERF_FLUSH_INTERVAL)
+        # Shard sizes only grow, so an unchanged total means nothing to write.
+        recorded = sum(histogram.count for histogram in recorder.snapshot().values())
+        if recorded != written:
+            try:
+                flush()
+                written = recorded
+            except OSError:
+                pass
+
+def start_flusher():
+    # One daemon thread per worker, started by its first request (never in
+    # a preloading master), publishes the worker's snapshot to the store.
+    global _flusher
+    if (_flusher is not None and _flusher.is_alive()) or get_store() is None:
+        return
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name='perf-flusher', daemon=True)
+            _flusher.start()
+
+def collect():
+    store = get_store()
+    if store is None:
+        return recorder.snapshot()
+    flush()
+    return store.read()
+
+def timed(kind):
+    # Adds the call's wall time to the current request's `kind` total; a
+    # no-op outside a request.
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                timings = _request_timings.get()
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    if timings is not None:
+                        timings[kind] += time.perf_counter() - started
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _request_timings.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[kind] += time.perf_counter() - started
+        return wrapper
+    return decorator
+
+def _count_query(execute, sql, params, many, context):
+    timings = _request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings['db'] += time.perf_counter() - started
+        timings['queries'] += 1
+
+def _install_query_counter(connection, **kwargs):
+    # First in line, so execute_wrapper() blocks entered earlier still pop
+    # their own wrapper.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_query)
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # An async view's queries run on sync_to_async threads with their own
+        # connections, so the counter sits on every connection and finds the
+        # request's timings through the ContextVar.
+        connection_created.connect(_install_query_counter, dispatch_uid='perf-query-counter')
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.PERF_METRICS_ENABLED:
+            return self.get_response(request)
+
+        timings = {'db': 0.0, 'queries': 0, 'cloud': 0.0}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_timings.reset(token)
+        self._record(request, timings, elapsed)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.PERF_METRICS_ENABLED:
+            return await self.get_response(request)
+
+        timings = {'db': 0.0, 'queries': 0, 'cloud': 0.0}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_timings.reset(token)
+        self._record(request, timings, elapsed)
+        return response
+
+    def _record(self, request, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        recorder.record('request_duration_seconds', view, elapsed * 1e6)
+        recorder.record('request_db_duration_seconds', view, timings['db'] * 1e6)
+        recorder.record('request_db_queries', view, timings['queries'])
+        recorder.record('request_cloud_duration_seconds', view, timings['cloud'] * 1e6)
+        start_flusher()
+
+def _format(value):
+    return f'{value:.6g}' if isinstance(value, float) else str(value)
+
+def render_prometheus(snapshot):
+    lines = []
+    for metric, (help_text, scale, bounds) in METRICS.items():
+        name = PREFIX + metric
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        views = sorted(view for key_metric, view in snapshot if key_metric == metric)
+        for view in views:
+            histogram = snapshot[(metric, view)]
+            label = f'view="{view}"'
+            for bound, count in zip(bounds, histogram.cumulative(RAW_BOUNDS[metric])):
+                lines.append(f'{name}_bucket{{{label},le="{_format(float(bound))}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}}} {_format(histogram.total * scale)}')
+            lines.append(f'{name}_count{{{label}}} {histogram.count}')
+
+    # High-resolution quantiles straight from the HDR buckets.
+    name = PREFIX + 'request_latency_quantile_seconds'
+    lines += [f'# HELP {name} Request wall time quantiles', f'# TYPE {name} gauge']
+    for (metric, view), histogram in sorted(snapshot.items()):
+        if metric != 'request_duration_seconds':
+            continue
+        for q in QUANTILES:
+            lines.append(f'{name}{{view="{view}",quantile="{q}"}} {_format(histogram.quantile(q) * 1e-6)}')
+    return '\n'.join(lines) + '\n'
+
+def metrics_view(request):
+    # Scrapers send PERF_METRICS_TOKEN as a bearer token; without one set,
+    # only staff may read per-view traffic and latency.
+    token = settings.PERF_METRICS_TOKEN
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = getattr(request.user, 'is_staff', False)
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,249 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+FORMATS = {'collapsed': '.collapsed.txt', 'speedscope': '.speedscope.json'}
+
+_active = ContextVar('profile_session', default=None)
+
+def _short_path(filename):
+    # Project files relative to BASE_DIR, libraries relative to site-packages.
+    roots = [str(settings.BASE_DIR)] + sorted(sys.path, key=len, reverse=True)
+    for root in roots:
+        if root and filename.startswith(root.rstrip(os.sep) + os.sep):
+            return filename[len(root.rstrip(os.sep)) + 1:]
+    return filename
+
+def _depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+class Profile:
+    # Samples the request's thread, plus any other thread while it is inside
+    # one of this request's spans (cloud calls on the I/O pool, an async
+    # view's event loop), from a background thread via sys._current_frames.
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.filename = None
+        # (thread, stack) -> microseconds; each sample is weighted by the time
+        # since the previous one, since the GIL can delay the sampler.
+        self.samples = Counter()
+        self.thread_names = {}
+        self.root = threading.get_ident()
+        self._threads = {self.root: []}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+    def enter(self, name, depth):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.setdefault(ident, []).append((depth, f'[{name}]'))
+
+    def exit(self):
+        ident = threading.get_ident()
+        with self._lock:
+            spans = self._threads[ident]
+            spans.pop()
+            if not spans and ident != self.root:
+                del self._threads[ident]
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            weight, last = round((now - last) * 1e6), now
+            with self._lock:
+                threads = [(ident, list(spans)) for ident, spans in self._threads.items()]
+            for ident, spans in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                # A span entered at depth d sits right below frame d.
+                for depth, label in reversed(spans):
+                    stack.insert(min(depth, len(stack)), label)
+                self.samples[(ident, tuple(stack))] += weight
+
+    def collapsed(self):
+        # Brendan Gregg's folded format, weighted in microseconds.
+        stacks = Counter()
+        for (ident, stack), weight in self.samples.items():
+            stacks[stack] += weight
+        return ''.join(f"{';'.join(stack)} {weight}\n" for stack, weight in stacks.most_common())
+
+    def speedscope(self):
+        # One sampled profile per thread, sharing a frame table.
+        frames, index, profiles = [], {}, {}
+        for (ident, stack), weight in sorted(self.samples.items(), key=lambda item: item[0][0] != self.root):
+            row = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    name, _, location = label.partition(' (')
+                    file, _, line = location.rstrip(')').rpartition(':')
+                    frames.append({'name': name, 'file': file, 'line': int(line)} if file else {'name': label})
+                row.append(index[label])
+            profile = profiles.setdefault(ident, {
+                'type': 'sampled', 'name': self.thread_names.get(ident, str(ident)), 'unit': 'seconds',
+                'startValue': 0, 'endValue': 0, 'samples': [], 'weights': [],
+            })
+            profile['samples'].append(row)
+            profile['weights'].append(weight / 1e6)
+            profile['endValue'] += weight / 1e6
+        return json.dumps({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'exporter': 'energy-platform',
+            'name': self.name,
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': list(profiles.values()),
+        })
+
+    def write(self, directory, fmt):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^\w.-]+', '_', self.name).strip('_') or 'root'
+        filename = f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}{FORMATS[fmt]}"
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write(self.speedscope() if fmt == 'speedscope' else self.collapsed())
+        return filename
+
+class span:
+    # Labels a block in the active profile; a ContextVar lookup otherwise.
+    __slots__ = ('name', 'profile')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = _active.get()
+        if self.profile is not None:
+            self.profile.enter(self.name, _depth(sys._getframe(1)))
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.exit()
+
+def traced(name, func):
+    # Carries the active profile into a pool thread and labels the call;
+    # returns func untouched when nothing is being profiled.
+    profile = _active.get()
+    if profile is None:
+        return func
+
+    def run(*args, **kwargs):
+        token = _active.set(profile)
+        try:
+            with span(name):
+                return func(*args, **kwargs)
+        finally:
+            _active.reset(token)
+    return run
+
+@contextmanager
+def capture(name):
+    # Profiles the block and writes the result to PROFILE_DIR; the file name
+    # is left on profile.filename.
+    profile = Profile(name, settings.PROFILE_INTERVAL)
+
+    def db_span(execute, sql, params, many, context):
+        with span('db'):
+            return execute(sql, params, many, context)
+
+    token = _active.set(profile)
+    profile.start()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(db_span))
+            yield profile
+    finally:
+        profile.stop()
+        _active.reset(token)
+    profile.filename = profile.write(settings.PROFILE_DIR, settings.PROFILE_FORMAT)
+
+class ProfilingMiddleware:
+    # Profiles PROFILE_SAMPLE_RATE of requests, and any request from an admin
+    # that carries the PROFILE_HEADER header. Must come after
+    # AuthenticationMiddleware.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.PROFILE_HEADER.upper().replace('-', '_')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        rate = settings.PROFILE_SAMPLE_RATE
+        return bool(rate) and random.random() < rate
+
+    def _is_admin(self, request):
+        return getattr(request.user, 'is_admin', False)
+
+    def _name(self, profile, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            profile.name = match.view_name
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not (self._sampled() or (self.header in request.META and self._is_admin(request))):
+            return self.get_response(request)
+
+        with capture(request.path) as profile:
+            response = self.get_response(request)
+            self._name(profile, request)
+        response['X-Profile'] = profile.filename
+        return response
+
+    async def __acall__(self, request):
+        # request.user loads lazily through the sync ORM, so it is only
+        # touched, on a thread, when the header asks for a profile.
+        if not (self._sampled() or (self.header in request.META and await sync_to_async(self._is_admin)(request))):
+            return await self.get_response(request)
+
+        with capture(request.path) as profile:
+            response = await self.get_response(request)
+            self._name(profile, request)
+        response['X-Profile'] = profile.filename
+        return response
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,11 +45,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'energy_platform.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'energy_platform.db_routing.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'energy_platform.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,13 +80,170 @@ WSGI_APPLICATION = 'energy_platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql switches to PostgreSQL. Connections persist for
+# CONN_MAX_AGE; behind PgBouncer in transaction mode set POSTGRES_PGBOUNCER=True.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+CONN_MAX_AGE = int(os.getenv('CONN_MAX_AGE', '600'))
+
+# SQLITE_TUNED=False falls back to the stock backend (rollback journal,
+# deferred transactions) for comparison.
+SQLITE_TUNED = os.getenv('SQLITE_TUNED', 'True').lower() == 'true'
+
+if DB_ENGINE == 'postgresql':
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', 'energy_platform'),
+        'USER': os.getenv('POSTGRES_USER', 'energy'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('POSTGRES_PGBOUNCER', 'False').lower() == 'true',
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('POSTGRES_CONNECT_TIMEOUT', '5')),
+        },
     }
+    REPLICA_HOSTS = os.getenv('POSTGRES_REPLICA_HOSTS', '')
+    replica_settings = [{'HOST': host.strip()} for host in REPLICA_HOSTS.split(',') if host.strip()]
+else:
+    PRIMARY_DATABASE = {
+        'ENGINE': 'energy_platform.sqlite' if SQLITE_TUNED else 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')) / 1000,
+        },
+    }
+    if SQLITE_TUNED:
+        PRIMARY_DATABASE['OPTIONS'].update({
+            'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            'pragmas': {
+                'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+                'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-64000')),
+                'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', '268435456')),
+            },
+        })
+    # Local stand-in for replicas: copies kept fresh by `manage.py sync_sqlite_replica`.
+    REPLICA_PATHS = os.getenv('SQLITE_REPLICA_PATHS', '')
+    replica_settings = [{'NAME': path.strip()} for path in REPLICA_PATHS.split(',') if path.strip()]
+
+DATABASES = {'default': PRIMARY_DATABASE}
+for index, overrides in enumerate(replica_settings):
+    DATABASES[f'replica_{index}'] = dict(PRIMARY_DATABASE, TEST={'MIRROR': 'default'}, **overrides)
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['energy_platform.db_routing.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'energy-platform',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+    'db': {
+        # Requires: python manage.py createcachetable
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'django_cache'),
+    },
+    'redis': {
+        # Requires: pip install redis
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+    },
+    'memcached': {
+        # Requires: pip install pymemcache
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    },
 }
 
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+# locmem lives in one process: a version bump in one gunicorn worker is not
+# seen by the others, so version-keyed caches default to off with it.
+SHARED_CACHE = CACHE_BACKEND != 'locmem'
+
+DASHBOARD_CACHE_ENABLED = os.getenv('DASHBOARD_CACHE_ENABLED', str(SHARED_CACHE)).lower() == 'true'
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+
+# 'immediate' settles each trade in its own transaction; 'batch' queues a
+# TradeIntent for `manage.py settle_trades`.
+TRADE_SETTLEMENT_MODE = os.getenv('TRADE_SETTLEMENT_MODE', 'immediate')
+
+# Per-view latency, DB and cloud time histograms, served at /metrics. Set
+# PERF_METRICS_DIR to a directory shared by all workers to merge them.
+PERF_METRICS_ENABLED = os.getenv('PERF_METRICS_ENABLED', 'True').lower() == 'true'
+PERF_METRICS_DIR = os.getenv('PERF_METRICS_DIR', '')
+PERF_FLUSH_INTERVAL = float(os.getenv('PERF_FLUSH_INTERVAL', '1'))
+PERF_METRICS_TOKEN = os.getenv('PERF_METRICS_TOKEN', '')
+
+# Sampling profiler for a fraction of requests, or for an admin's request
+# carrying the PROFILE_HEADER header. Profiles are written to PROFILE_DIR as
+# speedscope JSON or collapsed stacks and named in the X-Profile response header.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', 'X-Profile')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'energy-platform-profiles'))
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'speedscope')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.001'))
+
+# Serve the dashboard and trade pages as coroutines. asgi.py turns this on;
+# under WSGI each async view would need an event loop per request.
+ENERGY_ASYNC_VIEWS = os.getenv('ENERGY_ASYNC_VIEWS', 'False').lower() == 'true'
+
+
+# Login and session performance. PERFORMANCE_PROFILE=fast switches the
+# defaults to cached_db sessions, a cached request.user and tuned Argon2;
+# each can still be set on its own.
+PERFORMANCE_PROFILE = os.getenv('PERFORMANCE_PROFILE', 'default')
+FAST_PROFILE = PERFORMANCE_PROFILE == 'fast'
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_BACKEND', 'cached_db' if FAST_PROFILE else 'db')]
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend']
+# Seconds to keep the authenticated EnergyUser in the cache; 0 reads it
+# from the database on every request.
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '300' if FAST_PROFILE else '0'))
+
+# A per-process cache would keep serving a user or session that another
+# worker logged out, deactivated or changed the password of.
+if not SHARED_CACHE and (AUTH_USER_CACHE_TIMEOUT or SESSION_ENGINE == SESSION_ENGINES['cached_db']):
+    raise ImproperlyConfigured(
+        'Cached sessions and AUTH_USER_CACHE_TIMEOUT (PERFORMANCE_PROFILE=fast) need a shared '
+        'CACHE_BACKEND: file, db, redis or memcached'
+    )
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'accounts.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# The first hasher hashes new passwords; the others still verify old hashes,
+# which are upgraded at their next login.
+if os.getenv('PASSWORD_HASHER', 'argon2' if FAST_PROFILE else 'pbkdf2') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(2))
+# OWASP's minimum for Argon2id: 19 MiB, 2 passes, 1 lane.
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,92 @@
+import fcntl
+import time
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+# Production profile for SQLite. WAL lets readers run alongside the single
+# writer, and synchronous=NORMAL fsyncs on checkpoint instead of every commit.
+# busy_timeout makes a blocked writer wait rather than fail.
+PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = dict(PRAGMA_DEFAULTS, **params.pop('pragmas', {}))
+        self.transaction_mode = params.pop('transaction_mode', 'IMMEDIATE').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}")
+        self.writer_lock_path = params.pop('writer_lock', None)
+        if self.writer_lock_path is None and not self.is_in_memory_db():
+            self.writer_lock_path = f"{self.settings_dict['NAME']}.writer-lock"
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE takes the write lock when the atomic block opens, so
+        # a read lock never has to be upgraded mid-transaction. Those blocks
+        # first queue on a flock shared by every process, retried with
+        # backoff for up to busy_timeout. DEFERRED blocks only take the write
+        # lock at their first write and wait on busy_timeout alone.
+        if self.transaction_mode != 'DEFERRED':
+            self._acquire_writer_lock()
+        try:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        except Exception:
+            self._release_writer_lock()
+            raise
+
+    def _acquire_writer_lock(self):
+        if not self.writer_lock_path:
+            return
+        if getattr(self, '_writer_lock', None) is None:
+            self._writer_lock = open(self.writer_lock_path, 'a+b')
+        deadline = time.monotonic() + int(self.pragmas['busy_timeout']) / 1000
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._writer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError('database is locked')
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.05)
+
+    def _release_writer_lock(self):
+        if getattr(self, '_writer_lock', None) is not None:
+            fcntl.flock(self._writer_lock, fcntl.LOCK_UN)
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_writer_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_writer_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            if getattr(self, '_writer_lock', None) is not None:
+                self._writer_lock.close()
+                self._writer_lock = None
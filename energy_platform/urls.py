@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
+from energy_platform.perf import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('energy/', include('energy.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path('', lambda request: redirect('accounts:login')),
 ]
@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+bind = '127.0.0.1:8000'
+workers = 3
+# Load the app once in the master and fork workers from it, so Django and
+# the AWS/report libraries are shared copy-on-write instead of per worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+# Workers publish request histograms here and /metrics merges them.
+os.environ.setdefault('PERF_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'energy-platform-metrics'))
+
+
+def when_ready(server):
+    from energy_platform.perf import FileStore
+    FileStore(os.environ['PERF_METRICS_DIR']).clear()
+    if not preload_app:
+        return
+    from django.db import connections
+    from energy.cloud_services import preload_modules
+    preload_modules()
+    # Workers must open their own connections, never inherit the master's.
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    from energy.cloud_services import cloud_manager
+    from energy_platform import perf
+    cloud_manager.flush_buffers()
+    perf.flush()